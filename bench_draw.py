@@ -0,0 +1,64 @@
+"""
+Замер движка жеребьёвки (draw_engine): время стратегий и равномерность.
+
+    время — жеребьёвка n участников каждой стратегией, без ограничений
+            и с командами по --team-size человек (запрет дарить своим);
+    χ²    — частоты всех перестановок на n = 4 и 5 участниках.
+
+Запуск:
+    python bench_draw.py
+    python bench_draw.py --sizes 1000 100000 1000000 --seed 2025 --samples 90000
+"""
+import argparse
+import time
+
+import draw_engine
+from draw_engine import Constraints
+
+# Исходов при n=4: циклов (n-1)! = 6, беспорядков D(4) = 9; для n=5 — 24 и 44.
+# При равномерном распределении χ² в среднем равна df = исходов - 1
+UNIFORMITY_SIZES = (4, 5)
+
+
+def team_constraints(n, team_size):
+    """Участники 0..n-1, разбитые на команды по team_size человек."""
+    constraints = Constraints()
+    for player in range(n):
+        constraints.set_team(player, player // team_size + 1)
+    return constraints
+
+
+def time_draw(n, strategy, seed, constraints=None):
+    participants = list(range(n))
+    started = time.perf_counter()
+    assignment = draw_engine.draw(participants, strategy, seed, constraints)
+    seconds = time.perf_counter() - started
+    assert draw_engine.is_valid_assignment(participants, assignment, constraints)
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1_000, 10_000, 100_000, 1_000_000])
+    parser.add_argument('--seed', type=int, default=2025)
+    parser.add_argument('--team-size', type=int, default=5)
+    parser.add_argument('--samples', type=int, default=90_000)
+    args = parser.parse_args()
+
+    print(f"⏱️ Время жеребьёвки (seed={args.seed}, команды по {args.team_size}):")
+    print(f"  {'стратегия':<12} {'n':>9} {'без ограничений':>16} {'с командами':>13}")
+    for n in args.sizes:
+        for name in draw_engine.STRATEGIES:
+            plain = time_draw(n, name, args.seed)
+            teams = time_draw(n, name, args.seed, team_constraints(n, args.team_size))
+            print(f"  {name:<12} {n:>9} {plain * 1000:13.2f} мс {teams * 1000:10.2f} мс")
+
+    print(f"📊 Равномерность (χ², {args.samples} жеребьёвок):")
+    for name in draw_engine.STRATEGIES:
+        for n in UNIFORMITY_SIZES:
+            outcomes, chi_square = draw_engine.uniformity(name, n, args.samples, args.seed)
+            print(f"  {name:<12} n={n}: исходов {outcomes}, χ² = {chi_square:.1f} (df = {outcomes - 1})")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""
+Нагрузочный замер профилей SQLite (DB_SQLITE_PROFILE): default против performance.
+
+База — временный secret_santa.db с N игроками и проведённой жеребьёвкой.
+Каждая операция — отдельная единица работы, как обработчик бота:
+    register = add_player + get_player
+    status   = get_player + get_santa_pair + get_receiver_wishlist
+Потоки выполняют смесь операций с заданной долей записей.
+
+Запуск:
+    python bench_sqlite_profile.py
+    python bench_sqlite_profile.py --players 2000 --threads 8 32 --writes 0.2 1.0 --seconds 5
+
+--no-pair-index выключает индекс пар (DB_PAIR_INDEX_TTL=0): add_player сбрасывает
+его, и при смеси с записями чтения иначе меряют в основном перестройку индекса.
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+
+import settings
+from database import Database
+
+PROFILES = ('default', 'performance')
+POSTGRES_VARIABLES = ('DATABASE_URL', 'RAILWAY_DATABASE_URL', 'POSTGRESQL_URL',
+                      'PG_CONNECTION_STRING', 'NEON_DATABASE_URL', 'DB_HOST', 'RAILWAY_ENVIRONMENT')
+
+
+@contextlib.contextmanager
+def quiet():
+    """Методы Database печатают и логируют каждое действие — в замере это только шум."""
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def open_database(profile, players, directory):
+    """Новая база профиля profile с players игроками и жеребьёвкой 2025 года."""
+    for name in POSTGRES_VARIABLES:
+        os.environ.pop(name, None)
+    os.environ['DB_SQLITE_PROFILE'] = profile
+    os.chdir(directory)
+    settings.store = settings.SettingsStore()
+    with quiet():
+        db = Database()
+        db.init_db()
+        settings.configure(db)
+        with db.unit_of_work():
+            for user_id in range(1, players + 1):
+                db.add_player(user_id, f'user{user_id}', f'Игрок {user_id}', wish_list='книга')
+        db.perform_draw(2025, seed=2025)
+    return db
+
+
+def run(db, threads, writes, seconds, players):
+    """Смесь операций в threads потоках: (операций в секунду, p99 в мс, ошибок)."""
+    deadline = time.perf_counter() + seconds
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def worker(seed):
+        rng = random.Random(seed)
+        local = []
+        failed = 0
+        while time.perf_counter() < deadline:
+            user_id = rng.randint(1, players)
+            started = time.perf_counter()
+            try:
+                with db.unit_of_work():
+                    if rng.random() < writes:
+                        ok = db.add_player(user_id, f'user{user_id}', f'Игрок {user_id}', wish_list='носки')
+                        ok = ok and db.get_player(user_id) is not None
+                    else:
+                        ok = db.get_player(user_id) is not None
+                        db.get_santa_pair(user_id, 2025)
+                        db.get_receiver_wishlist(user_id, 2025)
+                if not ok:
+                    failed += 1
+            except Exception:
+                failed += 1
+            local.append(time.perf_counter() - started)
+        db.release_thread_connections()
+        with lock:
+            latencies.extend(local)
+            errors.append(failed)
+
+    workers = [threading.Thread(target=worker, args=(seed,)) for seed in range(threads)]
+    started = time.perf_counter()
+    with quiet():
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0.0
+    return len(latencies) / elapsed, p99, sum(errors)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=2000)
+    parser.add_argument('--threads', type=int, nargs='+', default=[8, 32])
+    parser.add_argument('--writes', type=float, nargs='+', default=[0.2, 1.0])
+    parser.add_argument('--seconds', type=float, default=5.0)
+    parser.add_argument('--no-pair-index', action='store_true')
+    args = parser.parse_args()
+    if args.no_pair_index:
+        os.environ['DB_PAIR_INDEX_TTL'] = '0'
+
+    cwd = os.getcwd()
+    print(f"⏱️ {args.players} игроков, {args.seconds:g} с на замер")
+    print(f"  {'профиль':<12} {'потоков':>7} {'записей':>7} {'оп/с':>10} {'p99, мс':>9} {'ошибок':>7}")
+    for profile in PROFILES:
+        with tempfile.TemporaryDirectory() as directory:
+            db = open_database(profile, args.players, directory)
+            try:
+                for threads in args.threads:
+                    for writes in args.writes:
+                        rate, p99, errors = run(db, threads, writes, args.seconds, args.players)
+                        print(f"  {profile:<12} {threads:>7} {writes:>7.0%} {rate:>10,.0f} {p99:>9.1f} {errors:>7}")
+            finally:
+                with quiet():
+                    db.close()
+                os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+"""
+Замер /status: прежний путь (get_player + get_assignment_card + get_receiver_pair)
+против get_player_dashboard — с выключенными, холодными и тёплыми кэшами.
+
+База — временный secret_santa.db (SQLite) с N игроками и жеребьёвкой 2025 года.
+Время — среднее на один /status, лучшее из --repeat прогонов по всем игрокам.
+
+Запуск:
+    python bench_status.py
+    python bench_status.py --players 1000 --repeat 5
+"""
+import argparse
+import contextlib
+import io
+import logging
+import os
+import tempfile
+import time
+
+import settings
+from database import Database
+
+YEAR = 2025
+POSTGRES_VARIABLES = ('DATABASE_URL', 'RAILWAY_DATABASE_URL', 'POSTGRESQL_URL',
+                      'PG_CONNECTION_STRING', 'NEON_DATABASE_URL', 'DB_HOST', 'RAILWAY_ENVIRONMENT')
+
+
+@contextlib.contextmanager
+def quiet():
+    """Методы Database печатают и логируют каждое действие — в замере это только шум."""
+    logging.disable(logging.CRITICAL)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+    finally:
+        logging.disable(logging.NOTSET)
+
+
+def open_database(players, **env):
+    """Database на secret_santa.db текущей папки; при players — с игроками и жеребьёвкой."""
+    for name in POSTGRES_VARIABLES:
+        os.environ.pop(name, None)
+    os.environ.update(env)
+    try:
+        db = Database()
+        db.init_db()
+        settings.configure(db)
+        if players:
+            with db.unit_of_work():
+                for user_id in range(1, players + 1):
+                    db.add_player(user_id, f'user{user_id}', f'Игрок {user_id}', wish_list='книга')
+            db.perform_draw(YEAR, seed=YEAR)
+        return db
+    finally:
+        for name in env:
+            os.environ.pop(name, None)
+
+
+def previous_status(db, user_id):
+    """Обращения к БД прежнего status_command."""
+    db.get_player(user_id)
+    db.get_assignment_card(user_id, YEAR)
+    db.get_receiver_pair(user_id, YEAR)
+
+
+def dashboard_status(db, user_id):
+    db.get_player_dashboard(user_id, YEAR)
+
+
+def measure(db, status, user_ids, repeat, cold=False):
+    """
+    Лучшее из repeat среднее время одного /status в мкс; cold — сброс кэшей перед каждым.
+    Иначе кэши сначала прогреваются: dashboard сам индекс пар не строит,
+    в боте его загружают другие обработчики.
+    """
+    if not cold:
+        db.load_pair_index(YEAR)
+        for user_id in user_ids:
+            status(db, user_id)
+    best = None
+    for _ in range(repeat):
+        elapsed = 0.0
+        for user_id in user_ids:
+            if cold:
+                db.player_cache.clear()
+                db.pair_cache.clear()
+            started = time.perf_counter()
+            status(db, user_id)
+            elapsed += time.perf_counter() - started
+        average = elapsed / len(user_ids) * 1_000_000
+        best = average if best is None else min(best, average)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--players', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--cold-sample', type=int, default=50,
+                        help='игроков в замерах прежнего пути с холодными кэшами (каждый раз строится индекс пар)')
+    args = parser.parse_args()
+
+    cwd = os.getcwd()
+    user_ids = list(range(1, args.players + 1))
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)
+        settings.store = settings.SettingsStore()
+        try:
+            with quiet():
+                db = open_database(args.players)
+                # Та же база без кэша игроков и индекса пар
+                uncached = open_database(0, DB_PLAYER_CACHE_SIZE='0', DB_PAIR_INDEX_TTL='0')
+                settings.configure(db)
+                results = [
+                    ('прежний путь, кэши выключены', measure(uncached, previous_status, user_ids, args.repeat)),
+                    ('прежний путь, холодные кэши',
+                     measure(db, previous_status, user_ids[:args.cold_sample], args.repeat, cold=True)),
+                    ('прежний путь, тёплые кэши', measure(db, previous_status, user_ids, args.repeat)),
+                    ('dashboard, кэши выключены', measure(uncached, dashboard_status, user_ids, args.repeat)),
+                    ('dashboard, холодные кэши', measure(db, dashboard_status, user_ids, args.repeat, cold=True)),
+                    ('dashboard, тёплые кэши', measure(db, dashboard_status, user_ids, args.repeat)),
+                ]
+                uncached.close()
+                db.close()
+        finally:
+            os.chdir(cwd)
+
+    print(f"⏱️ /status, {args.players} игроков, лучшее из {args.repeat}:")
+    for name, microseconds in results:
+        print(f"  {name:<32} {microseconds:10.1f} мкс")
+
+
+if __name__ == '__main__':
+    main()
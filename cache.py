@@ -0,0 +1,159 @@
+"""
+Кэш в памяти процесса для редко меняющихся строк БД.
+
+LRU с ограниченным размером и временем жизни записей (TTL).
+Потокобезопасен: обработчики бота работают в нескольких потоках.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+# Отличает «нет в кэше» от закэшированного None
+MISSING = object()
+
+
+class LRUCache:
+    """LRU-кэш с TTL и счётчиками попаданий/промахов."""
+
+    def __init__(self, max_size=1024, ttl=60.0, clock=time.monotonic):
+        if max_size < 0 or ttl < 0:
+            raise ValueError(f"Некорректные параметры кэша: max_size={max_size}, ttl={ttl}")
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self._clock = clock
+        self._data = OrderedDict()  # ключ → (значение, момент истечения)
+        self._generation = 0  # растёт при каждом сбросе
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'stale_hits': 0,
+        }
+
+    @property
+    def enabled(self):
+        return self.max_size > 0 and self.ttl > 0
+
+    @property
+    def generation(self):
+        """Номер поколения: запоминается перед чтением из БД и передаётся в set()."""
+        return self._generation
+
+    def get(self, key):
+        """Значение из кэша или MISSING."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._stats['misses'] += 1
+                return MISSING
+
+            value, expires_at = entry
+            if expires_at <= self._clock():
+                # Запись не удаляется: пригодится get_stale, пока БД недоступна;
+                # место она не занимает дольше, чем до вытеснения по LRU
+                self._stats['expirations'] += 1
+                self._stats['misses'] += 1
+                return MISSING
+
+            self._data.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def get_stale(self, key):
+        """
+        Значение, даже если его TTL истёк (MISSING, если его нет или оно сброшено).
+        Для работы при недоступной БД: старые данные лучше, чем никаких.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return MISSING
+            self._stats['stale_hits'] += 1
+            return entry[0]
+
+    def set(self, key, value, generation=None):
+        """
+        Положить значение в кэш. Если передан generation и с тех пор был
+        сброс, значение могло устареть ещё во время чтения — не кладём.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return
+            self._data[key] = (value, self._clock() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            if self._data.pop(key, None) is not None:
+                self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._stats['invalidations'] += len(self._data)
+            self._data.clear()
+
+    def get_stats(self):
+        """Снимок статистики кэша."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._data)
+        stats['max_size'] = self.max_size
+        stats['ttl'] = self.ttl
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else 0.0
+        return stats
+
+
+class PairIndex:
+    """
+    Все пары одного года в памяти: Санта → получатель, получатель → Санта,
+    имена участников и битовая маска раскрытий по получателям.
+    Строится одним запросом и дальше отвечает за O(1) без обращений к БД.
+    Изменения пар не вносятся в индекс, а сбрасывают его целиком.
+    """
+
+    __slots__ = ('year', '_receiver_of', '_santa_of', '_names', '_slot', '_revealed')
+
+    def __init__(self, year, pairs):
+        self.year = year
+        self._receiver_of = {}
+        self._santa_of = {}
+        self._names = {}
+        self._slot = {}  # получатель → номер бита в _revealed
+        self._revealed = bytearray((len(pairs) + 7) // 8)
+
+        for i, pair in enumerate(pairs):
+            self._receiver_of[pair.santa_user_id] = pair.receiver_user_id
+            self._santa_of[pair.receiver_user_id] = pair.santa_user_id
+            self._names[pair.santa_user_id] = pair.santa_name
+            self._names[pair.receiver_user_id] = pair.receiver_name
+            self._slot[pair.receiver_user_id] = i
+            if pair.revealed:
+                self._revealed[i >> 3] |= 1 << (i & 7)
+
+    def __len__(self):
+        return len(self._receiver_of)
+
+    def receiver_of(self, santa_user_id):
+        return self._receiver_of.get(santa_user_id)
+
+    def santa_of(self, receiver_user_id):
+        return self._santa_of.get(receiver_user_id)
+
+    def name(self, user_id):
+        return self._names.get(user_id)
+
+    def is_revealed(self, receiver_user_id):
+        i = self._slot.get(receiver_user_id)
+        return i is not None and bool(self._revealed[i >> 3] & (1 << (i & 7)))
@@ -0,0 +1,66 @@
+"""
+Карточки назначения: готовый текст для Санты о его подопечном.
+
+Карточка рендерится один раз — при жеребьёвке — и хранится в таблице
+assignment_cards вместе со снимком имени и пожеланий получателя.
+Рассылка, /status и напоминания читают её одной строкой по ключу
+(santa_user_id, year), а при изменении пожеланий или настроек игры
+(даты, бюджет) карточки перерисовываются.
+"""
+import settings
+from settings import format_day
+
+
+def render_assignment_card(santa_name, receiver_name, wish_list):
+    """Текст уведомления Санте после жеребьёвки (Markdown); даты и бюджет — из настроек игры."""
+    santa_name = santa_name or "Тайный Санта"
+    game = settings.current()
+    return f"""
+🎅 *Дорогой {santa_name}!*
+
+Жеребьёвка проведена!
+
+*Твой подопечный:* {receiver_name}
+
+🎁 *Информация о подопечном:*
+{f"📝 *Пожелания:* {wish_list}" if wish_list else "📝 *Пожелания не указаны*"}
+
+📅 *Напоминание о датах:*
+• Дедлайн для подарков: до {format_day(game.gift_deadline)}
+• Раскрытие Сант: {format_day(game.reveal_date)}
+
+💰 *Бюджет подарка:* {game.gift_budget}
+
+*Совет:* Прояви креативность! Узнай предпочтения получателя через друзей.
+
+Удачи в подготовке сюрприза! 🎁
+"""
+
+
+def render_reminder(card):
+    """Короткое напоминание Санте по уже сохранённой карточке."""
+    santa_name = card.santa_name or "Тайный Санта"
+    wish_list = card.wish_list
+    game = settings.current()
+    return f"""
+🎅 *Дорогой {santa_name}!*
+
+Напоминаю, твой подопечный в игре "Тайный Санта":
+
+*Имя:* {card.receiver_name}
+{f"*Пожелания:* {wish_list}" if wish_list else "*Пожелания:* не указаны"}
+
+📅 *Дедлайн для подарка:* до {format_day(game.gift_deadline)}
+🎁 *Бюджет:* {game.gift_budget}
+
+Подготовь креативный подарок! 🎄
+"""
+
+
+def build_card_row(santa_user_id, year, receiver_user_id, santa_name, receiver_name, wish_list):
+    """Строка для вставки в assignment_cards (порядок колонок запроса upsert_cards)."""
+    wish_list = wish_list or ''
+    return (
+        santa_user_id, year, receiver_user_id, santa_name, receiver_name, wish_list,
+        render_assignment_card(santa_name, receiver_name, wish_list),
+    )
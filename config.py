@@ -67,6 +67,10 @@ REVEAL_YEAR = 2025
 REVEAL_MONTH = 12
 REVEAL_DAY = 31
 
+# Правила жеребьёвки (значения по умолчанию, меняются в админке)
+DRAW_NO_REPEAT_YEARS = 1      # не повторять пары стольких прошлых лет
+DRAW_SEPARATE_TEAMS = True    # игроки одной команды не дарят друг другу
+
 print(f"📅 Даты:")
 print(f"   Жеребьёвка: {DRAW_DAY}.{DRAW_MONTH}.{DRAW_YEAR}")
 print(f"   Раскрытие: {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}")
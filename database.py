@@ -1,19 +1,701 @@
 import os
 import sys
-import logging
 import random
+import time
+import logging
+import threading
+import itertools
+import json
+import re
+import weakref
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, List, Tuple, Dict, Any
 
+from cache import LRUCache, PairIndex, MISSING
+from cards import build_card_row
+import draw_engine
+import settings
+from draw_engine import Constraints, DrawConstraintError, DrawError
+from migrations import apply_migrations
+from queries import QueryRegistry
+from records import (Player, Pair, AssignmentCard, PlayerDashboard, TableSize, SearchHit, DrawResult,
+                     DrawChange)
+
 # Настройка логгера
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Жеребьёвка целиком в БД (DRAW_STRATEGY=sql) и предел исправлений правил в ней
+SQL_DRAW_STRATEGY = 'sql'
+SQL_DRAW_MAX_REPAIRS = 10_000
+
+# Сколько случайных окон пар просматривать при поиске партнёра для обмена
+DRAW_SAMPLE_WINDOWS = 4
+
+# Ключ advisory-блокировки жеребьёвки (второй ключ — год), см. _lock_draw
+DRAW_LOCK_KEY = 20251216
+
+
+class PoolTimeoutError(Exception):
+    """Пул не смог выдать подключение за отведённое время."""
+
+
+class DatabaseUnavailable(Exception):
+    """База недоступна: автомат защиты разомкнут, запрос отклонён без подключения."""
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты подключений к БД.
+
+    После failure_threshold ошибок подключения подряд автомат размыкается:
+    запросы сразу получают DatabaseUnavailable, а не ждут таймаутов
+    подключения. Пока он разомкнут, фоновый поток раз в reset_timeout
+    секунд вызывает probe(); первая удачная проба замыкает автомат.
+    """
+
+    def __init__(self, probe, failure_threshold=3, reset_timeout=15.0):
+        self._probe = probe
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._open = False
+        self._failures = 0
+        self._last_error = None
+        self._lock = threading.Lock()
+        self._stats = {
+            'trips': 0,
+            'rejected': 0,
+            'probes': 0,
+            'probe_failures': 0,
+        }
+
+    @property
+    def is_open(self):
+        return self._open
+
+    def check(self):
+        """Отклонить запрос сразу, если автомат разомкнут."""
+        if self._open:
+            with self._lock:
+                self._stats['rejected'] += 1
+            raise DatabaseUnavailable(f"База данных недоступна: {self._last_error}")
+
+    def record_success(self):
+        if self._failures:
+            with self._lock:
+                self._failures = 0
+
+    def record_failure(self, error):
+        """Учесть ошибку подключения; на пороге — разомкнуть и запустить пробы."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._last_error = error
+            if self._open or self._failures < self.failure_threshold:
+                return
+            self._open = True
+            self._stats['trips'] += 1
+
+        logger.error(f"🔌 База недоступна ({error}): запросы отклоняются, "
+                     f"проверка подключения раз в {self.reset_timeout} сек.")
+        threading.Thread(target=self._probe_loop, name='db-breaker-probe', daemon=True).start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.reset_timeout)
+            with self._lock:
+                self._stats['probes'] += 1
+            try:
+                self._probe()
+            except Exception as e:
+                with self._lock:
+                    self._stats['probe_failures'] += 1
+                    self._last_error = e
+                logger.warning(f"⚠️ База всё ещё недоступна: {e}")
+                continue
+
+            with self._lock:
+                self._open = False
+                self._failures = 0
+            logger.info("✅ База снова доступна, запросы принимаются")
+            return
+
+    def get_stats(self):
+        """Снимок состояния автомата."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['state'] = 'open' if self._open else 'closed'
+            stats['failures'] = self._failures
+        stats['failure_threshold'] = self.failure_threshold
+        stats['reset_timeout'] = self.reset_timeout
+        return stats
+
+
+class PooledConnection:
+    """
+    Подключение, выданное пулом.
+    Ведёт себя как обычное подключение, но close() возвращает его в пул.
+    """
+
+    __slots__ = ('_conn', '_pool', '_released')
+
+    def __init__(self, conn, pool):
+        self._conn = conn
+        self._pool = pool
+        self._released = False
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    @property
+    def raw(self):
+        """Исходное подключение драйвера."""
+        return self._conn
+
+    def close(self):
+        """Вернуть подключение в пул (повторный вызов ничего не делает)."""
+        if not self._released:
+            self._released = True
+            self._pool.release(self._conn)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул подключений PostgreSQL.
+
+    Держит от min_size до max_size подключений, проверяет их при выдаче
+    (если подключение простаивало дольше health_check_interval секунд)
+    и собирает статистику использования. С breaker (CircuitBreaker)
+    ошибки открытия подключений учитываются автоматом, а при разомкнутом
+    автомате acquire() отказывает сразу.
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=30.0,
+                 health_check_interval=30.0, breaker=None):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Некорректные размеры пула: min={min_size}, max={max_size}")
+
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.breaker = breaker
+
+        self._idle = deque()  # (conn, время возврата в пул)
+        self._size = 0  # все живые подключения: свободные + выданные
+        self._cond = threading.Condition()
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+            'discarded': 0,
+        }
+
+    def prefill(self):
+        """Открыть min_size подключений заранее."""
+        with self._cond:
+            missing = self.min_size - self._size
+            self._size += max(missing, 0)
+        for _ in range(max(missing, 0)):
+            try:
+                conn = self._create()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                    self._cond.notify()
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self):
+        """Получить подключение из пула (или создать новое, если есть место)."""
+        if self.breaker is not None:
+            self.breaker.check()
+        deadline = time.monotonic() + self.timeout
+
+        while True:
+            with self._cond:
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats['timeouts'] += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободных подключений за {self.timeout} сек. "
+                            f"(max_size={self.max_size})"
+                        )
+                    self._stats['waits'] += 1
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, released_at = self._idle.pop()
+                else:
+                    conn, released_at = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._create()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, released_at):
+                self._discard(conn)
+                continue
+            else:
+                with self._cond:
+                    self._stats['reused'] += 1
+
+            with self._cond:
+                self._stats['checkouts'] += 1
+            return conn
+
+    def begin_unit(self, conn):
+        """Выключить autocommit на время единицы работы (вернётся в release)."""
+        conn.autocommit = False
+
+    def release(self, conn):
+        """Вернуть подключение в пул, откатив незавершённую транзакцию."""
+        try:
+            if conn.closed:
+                self._discard(conn)
+                return
+            if not conn.autocommit:
+                conn.rollback()
+                conn.autocommit = True
+        except Exception as e:
+            logger.warning(f"⚠️ Подключение не удалось вернуть в пул: {e}")
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Закрыть все свободные подключения."""
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def get_stats(self):
+        """Снимок статистики пула."""
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'size': self._size,
+                'idle': len(self._idle),
+                'in_use': self._size - len(self._idle),
+            })
+        return stats
+
+    def _create(self):
+        try:
+            conn = self._connect()
+        except Exception as e:
+            if self.breaker is not None:
+                self.breaker.record_failure(e)
+            raise
+        if self.breaker is not None:
+            self.breaker.record_success()
+        with self._cond:
+            self._stats['created'] += 1
+        return conn
+
+    def _is_healthy(self, conn, released_at):
+        if conn.closed:
+            return False
+        if time.monotonic() - released_at < self.health_check_interval:
+            return True
+
+        with self._cond:
+            self._stats['health_checks'] += 1
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.fetchone()
+            cursor.close()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Подключение из пула не прошло проверку: {e}")
+            with self._cond:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def _discard(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['discarded'] += 1
+            self._cond.notify()
+
+
+class ThreadLocalConnections:
+    """
+    Одно долгоживущее подключение SQLite на поток.
+
+    SQLite-подключения нельзя передавать между потоками, поэтому вместо
+    общего пула каждый поток держит своё подключение и переиспользует его.
+    """
+
+    def __init__(self, connect, health_check_interval=30.0):
+        self._connect = connect
+        self.health_check_interval = health_check_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+        self._stats = {
+            'created': 0,
+            'reused': 0,
+            'checkouts': 0,
+            'health_checks': 0,
+            'health_check_failures': 0,
+        }
+
+    def acquire(self):
+        """Получить подключение текущего потока."""
+        conn = getattr(self._local, 'conn', None)
+
+        if conn is not None and not self._is_healthy(conn):
+            self._drop_local(conn)
+            conn = None
+
+        with self._lock:
+            self._stats['checkouts'] += 1
+            if conn is not None:
+                self._stats['reused'] += 1
+
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+            self._local.checked_at = time.monotonic()
+            with self._lock:
+                self._connections.append(conn)
+                self._stats['created'] += 1
+
+        return conn
+
+    def begin_unit(self, conn):
+        """sqlite3 сам открывает транзакцию перед первой записью."""
+
+    def release(self, conn):
+        """Подключение остаётся у потока; незавершённая транзакция откатывается."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось откатить транзакцию SQLite: {e}")
+            self._drop_local(conn)
+            return
+        self._local.checked_at = time.monotonic()
+
+    def close_local(self):
+        """Закрыть подключение текущего потока (перед завершением фонового потока)."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            self._drop_local(conn)
+
+    def close_all(self):
+        """Закрыть подключения всех потоков."""
+        with self._lock:
+            connections = list(self._connections)
+            self._connections.clear()
+        for conn in connections:
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+    def get_stats(self):
+        """Снимок статистики подключений."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['size'] = len(self._connections)
+        return stats
+
+    def _is_healthy(self, conn):
+        checked_at = getattr(self._local, 'checked_at', 0.0)
+        if time.monotonic() - checked_at < self.health_check_interval:
+            return True
+
+        with self._lock:
+            self._stats['health_checks'] += 1
+        try:
+            conn.execute('SELECT 1').fetchone()
+            self._local.checked_at = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning(f"⚠️ Подключение SQLite не прошло проверку: {e}")
+            with self._lock:
+                self._stats['health_check_failures'] += 1
+            return False
+
+    def _drop_local(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            if conn in self._connections:
+                self._connections.remove(conn)
+        self._local.conn = None
+
+
+class SQLiteWriter:
+    """
+    Единственное подключение SQLite для записи, общее для всех потоков.
+
+    Писатель в SQLite всё равно может быть только один, поэтому потоки
+    ждут своей очереди на блокировке в Python (не дольше timeout), а не
+    получают "database is locked" от самой базы. Чтение при этом идёт
+    через отдельные подключения потоков (см. Database.read_pool).
+    """
+
+    def __init__(self, connect, timeout=30.0):
+        self._connect = connect
+        self.timeout = timeout
+        self._conn = None
+        self._lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._stats = {
+            'created': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'timeouts': 0,
+            'discarded': 0,
+        }
+
+    def acquire(self):
+        """Занять подключение-писатель (ждёт, пока его освободит другой поток)."""
+        if not self._lock.acquire(blocking=False):
+            self._count('waits')
+            if not self._lock.acquire(timeout=self.timeout):
+                self._count('timeouts')
+                raise PoolTimeoutError(f"Подключение для записи занято дольше {self.timeout} сек.")
+
+        try:
+            if self._conn is None:
+                self._conn = self._connect()
+                self._count('created')
+        except Exception:
+            self._lock.release()
+            raise
+
+        self._count('checkouts')
+        return self._conn
+
+    def begin_unit(self, conn):
+        """sqlite3 сам открывает транзакцию перед первой записью."""
+
+    def release(self, conn):
+        """Освободить писателя, откатив незавершённую транзакцию."""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось откатить транзакцию SQLite: {e}")
+            self._drop()
+        finally:
+            self._lock.release()
+
+    def close_all(self):
+        """Закрыть подключение-писатель."""
+        with self._lock:
+            self._drop()
+
+    def get_stats(self):
+        """Снимок статистики писателя."""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats['size'] = 1 if self._conn is not None else 0
+        return stats
+
+    def _count(self, key):
+        with self._stats_lock:
+            self._stats[key] += 1
+
+    def _drop(self):
+        if self._conn is not None:
+            try:
+                self._conn.close()
+            except Exception:
+                pass
+            self._conn = None
+            self._count('discarded')
+
+
+class UnitOfWork:
+    """
+    Единица работы: одно подключение и одна транзакция на всё,
+    что выполняется внутри Database.unit_of_work().
+
+    Подключение берётся из пула лениво — при первом запросе к БД,
+    поэтому обработчики без обращений к базе ничего не стоят.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._conn = None
+        self._savepoints = []
+        self._stale = {}  # (id(кэша), ключ) → кэш: сбросить после commit
+        self.rolled_back = False
+
+    @property
+    def connection(self):
+        if self._conn is None:
+            self._conn = self._pool.acquire()
+            self._pool.begin_unit(self._conn)
+        return self._conn
+
+    @property
+    def is_active(self):
+        return self._conn is not None
+
+    def commit(self):
+        if self._conn is not None:
+            self._conn.commit()
+        # Повторный сброс: другой поток мог закэшировать старую строку,
+        # пока наша транзакция была не зафиксирована
+        stale, self._stale = self._stale, {}
+        for (_, key), cache in stale.items():
+            if key is None:
+                cache.clear()
+            else:
+                cache.invalidate(key)
+
+    def release_connection(self):
+        """
+        Вернуть подключение в пул после commit, если нет открытых точек
+        сохранения. Следующий запрос единицы работы возьмёт его снова.
+        """
+        if self._conn is not None and not self._savepoints:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+    def invalidate_on_commit(self, cache, key=None):
+        """Запомнить ключ кэша (None — весь кэш), изменённый в этой единице работы."""
+        self._stale[(id(cache), key)] = cache
+
+    def is_stale(self, cache, key):
+        """Ключ изменён в незафиксированной транзакции — кэшу нельзя верить."""
+        return (id(cache), key) in self._stale or (id(cache), None) in self._stale
+
+    def rollback(self):
+        if self._conn is not None:
+            self._conn.rollback()
+            self._savepoints.clear()
+            self.rolled_back = True
+
+    def savepoint(self):
+        """Открыть точку сохранения для вложенного блока."""
+        name = f"uow_sp_{len(self._savepoints) + 1}"
+        # SAVEPOINT вне транзакции SQLite сам открывает транзакцию, и его
+        # RELEASE её фиксирует — поэтому сначала явный BEGIN (psycopg2 делает это сам)
+        if getattr(self.connection, 'in_transaction', True) is False:
+            self._execute("BEGIN")
+        self._execute(f"SAVEPOINT {name}")
+        self._savepoints.append(name)
+        return name
+
+    def release_savepoint(self, name):
+        if name in self._savepoints:
+            self._execute(f"RELEASE SAVEPOINT {name}")
+            del self._savepoints[self._savepoints.index(name):]
+
+    def rollback_to_savepoint(self, name):
+        # Если вся транзакция уже откачена, точки сохранения больше нет
+        if name in self._savepoints:
+            self._execute(f"ROLLBACK TO SAVEPOINT {name}")
+            self.release_savepoint(name)
+
+    def _execute(self, statement):
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(statement)
+        finally:
+            cursor.close()
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+class UnitConnection:
+    """
+    Подключение текущей единицы работы, выданное через get_connection().
+    commit() и close() откладываются до завершения единицы работы.
+    """
+
+    __slots__ = ('_unit',)
+
+    def __init__(self, unit):
+        self._unit = unit
+
+    def __getattr__(self, name):
+        return getattr(self._unit.connection, name)
+
+    @property
+    def raw(self):
+        """Исходное подключение драйвера."""
+        return self._unit.connection
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        self._unit.rollback()
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+
 class Database:
-    def __init__(self):
+    def __init__(self, pool_min_size=None, pool_max_size=None):
         """
         Инициализация базы данных.
         Автоматически определяет тип БД на основе доступных переменных окружения.
+
+        Размер пула подключений PostgreSQL берётся из аргументов или из
+        переменных DB_POOL_MIN_SIZE / DB_POOL_MAX_SIZE.
+
+        DB_SQLITE_PROFILE=performance включает для SQLite WAL и отдельные
+        подключения для записи и чтения (см. _setup_pool).
         """
         print("=" * 60)
         print("🔧 ИНИЦИАЛИЗАЦИЯ БАЗЫ ДАННЫХ")
@@ -26,8 +708,12 @@ class Database:
                 print(f"  {key}: {value[:50]}..." if len(value) > 50 else f"  {key}: {value}")
         print("-" * 40)
         
+        self._local = threading.local()
         self.db_type = self._detect_database_type()
         self._setup_connection()
+        self._setup_queries()
+        self._setup_cache()
+        self._setup_pool(pool_min_size, pool_max_size)
         self.init_db()
         
         print(f"✅ База данных инициализирована. Тип: {self.db_type}")
@@ -96,30 +782,266 @@ class Database:
             
             logger.info(f"📁 Путь к SQLite базе: {self.db_path}")
 
-    def get_connection(self):
-        """Возвращает подключение к базе данных с правильным адаптером."""
-        try:
-            if self.db_type == 'postgresql':
-                import psycopg2
-                from psycopg2.extras import RealDictCursor
-                
-                # Для Railway PostgreSQL важно использовать sslmode=require
-                try:
-                    conn = psycopg2.connect(self.conn_string, sslmode='require')
-                except:
-                    # Пробуем без sslmode для совместимости
-                    conn = psycopg2.connect(self.conn_string)
-                
-                conn.autocommit = True
-                conn.cursor_factory = RealDictCursor
-                return conn
-                
+            # Профиль производительности включается явно
+            self.sqlite_profile = os.getenv('DB_SQLITE_PROFILE', 'default').lower()
+            if self.sqlite_profile not in ('default', 'performance'):
+                print(f"⚠️ Неизвестный DB_SQLITE_PROFILE={self.sqlite_profile}, использую default")
+                self.sqlite_profile = 'default'
+            self._sqlite_busy_timeout = float(os.getenv('DB_SQLITE_BUSY_TIMEOUT', '5'))
+            self._sqlite_mmap_size = int(os.getenv('DB_SQLITE_MMAP_SIZE', str(256 * 1024 * 1024)))
+
+    def _setup_queries(self):
+        """Компилирует реестр запросов под диалект (один раз при старте)."""
+        self.queries = QueryRegistry(self.db_type)
+
+        # Серверные prepared statements включаются явно: они несовместимы
+        # с pgbouncer в режиме transaction pooling
+        self.use_prepared_statements = (
+            self.db_type == 'postgresql'
+            and os.getenv('DB_PREPARED_STATEMENTS', '').lower() in ('1', 'true', 'yes')
+        )
+        self._prepared = weakref.WeakKeyDictionary()  # подключение → имена подготовленных запросов
+        self._prepared_lock = threading.Lock()
+        self._cursor_ids = itertools.count(1)  # имена серверных курсоров
+        # Алгоритм жеребьёвки: derangement (равновероятно), cycle (один общий круг)
+        # или sql — круг строится запросом в самой БД, для очень больших составов
+        self.draw_strategy = os.getenv('DRAW_STRATEGY', 'derangement')
+        if self.draw_strategy != SQL_DRAW_STRATEGY:
+            draw_engine.get_strategy(self.draw_strategy)
+        print(f"📚 Запросов в реестре: {len(self.queries.names())}"
+              f"{' (prepared statements)' if self.use_prepared_statements else ''}")
+
+    def _setup_cache(self):
+        """
+        Кэш строк игроков для get_player (DB_PLAYER_CACHE_SIZE=0 выключает)
+        и индексы пар по годам (DB_PAIR_INDEX_TTL=0 выключает).
+        """
+        self.player_cache = LRUCache(
+            max_size=int(os.getenv('DB_PLAYER_CACHE_SIZE', '1024')),
+            ttl=float(os.getenv('DB_PLAYER_CACHE_TTL', '60')),
+        )
+        # Пары года меняются только жеребьёвкой, очисткой и раскрытиями,
+        # а они сбрасывают индекс сами; TTL — на случай записи другим процессом
+        self.pair_cache = LRUCache(
+            max_size=4,
+            ttl=float(os.getenv('DB_PAIR_INDEX_TTL', '600')),
+        )
+        # Итоги последнего точного пересчёта таблиц: имя → TableSize
+        self._table_counts = {}
+        self._table_recount_running = False
+        self._table_recount_lock = threading.Lock()
+
+    def _invalidate_player(self, user_id):
+        """Сбросить игрока в кэше сейчас и ещё раз после commit единицы работы."""
+        self.player_cache.invalidate(user_id)
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            unit.invalidate_on_commit(self.player_cache, user_id)
+
+    def _invalidate_pairs(self, year=None):
+        """Сбросить индекс пар года (None — всех лет) сейчас и после commit."""
+        if year is None:
+            self.pair_cache.clear()
+        else:
+            self.pair_cache.invalidate(year)
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            unit.invalidate_on_commit(self.pair_cache, year)
+
+    def get_cache_stats(self):
+        """Статистика кэша игроков (hits, misses, hit_rate, ...)."""
+        stats = self.player_cache.get_stats()
+        stats['pair_index'] = self.pair_cache.get_stats()
+        return stats
+
+    def _setup_pool(self, pool_min_size=None, pool_max_size=None):
+        """Создаёт пул подключений для выбранного типа БД."""
+        health_check_interval = float(os.getenv('DB_POOL_HEALTH_CHECK_INTERVAL', '30'))
+        # Отдельный пул для чтения есть только у SQLite в режиме performance
+        self.read_pool = None
+        # Автомат защиты — только для сетевой БД (PostgreSQL)
+        self.breaker = None
+
+        if self.db_type == 'postgresql':
+            # Режим SSL определяется при первом подключении и затем кэшируется
+            self._sslmode = None
+            self._sslmode_checked = False
+            self._connect_timeout = int(os.getenv('DB_CONNECT_TIMEOUT', '5'))
+
+            # DB_BREAKER_THRESHOLD=0 выключает автомат
+            self.breaker = CircuitBreaker(
+                self._probe_postgresql,
+                failure_threshold=int(os.getenv('DB_BREAKER_THRESHOLD', '3')),
+                reset_timeout=float(os.getenv('DB_BREAKER_RESET_TIMEOUT', '15')),
+            )
+
+            min_size = pool_min_size if pool_min_size is not None else int(os.getenv('DB_POOL_MIN_SIZE', '1'))
+            max_size = pool_max_size if pool_max_size is not None else int(os.getenv('DB_POOL_MAX_SIZE', '10'))
+
+            self.pool = ConnectionPool(
+                self._connect_postgresql,
+                min_size=min_size,
+                max_size=max_size,
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+                health_check_interval=health_check_interval,
+                breaker=self.breaker,
+            )
+            self.pool.prefill()
+            print(f"🏊 Пул подключений PostgreSQL: min={min_size}, max={max_size}, "
+                  f"sslmode={self._sslmode or 'по умолчанию'}")
+        elif self.sqlite_profile == 'performance':
+            # Один писатель на всё приложение и по читателю на поток:
+            # в WAL читатели не ждут писателя, а писатели ждут друг друга
+            # в очереди, а не в busy-цикле SQLite
+            self.pool = SQLiteWriter(
+                self._connect_sqlite,
+                timeout=float(os.getenv('DB_POOL_TIMEOUT', '30')),
+            )
+            self.read_pool = ThreadLocalConnections(
+                self._connect_sqlite_reader,
+                health_check_interval=health_check_interval,
+            )
+            print(f"⚡ Профиль SQLite performance: WAL, synchronous=NORMAL, "
+                  f"mmap_size={self._sqlite_mmap_size}, busy_timeout={self._sqlite_busy_timeout} сек.")
+        else:
+            self.pool = ThreadLocalConnections(
+                self._connect_sqlite,
+                health_check_interval=health_check_interval,
+            )
+
+    def _connect_postgresql(self):
+        """Открывает новое подключение PostgreSQL."""
+        import psycopg2
+        from psycopg2.extras import RealDictCursor
+
+        # connect_timeout: недоступный сервер не держит поток дольше нескольких секунд
+        timeout = self._connect_timeout
+        if self._sslmode_checked:
+            if self._sslmode:
+                conn = psycopg2.connect(self.conn_string, sslmode=self._sslmode, connect_timeout=timeout)
             else:
-                import sqlite3
-                conn = sqlite3.connect(self.db_path)
-                conn.row_factory = sqlite3.Row
-                return conn
-                
+                conn = psycopg2.connect(self.conn_string, connect_timeout=timeout)
+        else:
+            # Для Railway PostgreSQL важно использовать sslmode=require
+            try:
+                conn = psycopg2.connect(self.conn_string, sslmode='require', connect_timeout=timeout)
+                self._sslmode = 'require'
+            except psycopg2.OperationalError as e:
+                # Без SSL пробуем, только если сервер отказал именно в SSL:
+                # при недоступном сервере вторая попытка лишь удвоит ожидание
+                if 'SSL' not in str(e):
+                    raise
+                print(f"⚠️ Подключение с sslmode=require не удалось ({e}), пробую без SSL")
+                conn = psycopg2.connect(self.conn_string, connect_timeout=timeout)
+                self._sslmode = None
+            self._sslmode_checked = True
+
+        conn.autocommit = True
+        conn.cursor_factory = RealDictCursor
+        return conn
+
+    def _probe_postgresql(self):
+        """Пробное подключение для автомата защиты: SELECT 1 на новом подключении."""
+        conn = self._connect_postgresql()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1')
+            cursor.close()
+        finally:
+            conn.close()
+        # Свободные подключения пула могли оборваться вместе с сервером
+        self.pool.close_all()
+
+    def _is_connection_error(self, error):
+        """Ошибка связи с сервером (а не ошибка самого запроса)."""
+        if isinstance(error, DatabaseUnavailable):
+            return True
+        if self.db_type != 'postgresql':
+            return False
+        import psycopg2
+        # Ошибки сервера приходят с SQLSTATE, обрыв связи — без него
+        return (isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError))
+                and getattr(error, 'pgcode', None) is None)
+
+    def _note_error(self, error):
+        """Обрыв связи посреди запроса тоже учитывается автоматом защиты."""
+        if self.breaker is not None and not isinstance(error, DatabaseUnavailable) \
+                and self._is_connection_error(error):
+            self.breaker.record_failure(error)
+
+    def _stale_or_raise(self, cache, key, error):
+        """
+        БД недоступна: значение из кэша, даже если его TTL истёк,
+        иначе DatabaseUnavailable.
+        """
+        value = cache.get_stale(key)
+        if value is MISSING:
+            if isinstance(error, DatabaseUnavailable):
+                raise error
+            raise DatabaseUnavailable(f"База данных недоступна: {error}") from error
+        logger.warning(f"⚠️ БД недоступна, отдаю данные из кэша: {key}")
+        return value
+
+    def _connect_sqlite(self):
+        """Открывает новое подключение SQLite для текущего потока."""
+        import sqlite3
+
+        if self.sqlite_profile != 'performance':
+            conn = sqlite3.connect(self.db_path)
+            conn.row_factory = sqlite3.Row
+            return conn
+
+        # Писатель общий для всех потоков, доступ к нему сериализует SQLiteWriter
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self._sqlite_busy_timeout,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')  # сохраняется в самом файле БД
+        self._apply_sqlite_pragmas(conn)
+        return conn
+
+    def _connect_sqlite_reader(self):
+        """Открывает подключение SQLite только для чтения (профиль performance)."""
+        import sqlite3
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self._sqlite_busy_timeout,
+            cached_statements=256,
+        )
+        conn.row_factory = sqlite3.Row
+        self._apply_sqlite_pragmas(conn)
+        conn.execute('PRAGMA query_only = ON')
+        return conn
+
+    def _apply_sqlite_pragmas(self, conn):
+        """Настройки подключения профиля performance (действуют на подключение)."""
+        # В WAL NORMAL не теряет целостность, только последние коммиты при сбое ОС
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {self._sqlite_mmap_size}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self._sqlite_busy_timeout * 1000)}')
+
+    def get_connection(self, readonly=False):
+        """
+        Возвращает подключение к базе данных из пула.
+        Вызов close() у подключения возвращает его в пул.
+
+        Внутри unit_of_work() возвращается подключение единицы работы.
+        Если есть отдельный пул для чтения, readonly-запросы идут через него,
+        пока единица работы ещё ничего не записала.
+        """
+        unit = getattr(self._local, 'unit', None)
+        use_reader = readonly and self.read_pool is not None
+        if unit is not None and not (use_reader and not unit.is_active):
+            return UnitConnection(unit)
+
+        pool = self.read_pool if use_reader else self.pool
+        try:
+            return PooledConnection(pool.acquire(), pool)
+        except DatabaseUnavailable:
+            raise
         except Exception as e:
             error_msg = f"❌ Ошибка подключения к БД ({self.db_type}): {e}"
             if self.db_type == 'postgresql':
@@ -127,29 +1049,128 @@ class Database:
             print(error_msg)
             raise
 
+    @contextmanager
+    def unit_of_work(self):
+        """
+        Все вызовы Database внутри блока используют одно подключение
+        и одну транзакцию: commit в конце, rollback при исключении.
+        Вложенные блоки присоединяются к внешнему через SAVEPOINT:
+        исключение откатывает только изменения вложенного блока.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            savepoint = unit.savepoint()
+            try:
+                yield unit
+            except BaseException:
+                unit.rollback_to_savepoint(savepoint)
+                raise
+            else:
+                unit.release_savepoint(savepoint)
+            return
+
+        unit = UnitOfWork(self.pool)
+        self._local.unit = unit
+        try:
+            yield unit
+        except BaseException:
+            try:
+                unit.rollback()
+            except Exception as e:
+                logger.error(f"❌ Ошибка отката единицы работы: {e}")
+            raise
+        else:
+            unit.commit()
+        finally:
+            self._local.unit = None
+            unit.close()
+
+    def checkpoint(self, release=False):
+        """
+        Зафиксировать уже выполненные изменения текущей единицы работы.
+        Нужно для длинных рассылок, чтобы не держать блокировки до конца.
+        release=True — ещё и вернуть подключение в пул (перед сетевым вызовом
+        обработчика): писатель SQLite и подключение PostgreSQL не ждут Telegram.
+        """
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None:
+            unit.commit()
+            if release:
+                unit.release_connection()
+
+    def get_pool_stats(self):
+        """Статистика пула подключений."""
+        stats = self.pool.get_stats()
+        stats['db_type'] = self.db_type
+        if self.db_type == 'postgresql':
+            stats['sslmode'] = self._sslmode if self._sslmode_checked else 'не определён'
+        else:
+            stats['sqlite_profile'] = self.sqlite_profile
+        if self.read_pool is not None:
+            stats['readers'] = self.read_pool.get_stats()
+        if self.breaker is not None:
+            stats['breaker'] = self.breaker.get_stats()
+        return stats
+
+    def release_thread_connections(self):
+        """Закрыть подключения SQLite текущего потока (для короткоживущих потоков)."""
+        for pool in (self.pool, self.read_pool):
+            if isinstance(pool, ThreadLocalConnections):
+                pool.close_local()
+
+    def close(self):
+        """Закрывает все подключения пула."""
+        self.pool.close_all()
+        if self.read_pool is not None:
+            self.read_pool.close_all()
+
     def _execute_query(self, query: str, params: tuple = None, 
                        fetchone: bool = False, fetchall: bool = False):
         """
-        Универсальный метод выполнения SQL запросов.
-        Автоматически адаптирует запросы под тип БД.
+        Выполнение произвольного SQL (миграции, диагностика).
+        Запросы бота выполняются через реестр — см. _query().
         """
         # Заменяем SQLite-специфичные конструкции на PostgreSQL-совместимые
         if self.db_type == 'postgresql':
             query = query.replace('?', '%s')
             query = query.replace('datetime(\'now\')', 'CURRENT_TIMESTAMP')
             query = query.replace('INSERT OR REPLACE', 'INSERT')
-        
-        conn = self.get_connection()
-        cursor = conn.cursor()
+
+        return self._run(query, params, fetchone=fetchone, fetchall=fetchall)
+
+    def _query(self, name: str, params: tuple = None,
+               fetchone: bool = False, fetchall: bool = False, record=None):
+        """
+        Выполнение именованного запроса из реестра queries.QUERIES.
+        С record=Player/Pair строки читаются кортежами и сразу
+        превращаются в компактные записи из records.py.
+        """
+        return self._run(self.queries[name].sql, params, fetchone=fetchone,
+                         fetchall=fetchall, query=self.queries[name], record=record)
+
+    def _run(self, sql, params=None, fetchone=False, fetchall=False, query=None, record=None,
+             readonly=False):
+        """Выполняет готовый для текущего диалекта SQL."""
+        conn = self.get_connection(readonly=readonly or (query is not None and query.readonly))
+        cursor = self._tuple_cursor(conn) if record else conn.cursor()
         
         try:
-            if params:
-                cursor.execute(query, params)
+            if query is not None and query.prepared_sql and self.use_prepared_statements:
+                self._execute_prepared(conn.raw, cursor, query, params)
+            elif params:
+                cursor.execute(sql, params)
             else:
-                cursor.execute(query)
+                cursor.execute(sql)
             
             result = None
-            if fetchone:
+            if record and (fetchone or fetchall):
+                read = record.reader([column[0] for column in cursor.description])
+                if fetchone:
+                    row = cursor.fetchone()
+                    result = read(row) if row is not None else None
+                else:
+                    result = [read(row) for row in cursor]
+            elif fetchone:
                 result = cursor.fetchone()
             elif fetchall:
                 result = cursor.fetchall()
@@ -159,120 +1180,103 @@ class Database:
             
             return result
         except Exception as e:
+            self._note_error(e)
             logger.error(f"❌ Ошибка SQL: {e}")
-            logger.error(f"📝 Запрос: {query[:100]}...")
+            logger.error(f"📝 Запрос: {(query.name if query else sql)[:100]}...")
             if params:
                 logger.error(f"📌 Параметры: {params}")
-            conn.rollback()
+            self._rollback_statement(conn)
             raise
         finally:
             cursor.close()
             conn.close()
 
-    def init_db(self):
-        """Инициализирует таблицы в базе данных."""
-        print("🗃️  Создание/проверка таблиц...")
-        
+    @staticmethod
+    def _rollback_statement(conn):
+        """
+        Откат после ошибки запроса. Внутри unit_of_work() не откатываем ничего:
+        исключение дойдёт до блока, и он откатит свою точку сохранения
+        (вложенный блок) или всю транзакцию (внешний).
+        """
+        if not isinstance(conn, UnitConnection):
+            conn.rollback()
+
+    def _iter_query(self, name, record, params=None, batch_size=500):
+        """
+        Потоковое чтение именованного запроса пачками по batch_size строк.
+
+        PostgreSQL — серверный (именованный) курсор WITH HOLD: он переживает
+        commit/checkpoint() внутри цикла; SQLite — fetchmany. В памяти
+        одновременно не больше одной пачки, сколько бы строк ни было.
+        Подключение занято, пока итератор не дочитан или не закрыт.
+        """
+        query = self.queries[name]
+        conn = self.get_connection(readonly=query.readonly)
         if self.db_type == 'postgresql':
-            # Сначала удаляем старые таблицы если они есть (для чистого старта)
-            print("🧹 Очистка старых таблиц...")
-            try:
-                self._execute_query('DROP TABLE IF EXISTS revealed_pairs CASCADE')
-                self._execute_query('DROP TABLE IF EXISTS santa_pairs CASCADE')
-                self._execute_query('DROP TABLE IF EXISTS players CASCADE')
-                print("✅ Старые таблицы удалены")
-            except Exception as e:
-                print(f"⚠️  Не удалось удалить таблицы: {e}")
-            
-            # Создаем таблицы с правильными constraints
-            print("🔄 Создание новых таблиц...")
-            
-            # Таблица players С UNIQUE constraint
-            self._execute_query('''
-                CREATE TABLE players (
-                    id SERIAL PRIMARY KEY,
-                    user_id BIGINT UNIQUE NOT NULL,
-                    username TEXT,
-                    full_name TEXT NOT NULL,
-                    telegram_name TEXT,
-                    wish_list TEXT,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT TRUE
-                )
-            ''')
-            print("✅ Таблица 'players' создана с UNIQUE constraint на user_id")
-            
-            # Таблица santa_pairs
-            self._execute_query('''
-                CREATE TABLE santa_pairs (
-                    id SERIAL PRIMARY KEY,
-                    santa_user_id BIGINT NOT NULL REFERENCES players(user_id),
-                    receiver_user_id BIGINT NOT NULL REFERENCES players(user_id),
-                    year INTEGER DEFAULT 2025,
-                    is_notified BOOLEAN DEFAULT FALSE,
-                    assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(santa_user_id, year)
-                )
-            ''')
-            print("✅ Таблица 'santa_pairs' создана")
-            
-            # Таблица revealed_pairs
-            self._execute_query('''
-                CREATE TABLE revealed_pairs (
-                    id SERIAL PRIMARY KEY,
-                    santa_user_id BIGINT NOT NULL REFERENCES players(user_id),
-                    receiver_user_id BIGINT NOT NULL REFERENCES players(user_id),
-                    year INTEGER DEFAULT 2025,
-                    revealed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    revealed_by_admin BOOLEAN DEFAULT FALSE
-                )
-            ''')
-            print("✅ Таблица 'revealed_pairs' создана")
-            
-            print("✅ Все PostgreSQL таблицы созданы с правильными constraints")
-            
+            cursor = self._tuple_cursor(conn, name=f"santa_{name}_{next(self._cursor_ids)}")
+            cursor.itersize = batch_size
         else:
-            # SQLite таблицы (оставляем для локальной разработки)
-            self._execute_query('''
-                CREATE TABLE IF NOT EXISTS players (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    user_id INTEGER UNIQUE NOT NULL,
-                    username TEXT,
-                    full_name TEXT NOT NULL,
-                    telegram_name TEXT,
-                    wish_list TEXT,
-                    registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    is_active BOOLEAN DEFAULT 1
-                )
-            ''')
-            
-            self._execute_query('''
-                CREATE TABLE IF NOT EXISTS santa_pairs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    santa_user_id INTEGER NOT NULL,
-                    receiver_user_id INTEGER NOT NULL,
-                    year INTEGER DEFAULT 2025,
-                    is_notified BOOLEAN DEFAULT 0,
-                    assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    UNIQUE(santa_user_id, year)
-                )
-            ''')
-            
-            self._execute_query('''
-                CREATE TABLE IF NOT EXISTS revealed_pairs (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    santa_user_id INTEGER NOT NULL,
-                    receiver_user_id INTEGER NOT NULL,
-                    year INTEGER DEFAULT 2025,
-                    revealed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    revealed_by_admin BOOLEAN DEFAULT 0
-                )
-            ''')
-            
-            print("✅ SQLite таблицы проверены/созданы")
+            cursor = self._tuple_cursor(conn)
+
+        try:
+            if params:
+                cursor.execute(query.sql, params)
+            else:
+                cursor.execute(query.sql)
+            read = None
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                if read is None:
+                    # У серверного курсора description появляется после первой выборки
+                    read = record.reader([column[0] for column in cursor.description])
+                for row in rows:
+                    yield read(row)
+        except Exception as e:
+            self._note_error(e)
+            logger.error(f"❌ Ошибка SQL: {e}")
+            logger.error(f"📝 Запрос: {name}")
+            raise
+        finally:
+            try:
+                cursor.close()
+            finally:
+                conn.close()
+
+    def _tuple_cursor(self, conn, name=None):
+        """Курсор, отдающий строки обычными кортежами (для records.py)."""
+        if self.db_type == 'postgresql':
+            from psycopg2.extensions import cursor as tuple_cursor
+            if name:
+                return conn.raw.cursor(name=name, cursor_factory=tuple_cursor, withhold=True)
+            return conn.cursor(cursor_factory=tuple_cursor)
+
+        cursor = conn.cursor()
+        cursor.row_factory = None
+        return cursor
+
+    def _execute_prepared(self, raw_conn, cursor, query, params):
+        """
+        Серверный prepared statement PostgreSQL: PREPARE один раз
+        на подключение, дальше только EXECUTE с параметрами.
+        """
+        with self._prepared_lock:
+            prepared = self._prepared.get(raw_conn)
+            if prepared is None:
+                prepared = self._prepared[raw_conn] = set()
+
+        if query.name not in prepared:
+            cursor.execute(f"PREPARE {query.prepared_name} AS {query.prepared_sql}")
+            prepared.add(query.name)
+        cursor.execute(query.execute_sql, params)
+
+    def init_db(self):
+        """Приводит схему базы данных к актуальной версии через миграции."""
+        print("🗃️  Проверка версии схемы...")
+        self.schema_version = apply_migrations(self)
 
     # === МЕТОДЫ ДЛЯ РАБОТЫ С ИГРОКАМИ ===
-    # 🔍 МЕТОД add_player НАХОДИТСЯ ЗДЕСЬ (строка ~175)
 
     def add_player(self, user_id, username, full_name, telegram_name=None, wish_list=None):
         """Добавление или обновление игрока."""
@@ -284,368 +1288,853 @@ class Database:
             telegram_name = telegram_name if telegram_name else ''
             wish_list = wish_list if wish_list else ''
             
-            if self.db_type == 'postgresql':
-                # УНИВЕРСАЛЬНЫЙ МЕТОД ДЛЯ POSTGRESQL
-                query = '''
-                    INSERT INTO players 
-                    (user_id, username, full_name, telegram_name, wish_list, is_active)
-                    VALUES (%s, %s, %s, %s, %s, TRUE)
-                    ON CONFLICT (user_id) DO UPDATE SET
-                        username = EXCLUDED.username,
-                        full_name = EXCLUDED.full_name,
-                        telegram_name = EXCLUDED.telegram_name,
-                        wish_list = EXCLUDED.wish_list,
-                        is_active = TRUE
-                '''
-                self._execute_query(query, (user_id, username, full_name, telegram_name, wish_list))
-                print(f"✅ Игрок добавлен/обновлен: {full_name}")
-                
-            else:
-                # SQLite версия
-                query = '''
-                    INSERT OR REPLACE INTO players
-                    (user_id, username, full_name, telegram_name, wish_list, is_active)
-                    VALUES (?, ?, ?, ?, ?, 1)
-                '''
-                self._execute_query(query, (user_id, username, full_name, telegram_name, wish_list))
-                print(f"✅ Игрок добавлен/обновлен: {full_name}")
-            
+            with self.unit_of_work():
+                self._query('upsert_player', (user_id, username, full_name, telegram_name, wish_list))
+                self._invalidate_player(user_id)
+                self._invalidate_pairs()  # имя могло измениться, а индекс пар хранит имена
+                self.refresh_player_cards(user_id)
+            print(f"✅ Игрок добавлен/обновлен: {full_name}")
             return True
             
+        except DatabaseUnavailable:
+            # Запись при недоступной БД отклоняется сразу, обработчик сообщит об этом
+            raise
         except Exception as e:
             print(f"❌ Ошибка при добавлении игрока: {e}")
             print(f"   Параметры: user_id={user_id}, username={username}, full_name={full_name}")
             return False
 
+    def _cached_player(self, user_id, stale=False):
+        """
+        Игрок из кэша без обращения к БД (MISSING, если кэшу нельзя верить).
+        stale=True — и с истёкшим TTL (когда БД недоступна).
+        """
+        unit = getattr(self._local, 'unit', None)
+        # Внутри транзакции, изменившей игрока, читаем из БД и не кэшируем
+        if unit is not None and unit.is_stale(self.player_cache, user_id):
+            return MISSING
+        if stale:
+            return self.player_cache.get_stale(user_id)
+        return self.player_cache.get(user_id)
+
+    def _cache_player(self, user_id, player, generation):
+        unit = getattr(self._local, 'unit', None)
+        if unit is None or not unit.is_stale(self.player_cache, user_id):
+            self.player_cache.set(user_id, player, generation)
+
     def get_player(self, user_id):
-        """Получение информации об игроке по ID."""
-        query = 'SELECT * FROM players WHERE user_id = ?'
+        """
+        Получение информации об игроке по ID (Player или None).
+        Читает через кэш игроков; записи игрока сбрасывают его запись.
+        """
+        player = self._cached_player(user_id)
+        if player is not MISSING:
+            return player
+
         try:
-            result = self._execute_query(query, (user_id,), fetchone=True)
-            return result
+            generation = self.player_cache.generation
+            player = self._query('get_player', (user_id,), fetchone=True, record=Player)
+            self._cache_player(user_id, player, generation)
+            return player
         except Exception as e:
+            if self._is_connection_error(e):
+                return self._stale_or_raise(self.player_cache, user_id, e)
             print(f"❌ Ошибка получения игрока {user_id}: {e}")
             return None
 
+    def get_player_dashboard(self, user_id, year=2025):
+        """
+        Всё для /status (PlayerDashboard или None, если игрок не зарегистрирован):
+        данные игрока, его подопечный с пожеланиями и его Санта.
+
+        Если игрок, подопечный и индекс пар года уже в памяти — без запросов,
+        иначе одним запросом по индексам (игрок заодно попадает в кэш).
+        При недоступной БД собирается из кэшей с истёкшим TTL.
+        """
+        dashboard = self._dashboard_from_cache(user_id, year)
+        if dashboard is not MISSING:
+            return dashboard
+
+        try:
+            generation = self.player_cache.generation
+            dashboard = self._query('get_player_dashboard', (year, year, user_id),
+                                    fetchone=True, record=PlayerDashboard)
+            self._cache_player(user_id, Player.copy_from(dashboard) if dashboard else None, generation)
+            return dashboard
+        except Exception as e:
+            if self._is_connection_error(e):
+                dashboard = self._dashboard_from_cache(user_id, year, stale=True)
+                if dashboard is MISSING:
+                    raise DatabaseUnavailable(f"База данных недоступна: {e}") from e
+                logger.warning(f"⚠️ БД недоступна, статус {user_id} собран из кэша")
+                return dashboard
+            print(f"❌ Ошибка получения статуса игрока {user_id}: {e}")
+            return None
+
+    def _dashboard_from_cache(self, user_id, year, stale=False):
+        """PlayerDashboard из кэша игроков и индекса пар (MISSING, если данных не хватает)."""
+        player = self._cached_player(user_id, stale)
+        if player is None:
+            return None
+
+        index = self._cached_pair_index(year, stale) if player is not MISSING else None
+        if index is None:
+            return MISSING
+        receiver_id = index.receiver_of(user_id)
+        receiver = self._cached_player(receiver_id, stale) if receiver_id is not None else None
+        if receiver is MISSING:
+            return MISSING
+
+        santa_id = index.santa_of(user_id)
+        return PlayerDashboard.copy_from(
+            player,
+            receiver_user_id=receiver_id,
+            receiver_name=index.name(receiver_id),
+            receiver_wish_list=receiver.wish_list if receiver else None,
+            santa_name=index.name(santa_id),
+            santa_revealed=index.is_revealed(user_id),
+        )
+
     def get_all_active_players(self):
-        """Получение списка всех активных игроков."""
-        if self.db_type == 'postgresql':
-            query = '''
-                SELECT user_id, full_name, username
-                FROM players
-                WHERE is_active = TRUE
-                ORDER BY full_name
-            '''
-        else:
-            query = '''
-                SELECT user_id, full_name, username
-                FROM players
-                WHERE is_active = 1
-                ORDER BY full_name
-            '''
-        
+        """Получение списка всех активных игроков (Player: user_id, full_name, username, wish_list)."""
         try:
-            result = self._execute_query(query, fetchall=True)
-            if result and isinstance(result[0], dict):
-                return [(row['user_id'], row['full_name'], row['username']) for row in result]
-            return result or []
+            return self._query('get_all_active_players', fetchall=True, record=Player)
         except Exception as e:
             print(f"❌ Ошибка получения игроков: {e}")
             return []
 
+    def iter_active_players(self, batch_size=500):
+        """То же, что get_all_active_players, но потоком — без загрузки всего состава в память."""
+        return self._iter_query('get_all_active_players', Player, batch_size=batch_size)
+
+    def get_recent_players(self, limit=5):
+        """Последние зарегистрированные игроки (Player)."""
+        return self._query('get_recent_players', (limit,), fetchall=True, record=Player)
+
+    def search_players(self, text, page=0, page_size=10):
+        """
+        Полнотекстовый поиск по имени, username и пожеланиям.
+        Каждое слово запроса ищется как префикс, все слова обязательны.
+        Возвращает (список SearchHit по убыванию релевантности, есть ли ещё страница).
+        """
+        words = re.findall(r'\w+', (text or '').lower())
+        if not words:
+            return [], False
+
+        if self.db_type == 'sqlite':
+            expression = ' '.join(f'"{word}"*' for word in words)
+        else:
+            expression = ' & '.join(f'{word}:*' for word in words)
+
+        # Лишняя строка показывает, есть ли следующая страница, — без COUNT(*) по совпадениям
+        hits = self._query('search_players', (expression, page_size + 1, page * page_size),
+                           fetchall=True, record=SearchHit)
+        return hits[:page_size], len(hits) > page_size
+
     def get_player_by_name(self, full_name):
         """Поиск игрока по полному имени."""
-        query = 'SELECT * FROM players WHERE full_name = ?'
-        return self._execute_query(query, (full_name,), fetchone=True)
+        return self._query('get_player_by_name', (full_name,), fetchone=True, record=Player)
+
+    def update_wishlist(self, user_id, wish_list):
+        """Сохранить список пожеланий игрока (и снимок в карточке его Санты)."""
+        with self.unit_of_work():
+            self._query('update_wishlist', (wish_list, user_id))
+            self._invalidate_player(user_id)
+            self.refresh_player_cards(user_id)
 
     # === МЕТОДЫ ДЛЯ ЖЕРЕБЬЁВКИ И ПАР ===
 
-    def perform_draw(self, year=2025):
-        """Проведение жеребьёвки."""
+    def perform_draw(self, year=2025, strategy=None, seed=None, token=None):
+        """
+        Проведение жеребьёвки (все пары пишутся одной транзакцией).
+        strategy — стратегия draw_engine или 'sql' — жеребьёвка в самой БД
+        (по умолчанию DRAW_STRATEGY), seed — для воспроизведения;
+        без него берётся случайный и пишется в лог.
+
+        Жеребьёвка года идёт под блокировкой БД, а результат записывается
+        в draw_runs по ключу идемпотентности token (по умолчанию draw-<год>).
+        Параллельный или повторный вызов (фоновый поток, кнопка админа,
+        другая реплика) дожидается первого и получает его результат.
+        Возвращает DrawResult (performed=True, если пары созданы этим
+        вызовом) или False, если провести жеребьёвку не удалось.
+        """
+        token = token or f"draw-{year}"
         try:
             print(f"🎅 Проведение жеребьёвки для {year} года...")
-            
-            # Проверяем, не проводилась ли уже жеребьёвка
-            query = 'SELECT COUNT(*) as count FROM santa_pairs WHERE year = ?'
-            result = self._execute_query(query, (year,), fetchone=True)
-            
-            if result and result['count'] > 0:
-                print(f"⚠️ Жеребьёвка уже проводилась в {year} году!")
-                return False
 
-            # Получаем активных игроков
-            players = self.get_all_active_players()
-            player_ids = [player[0] for player in players]
+            with self.unit_of_work():
+                self._lock_draw(year)
 
-            if len(player_ids) < 2:
-                print("⚠️ Недостаточно игроков для жеребьёвки!")
-                return False
+                # Под блокировкой: жеребьёвка могла завершиться, пока мы ждали
+                existing = self._existing_draw(year, token)
+                if existing is not None:
+                    print(f"ℹ️ Жеребьёвка {year} года уже проведена ({existing.pairs_count} пар), "
+                          f"возвращаю её результат")
+                    return existing
 
-            # Алгоритм жеребьёвки
-            receivers = player_ids.copy()
-            random.shuffle(receivers)
+                strategy = strategy or self.draw_strategy
+                if seed is None:
+                    seed = draw_engine.new_seed()
 
-            attempts = 0
-            while any(santa == receiver for santa, receiver in zip(player_ids, receivers)) and attempts < 100:
-                random.shuffle(receivers)
-                attempts += 1
+                pairs_count = None
+                if strategy == SQL_DRAW_STRATEGY:
+                    try:
+                        # Точка сохранения: если правила в БД не выполнить, пары откатятся
+                        with self.unit_of_work():
+                            pairs_count = self._draw_in_database(year, seed)
+                    except DrawError as e:
+                        print(f"⚠️ {e} — жеребьёвка будет проведена в памяти (стратегия cycle)")
+                        strategy = 'cycle'
+                if pairs_count is None:
+                    pairs_count = self._draw_in_memory(year, strategy, seed)
 
-            if attempts >= 100:
-                print("❌ Не удалось создать уникальные пары!")
-                return False
+                if not pairs_count:
+                    print("⚠️ Недостаточно игроков для жеребьёвки!")
+                    return False
 
-            # Создаем пары
-            pairs_count = 0
-            for santa_id, receiver_id in zip(player_ids, receivers):
-                if self.db_type == 'postgresql':
-                    self._execute_query('''
-                        INSERT INTO santa_pairs (santa_user_id, receiver_user_id, year)
-                        VALUES (%s, %s, %s)
-                    ''', (santa_id, receiver_id, year))
-                else:
-                    self._execute_query('''
-                        INSERT INTO santa_pairs (santa_user_id, receiver_user_id, year)
-                        VALUES (?, ?, ?)
-                    ''', (santa_id, receiver_id, year))
-                pairs_count += 1
+                self._query('insert_draw_run', (token, year, strategy, seed, pairs_count))
 
             print(f"✅ Жеребьёвка проведена! Создано {pairs_count} пар.")
-            return True
-            
+            return DrawResult.copy_from(None, token=token, year=year, strategy=strategy, seed=seed,
+                                        pairs_count=pairs_count, performed=True)
+
+        except DrawConstraintError as e:
+            # Не ошибка БД: вызывающий код должен показать, кому не нашлось пары
+            print(f"❌ {e}: {e.players}")
+            raise
         except Exception as e:
             print(f"❌ Ошибка при проведении жеребьёвки: {e}")
             return False
 
+    def _lock_draw(self, year):
+        """
+        Блокировка жеребьёвки года до конца транзакции.
+        PostgreSQL — advisory-блокировка по (DRAW_LOCK_KEY, год): реплики ждут
+        друг друга. SQLite — BEGIN IMMEDIATE: блокировка записи берётся сразу,
+        а не при первой вставке; потоки процесса и так ждут единственного
+        подключения-писателя. Во вложенной единице работы транзакция уже
+        открыта (отложенный BEGIN точки сохранения), и блокировку берёт пустая
+        запись в draw_runs — до первого чтения, иначе два потока с блокировками
+        чтения не смогут перейти к записи и один получит «database is locked».
+        """
+        if self.db_type == 'postgresql':
+            self._execute_query('SELECT pg_advisory_xact_lock(?, ?)', (DRAW_LOCK_KEY, year), fetchone=True)
+        elif not self.get_connection().in_transaction:
+            self._execute_query('BEGIN IMMEDIATE')
+        else:
+            self._query('lock_draw_runs')
+
+    def _existing_draw(self, year, token):
+        """
+        Результат уже проведённой жеребьёвки: по ключу token, иначе последний
+        запуск года, иначе (пары появились до журнала draw_runs) — по числу пар.
+        """
+        run = self._query('get_draw_run', (token,), fetchone=True, record=DrawResult)
+        if run is not None:
+            return run
+        result = self._query('count_pairs', (year,), fetchone=True)
+        if not result or result['count'] == 0:
+            return None
+        run = self._query('get_year_draw_run', (year,), fetchone=True, record=DrawResult)
+        return run or DrawResult.copy_from(None, year=year, pairs_count=result['count'])
+
+    def _draw_in_memory(self, year, strategy, seed):
+        """
+        Жеребьёвка стратегией draw_engine: игроки читаются в память процесса,
+        пары и карточки пишутся пакетными вставками. Возвращает число пар.
+        """
+        # Получаем активных игроков (имена и пожелания нужны для карточек)
+        players = {player.user_id: player for player in self.iter_active_players()}
+        player_ids = list(players)
+
+        if len(player_ids) < 2:
+            return 0
+
+        # Алгоритм жеребьёвки — O(n), без повторных попыток
+        constraints = self.load_draw_constraints(year, player_ids)
+        print(f"🎲 Стратегия {strategy}, seed {seed}, {constraints!r}")
+        assignment = draw_engine.draw(player_ids, strategy, seed, constraints)
+        receivers = [assignment[santa_id] for santa_id in player_ids]
+
+        # Создаем пары одной пакетной вставкой
+        rows = [(santa_id, receiver_id, year) for santa_id, receiver_id in zip(player_ids, receivers)]
+        pairs_count = self._insert_many('insert_pairs', rows)
+        self._invalidate_pairs(year)
+
+        # И сразу готовые карточки назначения для рассылки и /status
+        cards = [
+            build_card_row(santa_id, year, receiver_id,
+                           players[santa_id].full_name, players[receiver_id].full_name,
+                           players[receiver_id].wish_list)
+            for santa_id, receiver_id in zip(player_ids, receivers)
+        ]
+        self._insert_many('upsert_cards', cards)
+        return pairs_count
+
+    def _draw_in_database(self, year, seed):
+        """
+        Жеребьёвка в самой БД (DRAW_STRATEGY=sql) для очень больших составов:
+        один INSERT ... SELECT выстраивает активных игроков в круг по
+        random() и назначает каждому следующего (LEAD). Пары, нарушающие
+        правила, чинятся обменом получателей, карточки пишутся потоком —
+        память процесса не зависит от числа игроков.
+
+        Порядок random() в БД не воспроизводится по seed: seed задаёт только
+        выбор партнёров для обменов. Если нарушений больше SQL_DRAW_MAX_REPAIRS
+        или какое-то не исправить, поднимается DrawError.
+        Возвращает число пар (0 — меньше двух игроков).
+        """
+        result = self._query('count_active_players', fetchone=True)
+        if not result or result['count'] < 2:
+            return 0
+
+        print(f"🎲 Жеребьёвка в БД (INSERT ... SELECT), игроков: {result['count']}")
+        pairs_count = self._query('draw_in_database', (year,))
+        self._invalidate_pairs(year)
+
+        repaired = self._repair_draw_in_database(year, random.Random(seed))
+        if repaired:
+            print(f"🔧 Исправлено пар, нарушавших правила: {repaired} (seed {seed})")
+
+        self.refresh_year_cards(year)
+        return pairs_count
+
+    def _repair_draw_in_database(self, year, rng):
+        """
+        Исправить пары года, нарушающие правила жеребьёвки, обменами
+        получателей (_swap_draw_receiver). В памяти только список нарушений.
+        Возвращает число исправлений.
+        """
+        rules = self._draw_rules(year)
+        violations = self._query('find_draw_violations',
+                                 (year,) + rules + (SQL_DRAW_MAX_REPAIRS + 1,), fetchall=True)
+        if not violations:
+            return 0
+        if len(violations) > SQL_DRAW_MAX_REPAIRS:
+            raise DrawError(f"Пар, нарушающих правила, больше {SQL_DRAW_MAX_REPAIRS}")
+
+        changed = set()  # Санты, у которых получатель уже заменён на допустимого
+        repaired = 0
+        for violation in violations:
+            santa, receiver = violation['santa_user_id'], violation['receiver_user_id']
+            if santa not in changed:
+                changed.update((santa, self._swap_draw_receiver(year, santa, receiver, rules, rng)))
+                repaired += 1
+        return repaired
+
+    def _insert_many(self, name, rows, page_size=1000):
+        """
+        Пакетная вставка строк именованным запросом (insert_pairs, upsert_cards).
+        PostgreSQL — execute_values (многострочный VALUES), SQLite — executemany.
+        """
+        sql = self.queries[name].sql
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            if self.db_type == 'postgresql':
+                from psycopg2.extras import execute_values
+                execute_values(cursor, sql, rows, page_size=page_size)
+            else:
+                cursor.executemany(sql, rows)
+            conn.commit()
+            return len(rows)
+        except Exception as e:
+            logger.error(f"❌ Ошибка пакетной вставки ({name}): {e}")
+            self._rollback_statement(conn)
+            raise
+        finally:
+            cursor.close()
+            conn.close()
+
+    # === ПРАВИЛА ЖЕРЕБЬЁВКИ ===
+
+    def load_draw_constraints(self, year, player_ids=None):
+        """
+        Ограничения жеребьёвки года (draw_engine.Constraints): исключения
+        draw_exclusions, команды (настройка separate_teams) и пары последних
+        no_repeat_years лет. player_ids — учитывать только этих игроков.
+        """
+        game = settings.current()
+        constraints = Constraints()
+        ids = set(player_ids) if player_ids is not None else None
+
+        for row in self._query('get_draw_exclusions', fetchall=True):
+            a, b = row['user_id_a'], row['user_id_b']
+            if ids is None or (a in ids and b in ids):
+                constraints.forbid_mutual(a, b)
+
+        if game.separate_teams:
+            for row in self._query('get_player_teams', fetchall=True):
+                if ids is None or row['user_id'] in ids:
+                    constraints.set_team(row['user_id'], row['team'])
+
+        if game.no_repeat_years > 0:
+            rows = self._query('get_previous_pairs', (year - game.no_repeat_years, year), fetchall=True)
+            for row in rows:
+                santa, receiver = row['santa_user_id'], row['receiver_user_id']
+                if ids is None or (santa in ids and receiver in ids):
+                    constraints.forbid(santa, receiver)
+        return constraints
+
+    def add_draw_exclusion(self, user_id_a, user_id_b, reason=None):
+        """Запретить двум игрокам дарить друг другу (в обе стороны)."""
+        if user_id_a == user_id_b:
+            raise ValueError("Исключение задаётся для двух разных игроков")
+        a, b = sorted((user_id_a, user_id_b))
+        self._query('add_draw_exclusion', (a, b, reason))
+
+    def remove_draw_exclusion(self, user_id_a, user_id_b):
+        """Снять исключение. Возвращает True, если оно было."""
+        a, b = sorted((user_id_a, user_id_b))
+        return self._query('delete_draw_exclusion', (a, b)) > 0
+
+    def get_draw_exclusions(self):
+        """Исключения с именами игроков (для админки)."""
+        return self._query('list_draw_exclusions', fetchall=True)
+
+    def set_player_team(self, user_id, team):
+        """Команда игрока (None или пустая строка — без команды). True, если игрок найден."""
+        return self._query('set_player_team', ((team or '').strip() or None, user_id)) > 0
+
+    # === ИЗМЕНЕНИЕ СОСТАВА ПОСЛЕ ЖЕРЕБЬЁВКИ ===
+
+    def remove_from_draw(self, user_id, year=None, strict=True):
+        """
+        Вывести игрока из проведённой жеребьёвки, не трогая остальных:
+        его Санта получает его подопечного (s → u → r становится s → r).
+        Если s → r нарушает правила, s меняется получателем со случайной
+        парой; если u и s дарили друг другу, s встраивается в другую пару.
+        Всё — несколько запросов по ключу в одной транзакции.
+        Возвращает DrawChange: кому заново отправить назначение и кто
+        остался без пары. DrawConstraintError — если допустимого обмена
+        для s не нашлось; strict=False — тогда игрок всё равно выходит,
+        s остаётся без подопечного, а r без Санты (в DrawChange и в логе).
+        """
+        year = year or settings.current().year
+        rng = random.Random()
+        unassigned = orphan = None
+        with self.unit_of_work():
+            links = self._query('get_draw_links', (year, user_id, user_id), fetchall=True)
+            santa = next((row['santa_user_id'] for row in links if row['receiver_user_id'] == user_id), None)
+            receiver = next((row['receiver_user_id'] for row in links if row['santa_user_id'] == user_id), None)
+            if santa is None and receiver is None:
+                return DrawChange.copy_from(None, affected=[])
+
+            self._query('delete_draw_pairs', (year, user_id, user_id if santa is None else santa))
+            self._query('delete_year_card', (user_id, year))
+            self._invalidate_pairs(year)
+            if santa is None:
+                return DrawChange.copy_from(None, affected=[])
+
+            rules = self._draw_rules(year)
+            if receiver is not None and receiver != santa:
+                self._insert_many('insert_pairs', [(santa, receiver, year)])
+                affected = [santa]
+                if not self._draw_pair_allowed(santa, receiver, rules):
+                    try:
+                        affected.append(self._swap_draw_receiver(year, santa, receiver, rules, rng))
+                    except DrawError as e:
+                        if strict:
+                            raise DrawConstraintError(str(e), [santa]) from None
+                        self._query('delete_draw_pairs', (year, santa, santa))
+                        affected, unassigned, orphan = self._leave_unassigned(santa, receiver, year, e)
+            else:
+                try:
+                    affected = self._splice_into_draw(year, santa, rules, rng)
+                except (DrawError, ValueError) as e:
+                    # Например, в игре остался один Санта: ждём /latejoin или новой жеребьёвки
+                    affected, unassigned, orphan = self._leave_unassigned(santa, receiver, year, e)
+
+            self._refresh_santa_cards(affected, year)
+        print(f"🔄 Игрок {user_id} выведен из жеребьёвки {year} года, затронуты: {affected}")
+        return DrawChange.copy_from(None, affected=affected, unassigned_santa=unassigned, orphan_receiver=orphan)
+
+    def _leave_unassigned(self, santa, receiver, year, reason):
+        """
+        Санта остался без подопечного, а receiver (подопечный выбывшего) —
+        без Санты: убрать карточку Санты и записать в лог.
+        Возвращает (affected, unassigned_santa, orphan_receiver) для DrawChange.
+        """
+        self._query('delete_year_card', (santa, year))
+        logger.warning(f"⚠️ Жеребьёвка {year} года неполная: игрок {santa} остался без подопечного, "
+                       f"игрок {receiver} — без Санты: {reason}")
+        return [], santa, receiver
+
+    def add_to_draw(self, user_id, year=None):
+        """
+        Добавить опоздавшего игрока в проведённую жеребьёвку: случайная пара
+        a → b, для которой a → u и u → b допустимы, становится a → u → b.
+        Возвращает Сант, которым нужно отправить назначение (a и сам игрок).
+        DrawConstraintError — если подходящей пары не нашлось,
+        ValueError — если игрок уже в жеребьёвке или её ещё не было.
+        """
+        year = year or settings.current().year
+        with self.unit_of_work():
+            if self._query('get_draw_links', (year, user_id, user_id), fetchall=True):
+                raise ValueError(f"Игрок {user_id} уже участвует в жеребьёвке {year} года")
+            try:
+                affected = self._splice_into_draw(year, user_id, self._draw_rules(year), random.Random())
+            except DrawError as e:
+                raise DrawConstraintError(str(e), [user_id]) from None
+            self._invalidate_pairs(year)
+            self._refresh_santa_cards(affected, year)
+        print(f"🔄 Игрок {user_id} добавлен в жеребьёвку {year} года, затронуты: {affected}")
+        return affected
+
+    def _draw_rules(self, year):
+        """Параметры правил для DRAW_RULE_VIOLATED (queries.py)."""
+        game = settings.current()
+        return (1 if game.separate_teams else 0, year - game.no_repeat_years, year)
+
+    def _draw_pair_allowed(self, santa, receiver, rules):
+        if santa == receiver:
+            return False
+        return self._query('check_draw_pair', (santa, receiver) + rules, fetchone=True)['count'] == 0
+
+    def _sample_draw_pairs(self, year, rng):
+        """
+        Кандидаты для обменов: до DRAW_SAMPLE_WINDOWS окон по REPAIR_ATTEMPTS
+        пар года подряд по santa_user_id. Начало окна — равномерно случайная
+        позиция среди пар года (OFFSET по индексу), а не случайный user_id:
+        id Telegram разрежены, и пары после больших пропусков выпадали бы
+        чаще других. Внутри окна порядок тоже случайный. Генератор: следующие
+        окна читаются, только если в предыдущих подходящей пары не нашлось.
+        """
+        total = self._query('year_pair_count', (year,), fetchone=True)['count']
+        limit = draw_engine.REPAIR_ATTEMPTS
+        seen = set()
+        for _ in range(min(DRAW_SAMPLE_WINDOWS, -(-total // limit))):
+            offset = rng.randrange(total)
+            rows = self._query('sample_draw_pairs', (year, limit, offset), fetchall=True)
+            if len(rows) < limit and offset:
+                # Окно у конца года продолжается с начала
+                rows += self._query('sample_draw_pairs', (year, min(limit - len(rows), offset), 0),
+                                    fetchall=True)
+            rows = list(rows)
+            rng.shuffle(rows)
+            for row in rows:
+                if row['santa_user_id'] not in seen:
+                    seen.add(row['santa_user_id'])
+                    yield row
+
+    def _swap_draw_receiver(self, year, santa, receiver, rules, rng):
+        """
+        Заменить пару santa → receiver, нарушающую правила: santa меняется
+        получателями со случайной парой other → r2, если santa → r2 и
+        other → receiver допустимы. Круг может распасться на несколько —
+        это всё ещё корректная жеребьёвка. Возвращает other.
+        """
+        for candidate in self._sample_draw_pairs(year, rng):
+            other, other_receiver = candidate['santa_user_id'], candidate['receiver_user_id']
+            if other == santa or not (self._draw_pair_allowed(santa, other_receiver, rules)
+                                      and self._draw_pair_allowed(other, receiver, rules)):
+                continue
+            self._query('delete_draw_pairs', (year, santa, other))
+            self._insert_many('insert_pairs', [(santa, other_receiver, year), (other, receiver, year)])
+            return other
+        raise DrawError(f"Не удалось исправить пару {santa} → {receiver} обменом получателей")
+
+    def _splice_into_draw(self, year, user_id, rules, rng):
+        """Встроить игрока в случайную пару a → b: a → user_id → b. Возвращает [a, user_id]."""
+        sampled = False
+        for candidate in self._sample_draw_pairs(year, rng):
+            sampled = True
+            santa, receiver = candidate['santa_user_id'], candidate['receiver_user_id']
+            if user_id in (santa, receiver) or not (self._draw_pair_allowed(santa, user_id, rules)
+                                                    and self._draw_pair_allowed(user_id, receiver, rules)):
+                continue
+            self._query('delete_draw_pairs', (year, santa, santa))
+            self._insert_many('insert_pairs', [(santa, user_id, year), (user_id, receiver, year)])
+            return [santa, user_id]
+        if not sampled:
+            raise ValueError(f"Жеребьёвка {year} года ещё не проведена")
+        raise DrawError(f"Не нашлось пары, в которую можно встроить игрока {user_id}")
+
+    def _refresh_santa_cards(self, santa_ids, year):
+        """Перерисовать карточки назначения этих Сант (пары только что изменились)."""
+        sources = [self._query('get_card_source', (santa_id, year), fetchone=True, record=Pair)
+                   for santa_id in santa_ids]
+        return self._write_cards([source for source in sources if source is not None])
+
+    # === КАРТОЧКИ НАЗНАЧЕНИЯ ===
+
+    def get_assignment_card(self, santa_user_id, year=2025):
+        """
+        Карточка назначения Санты (AssignmentCard или None, если пары нет).
+        Для жеребьёвок, проведённых до появления карточек, карточка
+        строится и сохраняется при первом обращении.
+        """
+        # Если пары нет (например, до жеребьёвки), индекс ответит без запросов
+        index = self.load_pair_index(year)
+        if index is not None and index.receiver_of(santa_user_id) is None:
+            return None
+
+        card = self._query('get_card', (santa_user_id, year), fetchone=True, record=AssignmentCard)
+        if card is not None:
+            return card
+
+        source = self._query('get_card_source', (santa_user_id, year), fetchone=True, record=Pair)
+        if source is None:
+            return None
+        self._write_cards([source])
+        return self._query('get_card', (santa_user_id, year), fetchone=True, record=AssignmentCard)
+
+    def refresh_player_cards(self, user_id, year=None):
+        """
+        Перерисовать карточки года (по умолчанию текущей игры), где игрок —
+        получатель (имя, пожелания) или Санта (имя в приветствии).
+        Это одна-две строки; карточки прошлых лет остаются как были разосланы.
+        """
+        year = year or settings.current().year
+        sources = self._query('get_card_sources_for_player', (user_id, year, user_id, year),
+                              fetchall=True, record=Pair)
+        return self._write_cards(sources) if sources else 0
+
+    def refresh_year_cards(self, year, batch_size=1000):
+        """
+        Перерисовать все карточки года — после изменения дат или бюджета игры
+        и после жеребьёвки в БД. Пары читаются потоком и пишутся пачками.
+        """
+        written = 0
+        batch = []
+        for source in self._iter_query('get_card_sources_for_year', Pair, (year,), batch_size):
+            batch.append(source)
+            if len(batch) == batch_size:
+                written += self._write_cards(batch)
+                batch = []
+        if batch:
+            written += self._write_cards(batch)
+        return written
+
+    def _write_cards(self, sources):
+        """Отрендерить и сохранить карточки по строкам-источникам (Pair)."""
+        rows = [
+            build_card_row(source.santa_user_id, source.year, source.receiver_user_id,
+                           source.santa_name, source.receiver_name, source.wish_list)
+            for source in sources
+        ]
+        return self._insert_many('upsert_cards', rows)
+
+    def _cached_pair_index(self, year, stale=False):
+        """
+        Индекс пар года, только если он уже в памяти и ему можно верить.
+        stale=True — и с истёкшим TTL (когда БД недоступна).
+        """
+        if not self.pair_cache.enabled:
+            return None
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None and unit.is_stale(self.pair_cache, year):
+            return None
+        index = self.pair_cache.get_stale(year) if stale else self.pair_cache.get(year)
+        return None if index is MISSING else index
+
+    def load_pair_index(self, year=2025):
+        """
+        Индекс пар года (cache.PairIndex) — строится одним запросом и кэшируется.
+        None, если индекс выключен или текущая единица работы меняла пары
+        этого года: до commit такой индекс нельзя ни строить, ни использовать.
+        """
+        if not self.pair_cache.enabled:
+            return None
+        unit = getattr(self._local, 'unit', None)
+        if unit is not None and unit.is_stale(self.pair_cache, year):
+            return None
+
+        index = self.pair_cache.get(year)
+        if index is MISSING:
+            generation = self.pair_cache.generation
+            try:
+                pairs = self._query('get_pair_index', (year,), fetchall=True, record=Pair)
+            except Exception as e:
+                if self._is_connection_error(e):
+                    return self._stale_or_raise(self.pair_cache, year, e)
+                raise
+            index = PairIndex(year, pairs)
+            self.pair_cache.set(year, index, generation)
+        return index
+
     def get_santa_pair(self, user_id, year=2025):
         """Получить получателя для данного Санты."""
-        query = '''
-            SELECT p.full_name
-            FROM santa_pairs sp
-            JOIN players p ON sp.receiver_user_id = p.user_id
-            WHERE sp.santa_user_id = ? AND sp.year = ?
-        '''
-        result = self._execute_query(query, (user_id, year), fetchone=True)
+        index = self.load_pair_index(year)
+        if index is not None:
+            return index.name(index.receiver_of(user_id))
+
+        result = self._query('get_santa_pair', (user_id, year), fetchone=True)
         return result['full_name'] if result else None
 
     def get_receiver_pair(self, user_id, year=2025):
         """Узнать, кто был Сантой для данного пользователя."""
-        query = '''
-            SELECT p.full_name
-            FROM santa_pairs sp
-            JOIN players p ON sp.santa_user_id = p.user_id
-            WHERE sp.receiver_user_id = ? AND sp.year = ?
-        '''
-        result = self._execute_query(query, (user_id, year), fetchone=True)
+        index = self.load_pair_index(year)
+        if index is not None:
+            return index.name(index.santa_of(user_id))
+
+        result = self._query('get_receiver_pair', (user_id, year), fetchone=True)
         return result['full_name'] if result else None
 
+    def get_receiver_wishlist(self, user_id, year=2025):
+        """Список пожеланий подопечного данного Санты."""
+        index = self.load_pair_index(year)
+        if index is not None:
+            # Пожелания меняются часто, поэтому берутся из кэша игроков, а не из индекса
+            receiver_id = index.receiver_of(user_id)
+            receiver = self.get_player(receiver_id) if receiver_id is not None else None
+            return (receiver.wish_list or '') if receiver else ''
+
+        result = self._query('get_receiver_wishlist', (user_id, year), fetchone=True)
+        return (result['wish_list'] or '') if result else ''
+
+    def get_pairs_overview(self, year=2025):
+        """Все пары года для админки (Pair с именами, wish_list получателя и revealed)."""
+        return self._query('get_pairs_overview', (year,), fetchall=True, record=Pair)
+
+    def clear_pairs(self, year=2025):
+        """Удалить все пары года (вместе со статусом раскрытия, карточками и журналом)."""
+        with self.unit_of_work():
+            self._query('clear_cards', (year,))
+            self._query('clear_draw_runs', (year,))
+            deleted = self._query('clear_pairs', (year,))
+            self._invalidate_pairs(year)
+        return deleted
+
     # === МЕТОДЫ ДЛЯ РАСКРЫТИЯ ПАР ===
 
     def reveal_pair(self, receiver_user_id, year=2025, by_admin=False):
         """Раскрыть пары: кто был Сантой для получателя."""
         try:
             print(f"🔓 Раскрытие пары для пользователя {receiver_user_id}...")
-            
-            # Проверяем, не раскрыта ли уже пара
-            if self.is_pair_revealed(receiver_user_id, year):
-                print(f"⚠️ Пара для получателя {receiver_user_id} уже раскрыта")
-                return self.get_receiver_pair(receiver_user_id, year)
-
-            # Получаем информацию о паре
-            pair_query = '''
-                SELECT sp.santa_user_id, sp.receiver_user_id
-                FROM santa_pairs sp
-                WHERE sp.receiver_user_id = ? AND sp.year = ?
-            '''
-            pair = self._execute_query(pair_query, (receiver_user_id, year), fetchone=True)
-            
-            if not pair:
-                print(f"❌ Пара для получателя {receiver_user_id} не найдена")
-                return None
-
-            # Сохраняем в таблицу раскрытых пар
-            insert_query = '''
-                INSERT INTO revealed_pairs 
-                (santa_user_id, receiver_user_id, year, revealed_by_admin)
-                VALUES (?, ?, ?, ?)
-            '''
-            self._execute_query(insert_query, 
-                               (pair['santa_user_id'], pair['receiver_user_id'], 
-                                year, by_admin))
-
-            # Возвращаем имя Санты
-            santa = self.get_player(pair['santa_user_id'])
-            santa_name = santa['full_name'] if santa else 'Неизвестно'
-            
+
+            # Отмечаем раскрытие прямо в santa_pairs и сразу получаем имя Санты
+            with self.unit_of_work():
+                row = self._query('reveal_pair', (by_admin, receiver_user_id, year), fetchone=True)
+                if row:
+                    self._invalidate_pairs(year)
+
+            if not row:
+                # Либо пара уже раскрыта, либо её нет вовсе
+                santa_name = self.get_receiver_pair(receiver_user_id, year)
+                if santa_name:
+                    print(f"⚠️ Пара для получателя {receiver_user_id} уже раскрыта")
+                else:
+                    print(f"❌ Пара для получателя {receiver_user_id} не найдена")
+                return santa_name
+
+            santa_name = row['santa_name'] or 'Неизвестно'
             print(f"✅ Пара раскрыта: Санта {santa_name} → Получатель {receiver_user_id}")
             return santa_name
-            
+
         except Exception as e:
             print(f"❌ Ошибка при раскрытии пары: {e}")
             return None
 
     def get_all_pairs_to_reveal(self, year=2025):
         """Получить все пары, которые еще не раскрыты."""
-        query = '''
-            SELECT sp.santa_user_id, sp.receiver_user_id,
-                   santa.full_name as santa_name, receiver.full_name as receiver_name
-            FROM santa_pairs sp
-            JOIN players santa ON sp.santa_user_id = santa.user_id
-            JOIN players receiver ON sp.receiver_user_id = receiver.user_id
-            WHERE sp.year = ?
-              AND NOT EXISTS (
-                  SELECT 1 FROM revealed_pairs rp
-                  WHERE rp.receiver_user_id = sp.receiver_user_id 
-                    AND rp.year = sp.year
-              )
-            ORDER BY santa.full_name
-        '''
-        result = self._execute_query(query, (year,), fetchall=True)
-        
-        if result and isinstance(result[0], dict):
-            return [(row['santa_user_id'], row['receiver_user_id'], 
-                     row['santa_name'], row['receiver_name']) for row in result]
-        return result or []
+        return self._query('get_all_pairs_to_reveal', (year,), fetchall=True, record=Pair)
 
     def reveal_all_pairs(self, year=2025, by_admin=False):
-        """Раскрыть все пары сразу."""
+        """
+        Раскрыть все пары сразу одним UPDATE.
+        Возвращает список только что раскрытых пар (Pair с
+        santa_user_id, receiver_user_id, santa_name, receiver_name).
+        """
         try:
             print(f"🔓 Раскрытие всех пар для {year} года...")
-            pairs = self.get_all_pairs_to_reveal(year)
-            
-            if not pairs:
+
+            with self.unit_of_work():
+                revealed = self._query('reveal_all_pairs', (by_admin, year), fetchall=True, record=Pair)
+                if revealed:
+                    self._invalidate_pairs(year)
+
+            if not revealed:
                 print("ℹ️ Нет пар для раскрытия")
-                return 0
-
-            revealed_count = 0
-            for santa_id, receiver_id, santa_name, receiver_name in pairs:
-                if not self.is_pair_revealed(receiver_id, year):
-                    insert_query = '''
-                        INSERT INTO revealed_pairs 
-                        (santa_user_id, receiver_user_id, year, revealed_by_admin)
-                        VALUES (?, ?, ?, ?)
-                    '''
-                    if self.db_type == 'postgresql':
-                        insert_query = insert_query.replace('?', '%s')
-                    
-                    self._execute_query(insert_query, (santa_id, receiver_id, year, by_admin))
-                    revealed_count += 1
-
-            print(f"✅ Раскрыто {revealed_count} пар")
-            return revealed_count
+            else:
+                print(f"✅ Раскрыто {len(revealed)} пар")
+            return revealed
 
         except Exception as e:
             print(f"❌ Ошибка при раскрытии всех пар: {e}")
-            return 0
+            return []
 
     def is_pair_revealed(self, receiver_user_id, year=2025):
         """Проверить, раскрыта ли пара для получателя."""
-        query = '''
-            SELECT id FROM revealed_pairs
-            WHERE receiver_user_id = ? AND year = ?
-        '''
-        result = self._execute_query(query, (receiver_user_id, year), fetchone=True)
+        index = self.load_pair_index(year)
+        if index is not None:
+            return index.is_revealed(receiver_user_id)
+
+        result = self._query('is_pair_revealed', (receiver_user_id, year), fetchone=True)
         return result is not None
 
     # === ВСПОМОГАТЕЛЬНЫЕ МЕТОДЫ ===
 
-    def get_player_stats(self):
-        """Получить статистику по игрокам."""
+    def get_player_stats(self, year=2025):
+        """
+        Статистика игры одним чтением счётчиков: игроки (всего, активные,
+        с пожеланиями) и пары года (всего, раскрыто, уведомлено).
+        Счётчики обновляются триггерами в той же транзакции, что и запись.
+        """
+        empty = {
+            'total_players': 0, 'active_players': 0, 'players_with_wishlist': 0,
+            'total_pairs': 0, 'total_revealed': 0, 'total_notified': 0,
+        }
         try:
-            total_players_result = self._execute_query(
-                'SELECT COUNT(*) as count FROM players', 
-                fetchone=True
-            )
-            total_players = total_players_result['count'] if total_players_result else 0
-            
-            total_pairs_result = self._execute_query(
-                'SELECT COUNT(*) as count FROM santa_pairs WHERE year = 2025', 
-                fetchone=True
-            )
-            total_pairs = total_pairs_result['count'] if total_pairs_result else 0
-            
-            total_revealed_result = self._execute_query(
-                'SELECT COUNT(*) as count FROM revealed_pairs WHERE year = 2025', 
-                fetchone=True
-            )
-            total_revealed = total_revealed_result['count'] if total_revealed_result else 0
-
+            row = self._query('get_game_stats', (year,), fetchone=True)
+            if not row:
+                return empty
             return {
-                'total_players': total_players,
-                'total_pairs': total_pairs,
-                'total_revealed': total_revealed
+                'total_players': row['players'],
+                'active_players': row['active_players'],
+                'players_with_wishlist': row['players_with_wishlist'],
+                'total_pairs': row['pairs'],
+                'total_revealed': row['revealed'],
+                'total_notified': row['notified'],
             }
         except Exception as e:
             print(f"❌ Ошибка при получении статистики: {e}")
-            return {'total_players': 0, 'total_pairs': 0, 'total_revealed': 0}
+            return empty
 
     def mark_as_notified(self, user_id, year=2025):
         """Пометить пару как уведомленную."""
-        if self.db_type == 'postgresql':
-            query = '''
-                UPDATE santa_pairs
-                SET is_notified = TRUE
-                WHERE santa_user_id = %s AND year = %s
-            '''
-        else:
-            query = '''
-                UPDATE santa_pairs
-                SET is_notified = 1
-                WHERE santa_user_id = ? AND year = ?
-            '''
-        
-        self._execute_query(query, (user_id, year))
+        self._query('mark_as_notified', (user_id, year))
+
+    def mark_many_as_notified(self, user_ids, year=2025):
+        """Пометить пары пачки Сант уведомленными одним UPDATE. Возвращает число строк."""
+        user_ids = list(user_ids)
+        if not user_ids:
+            return 0
+        ids = json.dumps(user_ids) if self.db_type == 'sqlite' else user_ids
+        return self._query('mark_many_as_notified', (year, ids))
 
     def get_unnotified_pairs(self, year=2025):
-        """Получить все неуведомленные пары."""
-        if self.db_type == 'postgresql':
-            query = '''
-                SELECT sp.santa_user_id, p.full_name
-                FROM santa_pairs sp
-                JOIN players p ON sp.receiver_user_id = p.user_id
-                WHERE sp.year = %s AND sp.is_notified = FALSE
-                ORDER BY p.full_name
-            '''
-        else:
-            query = '''
-                SELECT sp.santa_user_id, p.full_name
-                FROM santa_pairs sp
-                JOIN players p ON sp.receiver_user_id = p.user_id
-                WHERE sp.year = ? AND sp.is_notified = 0
-                ORDER BY p.full_name
-            '''
-        
-        result = self._execute_query(query, (year,), fetchall=True)
-        if result and isinstance(result[0], dict):
-            return [(row['santa_user_id'], row['full_name']) for row in result]
-        return result or []
+        """
+        Получить все неуведомленные пары (Pair: id и имена Санты и получателя,
+        пожелания получателя).
+        """
+        return self._query('get_unnotified_pairs', (year,), fetchall=True, record=Pair)
+
+    def iter_unnotified_pairs(self, year=2025, batch_size=500):
+        """Неуведомленные пары потоком (для рассылки по всему составу)."""
+        return self._iter_query('get_unnotified_pairs', Pair, (year,), batch_size=batch_size)
+
+    def get_unnotified_cards(self, year=2025, after=0, limit=100):
+        """
+        Страница карточек назначения неуведомленных пар (AssignmentCard)
+        с santa_user_id > after по возрастанию. message_text равен None,
+        если карточка для пары не сохранена. Рассылка читает страницами,
+        а не потоком, чтобы не держать подключение, пока ждёт Telegram.
+        """
+        return self._query('get_unnotified_cards_page', (year, after, limit), fetchall=True, record=AssignmentCard)
 
     def get_all_players_with_wishlists(self):
         """Получить всех игроков с их wishlist."""
-        query = '''
-            SELECT user_id, full_name, username, wish_list
-            FROM players
-            WHERE is_active = TRUE AND wish_list IS NOT NULL AND wish_list != ''
-            ORDER BY full_name
-        '''
-        return self._execute_query(query, fetchall=True) or []
+        return self._query('get_all_players_with_wishlists', fetchall=True, record=Player)
 
     def test_connection(self):
         """Тест подключения к базе данных."""
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor()
-            
+            version = self._query('server_version', fetchone=True)['version']
             if self.db_type == 'postgresql':
-                cursor.execute("SELECT version();")
-                version = cursor.fetchone()['version']
                 print(f"✅ PostgreSQL подключена. Версия: {version}")
             else:
-                cursor.execute("SELECT sqlite_version();")
-                version = cursor.fetchone()[0]
                 print(f"✅ SQLite подключена. Версия: {version}")
-            
-            cursor.close()
-            conn.close()
             return True
         except Exception as e:
             print(f"❌ Ошибка тестирования подключения: {e}")
@@ -688,71 +2177,250 @@ class Database:
             print(f"❌ Ошибка проверки constraints: {e}")
             return None
 
+    # Горячие запросы бота (имя в реестре → пример параметров), обязаны идти по индексу
+    HOT_QUERY_PLANS = {
+        'get_player': (1,),
+        'get_player_by_name': ('Тест',),
+        'get_all_active_players': None,
+        'get_santa_pair': (1, 2025),
+        'get_receiver_pair': (1, 2025),
+        'is_pair_revealed': (1, 2025),
+        'mark_as_notified': (1, 2025),
+        'get_unnotified_pairs': (2025,),
+        'get_unnotified_cards_page': (2025, 0, 100),
+        'get_card': (1, 2025),
+        'get_card_sources_for_player': (1, 2025, 1, 2025),
+        'get_player_dashboard': (2025, 2025, 1),
+        'get_pair_index': (2025,),
+    }
+
+    def check_query_plans(self):
+        """
+        Проверить планы горячих запросов через EXPLAIN.
+        Возвращает {имя запроса: (идёт ли по индексу, план)}.
+        Имеет смысл на заполненной базе: на пустых таблицах
+        PostgreSQL честно выбирает последовательное чтение.
+        """
+        if self.db_type == 'postgresql':
+            explain = 'EXPLAIN (FORMAT JSON) '
+        else:
+            explain = 'EXPLAIN QUERY PLAN '
+
+        report = {}
+        for name, params in self.HOT_QUERY_PLANS.items():
+            rows = self._run(explain + self.queries[name].sql, params, fetchall=True)
+            if self.db_type == 'postgresql':
+                plan = rows[0]['QUERY PLAN'][0]['Plan']
+                nodes = self._collect_plan_nodes(plan)
+                uses_index = 'Seq Scan' not in nodes
+                plan_text = ' → '.join(nodes)
+            else:
+                details = [row['detail'] for row in rows]
+                uses_index = not any(
+                    detail.startswith('SCAN') and 'USING' not in detail for detail in details
+                )
+                plan_text = '; '.join(details)
+
+            report[name] = (uses_index, plan_text)
+            status = "✅" if uses_index else "❌"
+            print(f"{status} {name}: {plan_text}")
+
+        return report
+
+    @staticmethod
+    def _collect_plan_nodes(plan):
+        """Список типов узлов плана PostgreSQL (обход в глубину)."""
+        nodes = [plan['Node Type']]
+        for child in plan.get('Plans', []):
+            nodes.extend(Database._collect_plan_nodes(child))
+        return nodes
+
+    # === НАСТРОЙКИ ИГРЫ ===
+
+    def get_settings_version(self):
+        """Номер версии настроек игры — одно чтение по первичному ключу."""
+        row = self._query('get_settings_version', fetchone=True)
+        return row['version'] if row else 0
+
+    def get_game_settings(self):
+        """
+        Сохранённые настройки игры: (версия, {ключ: значение строкой}).
+        Версия читается первой: значения не старше неё, а если между
+        чтениями настройки изменили, следующая проверка версии их перечитает.
+        """
+        version = self.get_settings_version()
+        rows = self._query('get_game_settings', fetchall=True)
+        return version, {row['key']: row['value'] for row in rows}
+
+    def save_game_settings(self, values):
+        """Записать настройки {ключ: строка} и увеличить версию одной транзакцией. Возвращает версию."""
+        with self.unit_of_work():
+            for key, value in values.items():
+                self._query('upsert_game_setting', (key, value))
+            row = self._query('bump_settings_version', fetchone=True)
+        return row['version']
+
+    # === РАЗМЕРЫ ТАБЛИЦ ===
+
+    # Байты таблиц и их индексов по страницам (виртуальная таблица dbstat)
+    SQLITE_OBJECT_SIZES = '''
+        SELECT m.tbl_name AS name,
+               SUM(CASE WHEN m.type = 'table' THEN s.pgsize ELSE 0 END) AS table_bytes,
+               SUM(CASE WHEN m.type = 'index' THEN s.pgsize ELSE 0 END) AS index_bytes
+        FROM dbstat s
+        JOIN sqlite_master m ON m.name = s.name
+        GROUP BY m.tbl_name
+    '''
+
+    def get_table_sizes(self):
+        """
+        Размеры таблиц без COUNT(*) — список TableSize.
+
+        estimated_rows — оценка: pg_class.reltuples в PostgreSQL, счётчики
+        статистики (roster_stats, year_stats) в SQLite. table_bytes и
+        index_bytes в PostgreSQL читаются сразу, в SQLite — из последнего
+        пересчёта. exact_rows и counted_at — итог последнего точного
+        пересчёта (start_table_recount), если он был.
+        """
+        tables = self._query('table_sizes', fetchall=True, record=TableSize)
+        estimates = {}
+        if self.db_type == 'sqlite':
+            counters = self._query('table_counters', fetchone=True)
+            if counters:
+                estimates = {'players': counters['players'], 'santa_pairs': counters['santa_pairs']}
+
+        with self._table_recount_lock:
+            counted = dict(self._table_counts)
+
+        for table in tables:
+            last = counted.get(table.name)
+            if last is not None:
+                table.exact_rows = last.exact_rows
+                table.counted_at = last.counted_at
+                if table.table_bytes is None:
+                    table.table_bytes = last.table_bytes
+                    table.index_bytes = last.index_bytes
+            if self.db_type == 'sqlite':
+                table.estimated_rows = estimates.get(table.name, table.exact_rows)
+        return tables
+
+    def recount_tables(self):
+        """
+        Точный COUNT(*) по каждой таблице (в SQLite — и размеры на диске).
+        Итог запоминается для get_table_sizes. Может идти долго —
+        из обработчиков бота вызывайте start_table_recount.
+        """
+        sizes = self._sqlite_object_sizes() if self.db_type == 'sqlite' else {}
+        tables = self._query('table_sizes', fetchall=True, record=TableSize)
+
+        for table in tables:
+            row = self._run(f'SELECT COUNT(*) AS count FROM "{table.name}"', fetchone=True, readonly=True)
+            table.exact_rows = row['count']
+            table.estimated_rows = table.exact_rows
+            table.counted_at = datetime.now()
+            if table.name in sizes:
+                table.table_bytes, table.index_bytes = sizes[table.name]
+            with self._table_recount_lock:
+                self._table_counts[table.name] = table
+        return tables
+
+    def start_table_recount(self, on_done=None):
+        """
+        Запустить recount_tables в фоновом потоке.
+        Возвращает False, если пересчёт уже идёт. on_done(tables) вызывается
+        из фонового потока по завершении (tables=None при ошибке).
+        """
+        with self._table_recount_lock:
+            if self._table_recount_running:
+                return False
+            self._table_recount_running = True
+
+        thread = threading.Thread(target=self._table_recount_job, args=(on_done,),
+                                  name='table-recount', daemon=True)
+        thread.start()
+        return True
+
+    def _table_recount_job(self, on_done):
+        tables = None
+        try:
+            tables = self.recount_tables()
+            print(f"✅ Пересчёт таблиц завершён: {len(tables)} таблиц")
+        except Exception as e:
+            print(f"❌ Ошибка пересчёта таблиц: {e}")
+        finally:
+            with self._table_recount_lock:
+                self._table_recount_running = False
+            self.release_thread_connections()
+
+        if on_done is not None:
+            on_done(tables)
+
+    def _sqlite_object_sizes(self):
+        """{таблица: (байт в таблице, байт в индексах)}; пусто, если SQLite собран без dbstat."""
+        conn = self.get_connection(readonly=True)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(self.SQLITE_OBJECT_SIZES)
+            return {row['name']: (row['table_bytes'], row['index_bytes']) for row in cursor.fetchall()}
+        except Exception as e:
+            logger.info(f"ℹ️ Размеры таблиц SQLite недоступны: {e}")
+            return {}
+        finally:
+            cursor.close()
+            conn.close()
+
     # === МЕТОДЫ ДЛЯ УДАЛЕНИЯ ИГРОКОВ ===
 
     def delete_player(self, user_id):
-        """Безопасное удаление игрока с очисткой связанных записей."""
+        """
+        Безопасное удаление игрока с очисткой связанных записей.
+        Возвращает DrawChange (см. remove_from_draw) или None при ошибке.
+        """
         try:
             print(f"🗑️ Удаление игрока {user_id} и всех связанных записей...")
             
-            if self.db_type == 'postgresql':
-                # 1. Сначала удаляем из revealed_pairs
-                self._execute_query('''
-                    DELETE FROM revealed_pairs 
-                    WHERE santa_user_id = %s OR receiver_user_id = %s
-                ''', (user_id, user_id))
-                
-                # 2. Затем из santa_pairs  
-                self._execute_query('''
-                    DELETE FROM santa_pairs 
-                    WHERE santa_user_id = %s OR receiver_user_id = %s
-                ''', (user_id, user_id))
-                
-                # 3. И только потом из players
-                self._execute_query('DELETE FROM players WHERE user_id = %s', (user_id,))
-                
-            else:
-                # SQLite версия
-                self._execute_query('''
-                    DELETE FROM revealed_pairs 
-                    WHERE santa_user_id = ? OR receiver_user_id = ?
-                ''', (user_id, user_id))
-                
-                self._execute_query('''
-                    DELETE FROM santa_pairs 
-                    WHERE santa_user_id = ? OR receiver_user_id = ?
-                ''', (user_id, user_id))
-                
-                self._execute_query('DELETE FROM players WHERE user_id = ?', (user_id,))
+            with self.unit_of_work():
+                # Его Санта получает его подопечного — остальные пары года не меняются.
+                # Если правила этого не позволяют, Санта остаётся без подопечного
+                change = self.remove_from_draw(user_id, strict=False)
+                # Сначала карточки и пары (вместе со статусом раскрытия), потом сам игрок
+                self._query('delete_player_cards', (user_id, user_id))
+                self._query('delete_player_pairs', (user_id, user_id))
+                self._query('delete_player_exclusions', (user_id, user_id))
+                self._query('delete_player', (user_id,))
+                self._invalidate_player(user_id)
+                self._invalidate_pairs()
             
             print(f"✅ Игрок {user_id} и все связанные записи удалены")
-            return True
+            self._report_unassigned(change)
+            return change
             
         except Exception as e:
             print(f"❌ Ошибка при удалении игрока {user_id}: {e}")
-            return False
+            return None
+
+    @staticmethod
+    def _report_unassigned(change):
+        """Напомнить, что после выхода игрока жеребьёвка осталась неполной."""
+        if change.unassigned_santa is not None:
+            print(f"⚠️ Без подопечного: {change.unassigned_santa}, без Санты: {change.orphan_receiver} — "
+                  f"нужна новая жеребьёвка или ослабление правил")
 
     def deactivate_player(self, user_id):
-        """Деактивировать игрока (мягкое удаление)."""
+        """
+        Деактивировать игрока (мягкое удаление) и вывести его из жеребьёвки.
+        Возвращает DrawChange (см. remove_from_draw) или None при ошибке.
+        """
         try:
             print(f"👤 Деактивация игрока {user_id}...")
-            
-            if self.db_type == 'postgresql':
-                self._execute_query('''
-                    UPDATE players 
-                    SET is_active = FALSE 
-                    WHERE user_id = %s
-                ''', (user_id,))
-            else:
-                self._execute_query('''
-                    UPDATE players 
-                    SET is_active = 0 
-                    WHERE user_id = ?
-                ''', (user_id,))
-            
+            with self.unit_of_work():
+                change = self.remove_from_draw(user_id, strict=False)
+                self._query('deactivate_player', (user_id,))
+                self._invalidate_player(user_id)
             print(f"✅ Игрок {user_id} деактивирован")
-            return True
+            self._report_unassigned(change)
+            return change
             
         except Exception as e:
             print(f"❌ Ошибка при деактивации игрока {user_id}: {e}")
-            return False
+            return None
@@ -0,0 +1,419 @@
+"""
+Алгоритмы жеребьёвки: кто кому дарит.
+
+Стратегия получает список участников и генератор случайных чисел и
+возвращает словарь {Санта: получатель} — перестановку без неподвижных
+точек (никто не дарит сам себе). Обе стратегии работают за O(n) без
+перезапусков «перемешать и проверить» и не могут завершиться неудачей
+при двух и более участниках. Генератор создаётся по seed, поэтому
+любую жеребьёвку можно воспроизвести.
+
+Ограничения (Constraints) — запрещённые пары «Санта → получатель»:
+исключения вроде супругов, пары прошлых лет, игроки одной команды.
+С ограничениями результат стратегии чинится обменами получателей, а
+если это не удаётся — достраивается поиском увеличивающих путей
+(паросочетание в двудольном графе «Санта — получатель»). Когда
+допустимой жеребьёвки нет, поднимается DrawConstraintError со списком
+игроков, которым не подобрать получателя.
+
+    cycle        — один общий круг (алгоритм Саттоло): цепочка подарков
+                   проходит через всех, без замкнутых пар и троек;
+    derangement  — равновероятная перестановка без неподвижных точек
+                   (Martínez, Panholzer, Prodinger, 2008): то же
+                   распределение, что у прежнего «мешать, пока никто
+                   не вытянул себя», но без повторов.
+
+Диагностика: python bench_draw.py — время от 10 до 1 000 000 участников
+и проверка равномерности χ² на малых n.
+"""
+import random
+import time
+from collections import deque
+
+
+# Сколько случайных партнёров для обмена пробовать на одно нарушение
+REPAIR_ATTEMPTS = 64
+
+
+class DrawError(Exception):
+    """Жеребьёвку с такими участниками провести нельзя."""
+
+
+class DrawConstraintError(DrawError):
+    """Ограничения не оставляют допустимой жеребьёвки; players — кому не подобрать получателя."""
+
+    def __init__(self, message, players=()):
+        super().__init__(message)
+        self.players = list(players)
+
+
+class Constraints:
+    """
+    Запреты «Санта → получатель»: отдельные пары (в том числе пары
+    прошлых лет) и команды, внутри которых не дарят.
+    """
+
+    def __init__(self):
+        self._forbidden = {}  # Санта → множество запрещённых получателей
+        self._teams = {}      # участник → команда
+
+    def forbid(self, santa, receiver):
+        """Санта не может дарить этому получателю."""
+        self._forbidden.setdefault(santa, set()).add(receiver)
+
+    def forbid_mutual(self, a, b):
+        """Двое не дарят друг другу ни в одну сторону (пара, родственники)."""
+        self.forbid(a, b)
+        self.forbid(b, a)
+
+    def set_team(self, player, team):
+        """Участники одной команды не дарят друг другу."""
+        if team:
+            self._teams[player] = team
+
+    def team_of(self, player):
+        return self._teams.get(player)
+
+    def allows(self, santa, receiver):
+        if santa == receiver:
+            return False
+        forbidden = self._forbidden.get(santa)
+        if forbidden is not None and receiver in forbidden:
+            return False
+        team = self._teams.get(santa)
+        return team is None or team != self._teams.get(receiver)
+
+    def __bool__(self):
+        return bool(self._forbidden or self._teams)
+
+    def __repr__(self):
+        pairs = sum(len(receivers) for receivers in self._forbidden.values())
+        return f"Constraints(forbidden={pairs}, team_members={len(self._teams)})"
+
+
+class DrawStrategy:
+    """Интерфейс стратегии жеребьёвки."""
+
+    name = None
+
+    def assign(self, participants, rng, constraints=None):
+        """
+        {Санта: получатель} для списка различных участников (минимум двое),
+        с учётом ограничений, если они заданы.
+        """
+        participants = list(participants)
+        self._check(participants)
+        assignment = self._generate(participants, rng)
+        if not constraints:
+            return assignment
+        return self._satisfy(participants, assignment, constraints, rng)
+
+    def _generate(self, participants, rng):
+        raise NotImplementedError
+
+    def _satisfy(self, participants, assignment, constraints, rng):
+        """Починить нарушения обменами, остальное — увеличивающими путями."""
+        unresolved = repair_by_swaps(participants, assignment, constraints, rng)
+        if unresolved:
+            complete_matching(participants, assignment, unresolved, constraints)
+        return assignment
+
+    def _check(self, participants):
+        if len(participants) < 2:
+            raise DrawError("Для жеребьёвки нужно минимум 2 участника")
+        if len(set(participants)) != len(participants):
+            raise DrawError("Участники жеребьёвки повторяются")
+
+
+class SingleCycleStrategy(DrawStrategy):
+    """Равновероятный единый цикл (Саттоло): ровно n - 1 обменов."""
+
+    name = 'cycle'
+
+    def _generate(self, participants, rng):
+        receivers = participants.copy()
+        randrange = rng.randrange
+        # Фишер–Йетс, где j < i строго: получается перестановка из одного цикла
+        for i in range(len(receivers) - 1, 0, -1):
+            j = randrange(i)
+            receivers[i], receivers[j] = receivers[j], receivers[i]
+        return dict(zip(participants, receivers))
+
+    def _satisfy(self, participants, assignment, constraints, rng):
+        """
+        Чинит круг перестановками участников внутри него. Если один круг
+        с такими ограничениями не собрать, пары достраиваются как у
+        derangement — несколькими кругами.
+        """
+        ring = [participants[0]]
+        while len(ring) < len(participants):
+            ring.append(assignment[ring[-1]])
+        if repair_ring(ring, constraints, rng):
+            return {ring[k - 1]: ring[k] for k in range(len(ring))}
+
+        print("⚠️ Один общий круг с такими ограничениями не найден — пары разбиты на несколько кругов")
+        assignment = {ring[k - 1]: ring[k] for k in range(len(ring))}
+        return super()._satisfy(participants, assignment, constraints, rng)
+
+
+class DerangementStrategy(DrawStrategy):
+    """
+    Равновероятная перестановка без неподвижных точек.
+
+    Обмены как у Фишера–Йетса, но элемент может «закрыть цикл» с
+    вероятностью (u-1)·D(u-2)/D(u), где D — число беспорядков. Каждый
+    шаг проходит один элемент, ожидаемое число случайных чисел ≤ 2n,
+    а вероятность бесконечной работы равна нулю.
+    """
+
+    name = 'derangement'
+
+    def _generate(self, participants, rng):
+        n = len(participants)
+
+        # d[k] = D(k) / k! — без огромных целых; (u-1)·D(u-2)/D(u) = d[u-2] / (u·d[u])
+        d = [1.0, 0.0]
+        factorial_inverse = 1.0
+        for k in range(2, n + 1):
+            factorial_inverse /= k
+            d.append(d[-1] + (factorial_inverse if k % 2 == 0 else -factorial_inverse))
+
+        perm = list(range(n))
+        marked = [False] * n
+        randrange = rng.randrange
+        uniform = rng.random
+        i = n - 1
+        unmarked = n
+        while unmarked >= 2:
+            if not marked[i]:
+                j = randrange(i)
+                while marked[j]:
+                    j = randrange(i)
+                perm[i], perm[j] = perm[j], perm[i]
+                if uniform() < d[unmarked - 2] / (unmarked * d[unmarked]):
+                    marked[j] = True
+                    unmarked -= 1
+                unmarked -= 1
+            i -= 1
+
+        return {participants[k]: participants[perm[k]] for k in range(n)}
+
+
+def repair_by_swaps(participants, assignment, constraints, rng, attempts=REPAIR_ATTEMPTS):
+    """
+    Для каждого Санты с запрещённым получателем ищет случайного партнёра,
+    с которым можно обменяться получателями. Перестановка остаётся
+    перестановкой. Возвращает Сант, которых так починить не удалось.
+    """
+    allows = constraints.allows
+    n = len(participants)
+    unresolved = []
+    for santa in participants:
+        if allows(santa, assignment[santa]):
+            continue
+        for _ in range(attempts):
+            other = participants[rng.randrange(n)]
+            mine, theirs = assignment[santa], assignment[other]
+            if allows(santa, theirs) and allows(other, mine):
+                assignment[santa], assignment[other] = theirs, mine
+                break
+        else:
+            unresolved.append(santa)
+    return unresolved
+
+
+def repair_ring(ring, constraints, rng, attempts=REPAIR_ATTEMPTS):
+    """
+    Переставляет участников внутри круга ring (ring[k-1] дарит ring[k]),
+    пока все переходы не станут допустимыми. True, если получилось.
+    """
+    allows = constraints.allows
+    n = len(ring)
+
+    def valid_around(*positions):
+        for k in positions:
+            if not allows(ring[k - 1], ring[k]) or not allows(ring[k], ring[(k + 1) % n]):
+                return False
+        return True
+
+    for k in range(n):
+        if allows(ring[k - 1], ring[k]):
+            continue
+        for _ in range(attempts):
+            j = rng.randrange(n)
+            ring[k], ring[j] = ring[j], ring[k]
+            if valid_around(k, j):
+                break
+            ring[k], ring[j] = ring[j], ring[k]
+        else:
+            return False
+    return all(allows(ring[k - 1], ring[k]) for k in range(n))
+
+
+def complete_matching(participants, assignment, free_santas, constraints):
+    """
+    Достраивает паросочетание Санта → получатель увеличивающими путями.
+
+    Получатели free_santas освобождаются, и для каждого свободного Санты
+    поиск в глубину ищет цепочку переназначений до свободного получателя.
+    Поиски идут фазами: внутри фазы каждый получатель посещается не
+    больше одного раза, так что найденные цепочки не пересекаются, а
+    фаза стоит O(n + число запретов-пар). Граф допустимых пар почти
+    полный, поэтому он не строится: кандидаты берутся из ещё не
+    посещённых получателей, разложенных по командам, и команда Санты
+    пропускается целиком.
+    Если за фазу не нашлось ни одной цепочки, полной жеребьёвки не
+    существует (теорема Бержа) — DrawConstraintError со списком
+    оставшихся Сант.
+    """
+    allows = constraints.allows
+    team_of = constraints.team_of
+    for santa in free_santas:
+        del assignment[santa]
+    owner = {receiver: santa for santa, receiver in assignment.items()}
+    free_receivers = set(participants) - set(owner)
+
+    def next_receiver(santa, pools):
+        """Ещё не посещённый допустимый получатель (снимается с пула) или None."""
+        team = team_of(santa)
+        for key in list(pools):
+            if key is not None and key == team:
+                continue
+            pool = pools[key]
+            skipped = []
+            found = None
+            while pool:
+                receiver = pool.pop()
+                if allows(santa, receiver):
+                    found = receiver
+                    break
+                skipped.append(receiver)
+            pool.extend(skipped)
+            if not pool:
+                del pools[key]
+            if found is not None:
+                return found
+        return None
+
+    free = list(free_santas)
+    while free:
+        pools = {}  # команда (None — без команды) → ещё не посещённые получатели
+        for receiver in participants:
+            pools.setdefault(team_of(receiver), []).append(receiver)
+
+        unmatched = []
+        for start in free:
+            # stack[i] претендует на receivers[i], которым сейчас владеет stack[i + 1]
+            stack, receivers = [start], []
+            while stack:
+                receiver = next_receiver(stack[-1], pools)
+                if receiver is None:
+                    stack.pop()
+                    if receivers:
+                        receivers.pop()
+                    continue
+                receivers.append(receiver)
+                if receiver in free_receivers:
+                    break
+                stack.append(owner[receiver])
+
+            if not stack:
+                unmatched.append(start)
+                continue
+            for santa, receiver in zip(stack, receivers):
+                assignment[santa] = receiver
+                owner[receiver] = santa
+            free_receivers.discard(receivers[-1])
+
+        if len(unmatched) == len(free):
+            raise DrawConstraintError(
+                f"Ограничения не позволяют провести жеребьёвку: для {len(unmatched)} "
+                f"участник(ов) не найти получателя", unmatched)
+        free = unmatched
+    return assignment
+
+
+STRATEGIES = {strategy.name: strategy for strategy in (SingleCycleStrategy, DerangementStrategy)}
+
+
+def get_strategy(name):
+    """Стратегия по имени ('cycle' или 'derangement')."""
+    try:
+        return STRATEGIES[name]()
+    except KeyError:
+        raise ValueError(f"Неизвестная стратегия жеребьёвки: {name!r}. "
+                         f"Доступны: {', '.join(STRATEGIES)}") from None
+
+
+def new_seed():
+    """Случайный seed из системного источника — его стоит записать в лог."""
+    return random.SystemRandom().getrandbits(63)
+
+
+def draw(participants, strategy='derangement', seed=None, constraints=None):
+    """
+    Провести жеребьёвку: {Санта: получатель}.
+    Одинаковые участники (в том же порядке), стратегия, seed и ограничения
+    дают одинаковый результат.
+    """
+    if isinstance(strategy, str):
+        strategy = get_strategy(strategy)
+    rng = random.Random(new_seed() if seed is None else seed)
+    return strategy.assign(participants, rng, constraints)
+
+
+def is_valid_assignment(participants, assignment, constraints=None):
+    """Каждый дарит ровно одному другому, получает ровно от одного, запреты соблюдены."""
+    allows = constraints.allows if constraints else (lambda santa, receiver: santa != receiver)
+    participants = set(participants)
+    return (set(assignment) == participants
+            and set(assignment.values()) == participants
+            and len(set(assignment.values())) == len(assignment)
+            and all(allows(santa, receiver) for santa, receiver in assignment.items()))
+
+
+def count_cycles(assignment):
+    """Число циклов дарения (у стратегии cycle всегда 1)."""
+    seen = set()
+    cycles = 0
+    for start in assignment:
+        if start in seen:
+            continue
+        cycles += 1
+        current = start
+        while current not in seen:
+            seen.add(current)
+            current = assignment[current]
+    return cycles
+
+
+def benchmark(sizes=(10, 100, 1_000, 10_000, 100_000, 1_000_000), seed=2025):
+    """Время каждой стратегии на n участников: {(стратегия, n): секунды}."""
+    results = {}
+    for n in sizes:
+        participants = list(range(n))
+        for name in STRATEGIES:
+            started = time.perf_counter()
+            assignment = draw(participants, name, seed)
+            results[(name, n)] = time.perf_counter() - started
+            assert is_valid_assignment(participants, assignment)
+    return results
+
+
+def uniformity(strategy, n=4, samples=90_000, seed=2025):
+    """
+    Проверка равномерности: как часто выпадает каждая перестановка
+    на n участниках. Возвращает (число разных исходов, статистика χ²).
+    """
+    rng = random.Random(seed)
+    strategy = get_strategy(strategy)
+    participants = list(range(n))
+    counts = {}
+    for _ in range(samples):
+        assignment = strategy.assign(participants, rng)
+        key = tuple(assignment[p] for p in participants)
+        counts[key] = counts.get(key, 0) + 1
+    expected = samples / len(counts)
+    chi_square = sum((count - expected) ** 2 / expected for count in counts.values())
+    return len(counts), chi_square
+
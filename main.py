@@ -3,10 +3,14 @@ import telebot
 from telebot import types
 from datetime import date
 import config
-from database import Database
+from database import Database, DatabaseUnavailable
+from draw_engine import DrawConstraintError
+import settings
+from settings import format_day
 from flask import Flask, request
 import time
 import logging
+import functools
 
 # ================ ИНИЦИАЛИЗАЦИЯ ================
 print("=" * 60)
@@ -41,16 +45,21 @@ try:
     db = Database()
     db_type = getattr(db, 'db_type', 'unknown')
     print(f"✅ База данных инициализирована. Тип: {db_type}")
+    # Настройки игры (даты, бюджет) — из game_settings, изменения подхватываются без перезапуска
+    settings.configure(db)
+    game = settings.current()
+    # Пары текущего года сразу в память: /status и /reveal отвечают без запросов
+    pair_index = db.load_pair_index(game.year)
+    if pair_index is not None:
+        print(f"🗂️ Индекс пар {game.year}: {len(pair_index)} пар")
 except Exception as e:
     print(f"❌ Ошибка базы данных: {e}")
     raise
 
 user_states = {}
 
-# НАСТРОЙКИ ДЛЯ РАСКРЫТИЯ
-REVEAL_YEAR = 2025
-REVEAL_MONTH = 12
-REVEAL_DAY = 31
+# Результатов поиска игроков на одной странице
+SEARCH_PAGE_SIZE = 10
 
 print("=" * 60)
 print("✅ ВСЕ КОМПОНЕНТЫ ИНИЦИАЛИЗИРОВАНЫ")
@@ -58,29 +67,39 @@ print("=" * 60)
 
 # ================ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ================
 def get_player_field(player, field_name, default_value=''):
-    """Безопасное получение поля игрока из dict или tuple"""
+    """Безопасное получение поля игрока (records.Player)"""
     if not player:
         return default_value
-    
-    if isinstance(player, dict):
-        return player.get(field_name, default_value)
-    else:
-        # Маппинг полей на индексы для tuple (старая SQLite версия)
-        field_map = {
-            'id': 0,
-            'user_id': 1,
-            'username': 2,
-            'full_name': 3,
-            'telegram_name': 4,
-            'wish_list': 5,
-            'registration_date': 6,
-            'is_active': 7
-        }
-        idx = field_map.get(field_name)
-        if idx is not None and len(player) > idx:
-            value = player[idx]
-            return value if value is not None else default_value
-        return default_value
+    value = getattr(player, field_name, None)
+    return value if value is not None else default_value
+
+def with_unit_of_work(handler):
+    """
+    Все обращения к БД внутри обработчика идут через одно подключение и одну транзакцию.
+    Если БД недоступна (и данных нет в кэше), пользователь сразу получает ответ об этом.
+    """
+    @functools.wraps(handler)
+    def wrapper(*args, **kwargs):
+        try:
+            with db.unit_of_work():
+                return handler(*args, **kwargs)
+        except DatabaseUnavailable as e:
+            print(f"[DEBUG] {handler.__name__}: {e}")
+            # CallbackQuery несёт исходное сообщение в .message
+            update = args[0]
+            message = getattr(update, 'message', None) or update
+            bot.send_message(message.chat.id,
+                             "⚠️ База данных временно недоступна.\nПопробуйте ещё раз через минуту.")
+    return wrapper
+
+def send_message(chat_id, text, **kwargs):
+    """
+    Ответ из обработчика: сначала фиксируем его транзакцию и возвращаем
+    подключение в пул, чтобы сетевой вызов к Telegram не держал блокировки.
+    Следующий запрос обработчика откроет новую транзакцию.
+    """
+    db.checkpoint(release=True)
+    return bot.send_message(chat_id, text, **kwargs)
 
 def format_date(date_value, default='неизвестно'):
     """Форматирование даты"""
@@ -90,11 +109,89 @@ def format_date(date_value, default='неизвестно'):
         return date_value
     return str(date_value).split()[0]  # Берем только дату без времени
 
+def format_bytes(size):
+    """Размер в байтах для человека: 12.3 МБ"""
+    if size is None:
+        return '?'
+    for unit in ('Б', 'КБ', 'МБ', 'ГБ'):
+        if size < 1024 or unit == 'ГБ':
+            return f"{size:.0f} {unit}" if unit == 'Б' else f"{size:.1f} {unit}"
+        size /= 1024
+
+def format_table_sizes(tables):
+    """Строки экрана «Просмотр БД» по списку TableSize"""
+    lines = []
+    for table in tables:
+        rows = f"≈{table.estimated_rows} записей" if table.estimated_rows is not None else "нет оценки"
+        if table.exact_rows is not None:
+            rows += f" (точно {table.exact_rows} на {table.counted_at:%d.%m %H:%M})"
+        line = f"• <b>{table.name}:</b> {rows}"
+        if table.table_bytes is not None:
+            line += f", {format_bytes(table.table_bytes)} + индексы {format_bytes(table.index_bytes)}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+def format_game_settings(game):
+    """Экран «Настройки» для админа (HTML)"""
+    lines = [f"<b>⚙️ Настройки игры</b> (версия {game.version})\n"]
+    for key, (label, _) in settings.FIELDS.items():
+        value = settings.format_value(key, getattr(game, key))
+        lines.append(f"• <b>{label}:</b> {escape_html(value)}")
+    lines.append(f"\nГод игры: {game.year}")
+    return "\n".join(lines)
+
+def escape_html(text):
+    """Экранирование пользовательского текста для parse_mode='HTML'"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if text else ''
+
+def format_search_results(query, hits, page):
+    """Страница результатов /search (HTML); совпадения во фрагменте выделены жирным"""
+    if not hits:
+        return f"🔎 По запросу <b>{escape_html(query)}</b> ничего не найдено."
+    lines = [f"🔎 <b>{escape_html(query)}</b> — страница {page + 1}\n"]
+    for number, hit in enumerate(hits, start=page * SEARCH_PAGE_SIZE + 1):
+        username = f"@{escape_html(hit.username)}" if hit.username else "нет username"
+        inactive = " (неактивен)" if not hit.is_active else ""
+        lines.append(f"{number}. <b>{escape_html(hit.full_name)}</b> ({username}){inactive}\n"
+                     f"   ID: <code>{hit.user_id}</code>")
+        if hit.snippet:
+            snippet = escape_html(hit.snippet).replace('⟦', '<b>').replace('⟧', '</b>')
+            lines.append(f"   📝 {snippet}")
+    return "\n".join(lines)
+
+def format_constraint_error(error):
+    """Сообщение админу, когда правила жеребьёвки невыполнимы (HTML)"""
+    names = []
+    for user_id in error.players[:10]:
+        player = db.get_player(user_id)
+        name = escape_html(player.full_name) if player else 'неизвестный игрок'
+        names.append(f"• {name} (<code>{user_id}</code>)")
+    more = f"\n… и ещё {len(error.players) - 10}" if len(error.players) > 10 else ""
+    return (f"❌ <b>Жеребьёвка не проведена.</b>\n\n{escape_html(str(error))}:\n"
+            + "\n".join(names) + more +
+            "\n\nОслабьте правила: /exclusions, /team, "
+            "или настройки «Не повторять пары прошлых лет» и «Не дарить внутри команды».")
+
+def send_search_page(chat_id, query, page):
+    hits, has_more = db.search_players(query, page, SEARCH_PAGE_SIZE)
+    markup = None
+    if page > 0 or has_more:
+        markup = types.InlineKeyboardMarkup()
+        buttons = []
+        if page > 0:
+            buttons.append(types.InlineKeyboardButton('◀️ Назад', callback_data=f'admin_search_{page - 1}'))
+        if has_more:
+            buttons.append(types.InlineKeyboardButton('Дальше ▶️', callback_data=f'admin_search_{page + 1}'))
+        markup.row(*buttons)
+    send_message(chat_id, format_search_results(query, hits, page), parse_mode='HTML', reply_markup=markup)
+
 # ================ ОСНОВНЫЕ HANDLERS ================
 @bot.message_handler(commands=['start'])
+@with_unit_of_work
 def main(message):
     user = message.from_user
     user_id = message.from_user.id
+    game = settings.current()
 
     player = db.get_player(user_id)
 
@@ -118,13 +215,13 @@ def main(message):
 
         Используй команды:
         /status - проверить свой статус
-        /reveal - узнать своего Тайного Санту (после 31.12.2025)
+        /reveal - узнать своего Тайного Санту (после {format_day(game.reveal_date)})
         /mywish - посмотреть/обновить список пожеланий
         /help - получить помощь
         /myid - узнать свой ID
         """
 
-        bot.send_message(message.chat.id, welcome_text, parse_mode='Markdown')
+        send_message(message.chat.id, welcome_text, parse_mode='Markdown')
         return
 
     user_name = user.first_name
@@ -132,11 +229,12 @@ def main(message):
     markup = types.InlineKeyboardMarkup()
     markup.add(types.InlineKeyboardButton('Ознакомиться с правилами игры📋', callback_data='rules'))
 
-    bot.send_message(message.chat.id,
+    send_message(message.chat.id,
                      f'Привет, {user_name}. Мы рады приветствовать тебя в игре "Тайный Санта🎅🎄". Перед началом, рекомендуем ознакомиться с правилами игры!',
                      reply_markup=markup)
 
 @bot.message_handler(commands=['admin'])
+@with_unit_of_work
 def admin_panel(message):
     """Панель администратора"""
     user_id = message.from_user.id
@@ -145,7 +243,7 @@ def admin_panel(message):
     # Проверка прав администратора
     if user_id not in config.ADMINS:
         print(f"[DEBUG] Пользователь {user_id} НЕ в списке ADMINS. Выход.")
-        bot.send_message(message.chat.id, "❌ У вас нет прав администратора.")
+        send_message(message.chat.id, "❌ У вас нет прав администратора.")
         return
     
     print(f"[DEBUG] Пользователь {user_id} является админом. Показываю панель.")
@@ -162,100 +260,214 @@ def admin_panel(message):
         types.InlineKeyboardButton('🧪 Тестовые игроки', callback_data='admin_add_test'),
         types.InlineKeyboardButton('🗑️ Очистить пары', callback_data='admin_clear_pairs'),
         types.InlineKeyboardButton('🎅 Созданные пары', callback_data='admin_view_pairs'),
+        types.InlineKeyboardButton('⚙️ Настройки', callback_data='admin_settings'),
     ]
     
     markup.add(*buttons)
     
-    bot.send_message(message.chat.id, 
+    send_message(message.chat.id, 
                     "🛠️ *Панель администратора*\n\nВыберите действие:",
                     reply_markup=markup,
                     parse_mode='Markdown')
 
 # ================ КОМАНДЫ ДЛЯ ИГРОКОВ ================
 
+@bot.message_handler(commands=['search'])
+@with_unit_of_work
+def search_command(message):
+    """Поиск игроков по имени, username и пожеланиям (для админов)"""
+    user_id = message.from_user.id
+    if user_id not in config.ADMINS:
+        send_message(message.chat.id, "❌ У вас нет прав администратора.")
+        return
+
+    query = message.text.partition(' ')[2].strip()
+    if not query:
+        send_message(message.chat.id,
+                         "🔎 Использование: /search текст\n\nНапример: /search настолки\n"
+                         "Ищет по имени, username и спискам пожеланий.")
+        return
+
+    # Запрос запоминаем для кнопок «Назад» / «Дальше»
+    user_states.setdefault(user_id, {})['search'] = query
+    send_search_page(message.chat.id, query, 0)
+
+@bot.message_handler(commands=['exclude', 'unexclude', 'exclusions', 'team'])
+@with_unit_of_work
+def draw_rules_command(message):
+    """Правила жеребьёвки (для админов): взаимные исключения и команды"""
+    if message.from_user.id not in config.ADMINS:
+        send_message(message.chat.id, "❌ У вас нет прав администратора.")
+        return
+
+    command, _, rest = message.text.partition(' ')
+    command = command.lstrip('/').split('@')[0]
+    args = rest.split()
+    usage = {
+        'exclude': "/exclude ID1 ID2 [причина] — эти двое не дарят друг другу",
+        'unexclude': "/unexclude ID1 ID2 — снять исключение",
+        'team': "/team ID команда — задать команду (/team ID — убрать)",
+    }
+
+    if command == 'exclusions':
+        rows = db.get_draw_exclusions()
+        if not rows:
+            send_message(message.chat.id, "ℹ️ Исключений нет.\n\n" + "\n".join(usage.values()))
+            return
+        text = "<b>🚫 Исключения жеребьёвки:</b>\n\n"
+        for row in rows:
+            reason = f" — {escape_html(row['reason'])}" if row['reason'] else ""
+            text += (f"• {escape_html(row['name_a'] or '?')} (<code>{row['user_id_a']}</code>) ↔ "
+                     f"{escape_html(row['name_b'] or '?')} (<code>{row['user_id_b']}</code>){reason}\n")
+        send_message(message.chat.id, text, parse_mode='HTML')
+        return
+
+    try:
+        if command in ('exclude', 'unexclude'):
+            first, second = int(args[0]), int(args[1])
+        else:
+            user_id = int(args[0])
+    except (IndexError, ValueError):
+        send_message(message.chat.id, f"ℹ️ Использование: {usage[command]}")
+        return
+
+    if command == 'exclude':
+        if first == second:
+            send_message(message.chat.id, "❌ Нужны два разных игрока.")
+            return
+        db.add_draw_exclusion(first, second, ' '.join(args[2:]) or None)
+        send_message(message.chat.id, f"✅ {first} и {second} не будут дарить друг другу.")
+    elif command == 'unexclude':
+        if db.remove_draw_exclusion(first, second):
+            send_message(message.chat.id, f"✅ Исключение {first} ↔ {second} снято.")
+        else:
+            send_message(message.chat.id, "ℹ️ Такого исключения нет.")
+    else:
+        team = ' '.join(args[1:])
+        if not db.set_player_team(user_id, team):
+            send_message(message.chat.id, f"❌ Игрок с ID {user_id} не найден.")
+        elif team:
+            send_message(message.chat.id, f"✅ Игрок {user_id} в команде «{team}».")
+        else:
+            send_message(message.chat.id, f"✅ Игрок {user_id} больше не в команде.")
+
+def player_label(user_id):
+    """Имя игрока для HTML-ответа админу (или ID, если игрока нет)."""
+    player = db.get_player(user_id) if user_id is not None else None
+    return f"{escape_html(player.full_name)} (ID {user_id})" if player else f"ID {user_id}"
+
+@bot.message_handler(commands=['latejoin', 'dropout'])
+@with_unit_of_work
+def draw_change_command(message):
+    """Изменение состава после жеребьёвки (для админов): опоздавший или выбывший игрок"""
+    if message.from_user.id not in config.ADMINS:
+        send_message(message.chat.id, "❌ У вас нет прав администратора.")
+        return
+
+    command, _, rest = message.text.partition(' ')
+    command = command.lstrip('/').split('@')[0]
+    usage = {
+        'latejoin': "/latejoin ID — добавить игрока в уже проведённую жеребьёвку",
+        'dropout': "/dropout ID — вывести игрока из жеребьёвки и из игры",
+    }
+    try:
+        user_id = int(rest.split()[0])
+    except (IndexError, ValueError):
+        send_message(message.chat.id, f"ℹ️ Использование: {usage[command]}")
+        return
+
+    game = settings.current()
+    player = db.get_player(user_id)
+    if not player:
+        send_message(message.chat.id, f"❌ Игрок с ID {user_id} не найден.")
+        return
+    name = escape_html(player.full_name)
+    if command == 'latejoin' and not player.is_active:
+        send_message(message.chat.id, f"ℹ️ {name} не активен: пусть заново зарегистрируется через /start.",
+                         parse_mode='HTML')
+        return
+
+    try:
+        if command == 'latejoin':
+            affected = db.add_to_draw(user_id, game.year)
+            text = f"✅ {name} добавлен в жеребьёвку."
+        else:
+            # Пары чинит сама деактивация; Санта без допустимой замены остаётся без подопечного
+            change = db.deactivate_player(user_id)
+            if change is None:
+                send_message(message.chat.id, f"❌ Не удалось вывести {name} из игры.", parse_mode='HTML')
+                return
+            affected = change.affected
+            text = f"✅ {name} выведен из жеребьёвки и из игры."
+            if change.unassigned_santa is not None:
+                text += ("\n\n⚠️ <b>Жеребьёвка неполная:</b> по правилам замену найти не удалось.\n"
+                         f"• Без подопечного: {player_label(change.unassigned_santa)}\n"
+                         f"• Без Санты: {player_label(change.orphan_receiver)}\n\n"
+                         "Ослабьте правила (/exclusions, /team или настройки жеребьёвки) "
+                         "и проведите жеребьёвку заново.")
+    except ValueError as e:
+        send_message(message.chat.id, f"ℹ️ {e}")
+        return
+    except DrawConstraintError as e:
+        send_message(message.chat.id,
+                         f"❌ <b>Пары не изменены.</b>\n\n{escape_html(str(e))}.\n\n"
+                         "Ослабьте правила: /exclusions, /team или настройки жеребьёвки.",
+                         parse_mode='HTML')
+        return
+
+    # Пары фиксируем до рассылки и отдаём подключение; назначение получают только затронутые Санты
+    db.checkpoint(release=True)
+    from utils import notify_draw_changes
+    notified = notify_draw_changes(bot, db, affected, game.year)
+    send_message(message.chat.id, f"{text}\n📨 Новое назначение отправлено Сантам: {notified}",
+                     parse_mode='HTML')
+
 @bot.message_handler(commands=['status'])
+@with_unit_of_work
 def status_command(message):
     """Показать статус игрока"""
     user_id = message.from_user.id
     print(f"[DEBUG] Команда /status от {user_id}")
+    game = settings.current()
     
-    player = db.get_player(user_id)
+    # Игрок, подопечный и Санта — одним обращением к БД (или из кэша)
+    dashboard = db.get_player_dashboard(user_id, game.year)
     
-    if not player:
-        bot.send_message(message.chat.id, 
+    if not dashboard:
+        send_message(message.chat.id, 
                         "❌ Вы не зарегистрированы в игре.\nИспользуйте /start для регистрации.")
         return
     
     # Получаем данные игрока через безопасную функцию
-    full_name = get_player_field(player, 'full_name', 'Неизвестно')
-    username = get_player_field(player, 'username', 'не указан')
-    reg_date = format_date(get_player_field(player, 'registration_date'))
-    wish_list = get_player_field(player, 'wish_list', 'еще не добавлен')
+    full_name = get_player_field(dashboard, 'full_name', 'Неизвестно')
+    username = get_player_field(dashboard, 'username', 'не указан')
+    reg_date = format_date(get_player_field(dashboard, 'registration_date'))
+    wish_list = get_player_field(dashboard, 'wish_list', 'еще не добавлен')
     
     # Проверяем, назначен ли получатель
-    receiver_info = ""
-    try:
-        receiver_name = db.get_santa_pair(user_id, config.DRAW_YEAR)
-        if receiver_name:
-            # Получаем получателя для проверки wishlist
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            if db.db_type == 'postgresql':
-                cursor.execute('''
-                    SELECT p.wish_list 
-                    FROM santa_pairs sp 
-                    JOIN players p ON sp.receiver_user_id = p.user_id 
-                    WHERE sp.santa_user_id = %s AND sp.year = %s
-                ''', (user_id, config.DRAW_YEAR))
-            else:
-                cursor.execute('''
-                    SELECT p.wish_list 
-                    FROM santa_pairs sp 
-                    JOIN players p ON sp.receiver_user_id = p.user_id 
-                    WHERE sp.santa_user_id = ? AND sp.year = ?
-                ''', (user_id, config.DRAW_YEAR))
-            
-            result = cursor.fetchone()
-            conn.close()
-            
-            receiver_wishlist = ''
-            if result:
-                if isinstance(result, dict):
-                    receiver_wishlist = result.get('wish_list', '')
-                else:
-                    receiver_wishlist = result[0] if len(result) > 0 else ''
-            
-            has_wishlist = "🎁" if receiver_wishlist and receiver_wishlist.strip() else "📝"
-            
-            receiver_info = f"""🎅 *Твой подопечный:*
-• *Имя:* {receiver_name}
+    if dashboard.receiver_user_id:
+        receiver_wishlist = dashboard.receiver_wish_list
+        has_wishlist = "🎁" if receiver_wishlist and receiver_wishlist.strip() else "📝"
+        
+        receiver_info = f"""🎅 *Твой подопечный:*
+• *Имя:* {dashboard.receiver_name}
 • *Пожелания:* {has_wishlist} {'есть' if receiver_wishlist and receiver_wishlist.strip() else 'нет'}
 """
-        else:
-            receiver_info = "🎅 *Твой подопечный:* пока не назначен\n"
-    except Exception as e:
-        print(f"[DEBUG] Ошибка получения получателя: {e}")
-        receiver_info = "🎅 *Твой подопечный:* информация пока недоступна\n"
+    else:
+        receiver_info = "🎅 *Твой подопечный:* пока не назначен\n"
     
-    # Проверяем, есть ли у нас Санта (раскрыт ли он)
-    santa_info = ""
-    try:
-        # Проверяем дату раскрытия
-        today = date.today()
-        reveal_date = date(REVEAL_YEAR, REVEAL_MONTH, REVEAL_DAY)
-        
-        if today >= reveal_date:
-            santa_name = db.get_receiver_pair(user_id, REVEAL_YEAR)
-            if santa_name:
-                santa_info = f"🎄 *Твой Тайный Санта:* {santa_name}\n"
-            else:
-                santa_info = "🎄 *Твой Тайный Санта:* еще не раскрыт\n"
+    # Санту показываем только после даты раскрытия
+    today = date.today()
+    reveal_date = game.reveal_date
+    
+    if today >= reveal_date:
+        if dashboard.santa_name:
+            santa_info = f"🎄 *Твой Тайный Санта:* {dashboard.santa_name}\n"
         else:
-            days_left = (reveal_date - today).days
-            santa_info = f"🎄 *Раскрытие через:* {days_left} дней\n"
-    except Exception as e:
-        print(f"[DEBUG] Ошибка получения Санты: {e}")
-        santa_info = "🎄 *Информация о Санте:* пока недоступна\n"
+            santa_info = "🎄 *Твой Тайный Санта:* еще не раскрыт\n"
+    else:
+        days_left = (reveal_date - today).days
+        santa_info = f"🎄 *Раскрытие через:* {days_left} дней\n"
     
     status_text = f"""
 📋 *Твой статус в игре "Тайный Санта"*
@@ -271,13 +483,14 @@ def status_command(message):
 🎁 *Твой список пожеланий:* {'есть' if wish_list and wish_list != 'еще не добавлен' else 'нет'}
 
 📅 *Ближайшие события:*
-• *Жеребьёвка:* {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}
-• *Раскрытие Сант:* {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}
+• *Жеребьёвка:* {format_day(game.draw_date)}
+• *Раскрытие Сант:* {format_day(game.reveal_date)}
 """
     
-    bot.send_message(message.chat.id, status_text, parse_mode='Markdown')
+    send_message(message.chat.id, status_text, parse_mode='Markdown')
 
 @bot.message_handler(commands=['addwish'])
+@with_unit_of_work
 def add_wish_command(message):
     """Добавить список пожеланий"""
     user_id = message.from_user.id
@@ -286,12 +499,12 @@ def add_wish_command(message):
     player = db.get_player(user_id)
     
     if not player:
-        bot.send_message(message.chat.id, 
+        send_message(message.chat.id, 
                         "❌ Вы не зарегистрированы в игре.\nИспользуйте /start для регистрации.")
         return
     
     # Отправляем сообщение с запросом пожеланий
-    msg = bot.send_message(message.chat.id,
+    msg = send_message(message.chat.id,
                          '🎁 *Напиши свои пожелания для подарка:*\n\n'
                          '• Любимые цвета, хобби\n'
                          '• Размер одежды (если нужно)\n'
@@ -304,6 +517,7 @@ def add_wish_command(message):
     # Регистрируем следующий шаг
     bot.register_next_step_handler(msg, process_wishlist)
 
+@with_unit_of_work
 def process_wishlist(message):
     """Обработка введенного списка пожеланий"""
     user_id = message.from_user.id
@@ -312,23 +526,17 @@ def process_wishlist(message):
     if wishlist.lower() == 'пропустить':
         wishlist = ''
     
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    if db.db_type == 'postgresql':
-        cursor.execute('UPDATE players SET wish_list = %s WHERE user_id = %s', (wishlist, user_id))
-    else:
-        cursor.execute('UPDATE players SET wish_list = ? WHERE user_id = ?', (wishlist, user_id))
-    conn.commit()
-    conn.close()
+    db.update_wishlist(user_id, wishlist)
     
     if wishlist:
         response = '✅ *Список пожеланий сохранен!*\n\nТвой Санта будет благодарен за подсказки! 🎁\n\nПосмотреть свой список можно командой /mywish'
     else:
         response = '✅ *Список пожеланий очищен.*\n\nТвой Санта проявит креативность! 🎅'
     
-    bot.send_message(message.chat.id, response, parse_mode='Markdown')
+    send_message(message.chat.id, response, parse_mode='Markdown')
 
 @bot.message_handler(commands=['mywish'])
+@with_unit_of_work
 def my_wish_command(message):
     """Посмотреть свой список пожеланий"""
     user_id = message.from_user.id
@@ -337,7 +545,7 @@ def my_wish_command(message):
     player = db.get_player(user_id)
     
     if not player:
-        bot.send_message(message.chat.id, 
+        send_message(message.chat.id, 
                         "❌ Вы не зарегистрированы в игре.\nИспользуйте /start для регистрации.")
         return
     
@@ -356,24 +564,27 @@ def my_wish_command(message):
     else:
         response = "📝 *У тебя еще нет списка пожеланий.*\n\nИспользуй команду /addwish чтобы добавить свои пожелания для Тайного Санты!"
     
-    bot.send_message(message.chat.id, response, parse_mode='Markdown')
+    send_message(message.chat.id, response, parse_mode='Markdown')
 
 @bot.message_handler(commands=['myid'])
+@with_unit_of_work
 def my_id_command(message):
     """Показать ID пользователя"""
     user_id = message.from_user.id
     print(f"[DEBUG] Команда /myid от {user_id}")
     
-    bot.send_message(message.chat.id, 
+    send_message(message.chat.id, 
                     f"🆔 *Твой Telegram ID:* `{user_id}`\n\n"
                     "Этот ID нужен для идентификации в игре.",
                     parse_mode='Markdown')
 
 @bot.message_handler(commands=['help'])
+@with_unit_of_work
 def help_command(message):
     """Показать справку"""
     user_id = message.from_user.id
     print(f"[DEBUG] Команда /help от {user_id}")
+    game = settings.current()
     
     help_text = f"""
 🆘 *Помощь по командам бота*
@@ -387,53 +598,58 @@ def help_command(message):
 /help - эта справка
 
 🎅 *Для игры:*
-/reveal - узнать своего Тайного Санту (после {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR})
+/reveal - узнать своего Тайного Санту (после {format_day(game.reveal_date)})
 
 🛠️ *Администратору:*
 /admin - панель администратора (только для админов)
+/search текст - поиск игроков по имени и пожеланиям
+/exclusions - исключения жеребьёвки (/exclude, /unexclude, /team)
+/latejoin, /dropout - добавить или вывести игрока после жеребьёвки
 
-*Жеребьёвка:* {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}
-*Раскрытие Сант:* {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}
+*Жеребьёвка:* {format_day(game.draw_date)}
+*Раскрытие Сант:* {format_day(game.reveal_date)}
 """
     
-    bot.send_message(message.chat.id, help_text, parse_mode='Markdown')
+    send_message(message.chat.id, help_text, parse_mode='Markdown')
 
 @bot.message_handler(commands=['reveal'])
+@with_unit_of_work
 def reveal_santa_command(message):
     """Узнать своего Тайного Санту"""
     user_id = message.from_user.id
     print(f"[DEBUG] Команда /reveal от {user_id}")
+    game = settings.current()
     
     # Проверяем текущую дату
     today = date.today()
-    reveal_date = date(REVEAL_YEAR, REVEAL_MONTH, REVEAL_DAY)
+    reveal_date = game.reveal_date
     
     if today < reveal_date:
-        bot.send_message(message.chat.id,
+        send_message(message.chat.id,
                         f"🎅 *Тайна еще не раскрыта!*\n\n"
-                        f"Раскрытие Тайных Сант произойдет {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}\n"
+                        f"Раскрытие Тайных Сант произойдет {format_day(game.reveal_date)}\n"
                         f"Осталось ждать: {(reveal_date - today).days} дней",
                         parse_mode='Markdown')
         return
     
     # Если дата наступила, пытаемся получить информацию о Санте
     try:
-        santa_name = db.get_receiver_pair(user_id, REVEAL_YEAR)
+        santa_name = db.get_receiver_pair(user_id, game.year)
         if santa_name:
-            bot.send_message(message.chat.id,
+            send_message(message.chat.id,
                            f"🎉 *Тайна раскрыта!*\n\n"
                            f"Твоим Тайным Сантой был: *{santa_name}*!\n\n"
                            f"Надеемся, тебе понравился подарок! 🎁",
                            parse_mode='Markdown')
         else:
-            bot.send_message(message.chat.id,
+            send_message(message.chat.id,
                            "❌ *Информация не найдена*\n\n"
                            "Возможно, жеребьёвка еще не проведена или произошла ошибка.\n"
                            "Обратитесь к администратору.",
                            parse_mode='Markdown')
     except Exception as e:
         print(f"[DEBUG] Ошибка в /reveal: {e}")
-        bot.send_message(message.chat.id,
+        send_message(message.chat.id,
                         "❌ *Ошибка при получении информации*\n\n"
                         "Попробуйте позже или обратитесь к администратору.",
                         parse_mode='Markdown')
@@ -441,11 +657,12 @@ def reveal_santa_command(message):
 # ================ ОБРАБОТЧИК НЕИЗВЕСТНЫХ КОМАНД ================
 
 @bot.message_handler(func=lambda message: True, content_types=['text'])
+@with_unit_of_work
 def unknown_command(message):
     """Обработчик неизвестных команд и простых сообщений"""
     if message.text.startswith('/'):
         # Это неизвестная команда
-        bot.send_message(message.chat.id,
+        send_message(message.chat.id,
                         "❌ *Неизвестная команда*\n\n"
                         "Используй /help чтобы увидеть список доступных команд.",
                         parse_mode='Markdown')
@@ -456,8 +673,10 @@ def unknown_command(message):
 # ================ CALLBACK ОБРАБОТЧИКИ ================
 
 @bot.callback_query_handler(func=lambda call: True)
+@with_unit_of_work
 def handle_callbacks(call):
     print(f"[DEBUG] Обработка callback: {call.data}")
+    game = settings.current()
     
     if call.data == 'rules':
         markup = types.InlineKeyboardMarkup()
@@ -465,20 +684,20 @@ def handle_callbacks(call):
         btn_no = types.InlineKeyboardButton('Нет❌', callback_data='no')
         markup.row(btn_yes, btn_no)
 
-        bot.send_message(call.message.chat.id,
-                         '🎄 Волшебство Тайного Санты начинается! 🎄\nДорогие друзья! Пришло время окутаться атмосферой чудес и радости. Чтобы наш обмен подарками принёс только улыбки, давайте вспомним правила:\n✨ Основной принцип:\nВы становитесь Тайным Сантой для одного человека и получателем подарка от другого. Ваша миссия — сделать приятный сюрприз своему подопечному, оставаясь в тени до самого момента вручения!\n📅 Ключевые даты:\nЖеребьёвка: 15.12.2025\nРаскрытие Сант: 31.12.2025\nДедлайн для подарков: до 25.12.2025.\n🎁 Правила дарения:\nБюджет: ~500₽💵. \nЦенность — в креативности и внимании!\n🤫Анонимность: Ваша главная магия — секретность. Не раскрывайте, кому вы готовите сюрприз!\nНаблюдательность: Проявите внимание! Узнайте у друзей о предпочтениях вашего подопечного.\n❌Запрещённое: Подарки «на скорую руку», обидные или слишком личные шутки, а также живые существа.\n🎅 Как всё пройдёт:\nВ день встречи подарки будут собраны анонимно (с пометкой «Для [Имя получателя]»). Мы по очереди будем вручать их, а потом попробуем угадать, кто же был нашим Тайного Сантой! Пусть дуг праздника согреет ваши сердца! ❤️\n\n Ты готов начать?',
+        send_message(call.message.chat.id,
+                         f'🎄 Волшебство Тайного Санты начинается! 🎄\nДорогие друзья! Пришло время окутаться атмосферой чудес и радости. Чтобы наш обмен подарками принёс только улыбки, давайте вспомним правила:\n✨ Основной принцип:\nВы становитесь Тайным Сантой для одного человека и получателем подарка от другого. Ваша миссия — сделать приятный сюрприз своему подопечному, оставаясь в тени до самого момента вручения!\n📅 Ключевые даты:\nЖеребьёвка: {format_day(game.draw_date)}\nРаскрытие Сант: {format_day(game.reveal_date)}\nДедлайн для подарков: до {format_day(game.gift_deadline)}.\n🎁 Правила дарения:\nБюджет: {game.gift_budget}💵. \nЦенность — в креативности и внимании!\n🤫Анонимность: Ваша главная магия — секретность. Не раскрывайте, кому вы готовите сюрприз!\nНаблюдательность: Проявите внимание! Узнайте у друзей о предпочтениях вашего подопечного.\n❌Запрещённое: Подарки «на скорую руку», обидные или слишком личные шутки, а также живые существа.\n🎅 Как всё пройдёт:\nВ день встречи подарки будут собраны анонимно (с пометкой «Для [Имя получателя]»). Мы по очереди будем вручать их, а потом попробуем угадать, кто же был нашим Тайного Сантой! Пусть дуг праздника согреет ваши сердца! ❤️\n\n Ты готов начать?',
                          reply_markup=markup)
 
     elif call.data == 'yes':
-        msg = bot.send_message(call.message.chat.id,
+        msg = send_message(call.message.chat.id,
                                'Отлично! Давайте начнем! 🎅🎄\nУважаемые участники, очень просим вводить вас свои реальные данные, чтобы не нарушать правила игры и не доставлять неудобства другим игрокам🤗😉\nВведите своё имя и фамилию:')
         bot.register_next_step_handler(msg, get_name)
 
     elif call.data == 'no':
-        bot.send_message(call.message.chat.id, 'Жаль, что вы не готовы. Возвращайтесь! 🎅')
+        send_message(call.message.chat.id, 'Жаль, что вы не готовы. Возвращайтесь! 🎅')
 
     elif call.data == 'add_wish':
-        msg = bot.send_message(call.message.chat.id,
+        msg = send_message(call.message.chat.id,
                                '🎁 *Напиши свои пожелания для подарка:*\n\n'
                                '• Любимые цвета, хобби\n'
                                '• Размер одежды (если нужно)\n'
@@ -489,23 +708,23 @@ def handle_callbacks(call):
         bot.register_next_step_handler(msg, save_wishlist)
 
     elif call.data == 'skip_wish':
-        bot.send_message(call.message.chat.id,
+        send_message(call.message.chat.id,
                          'Хорошо! Твой Санта проявит креативность! 🎅\n\n'
-                         f'*Жеребьёвка:* {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}\n'
-                         f'*Раскрытие Сант:* {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}\n\n'
+                         f'*Жеребьёвка:* {format_day(game.draw_date)}\n'
+                         f'*Раскрытие Сант:* {format_day(game.reveal_date)}\n\n'
                          'Можешь добавить список пожеланий позже командой /addwish',
                          parse_mode='Markdown')
 
     elif call.data == 'later_wish':
-        bot.send_message(call.message.chat.id,
+        send_message(call.message.chat.id,
                          'Хорошо! Можешь добавить список пожеланий позже командой /addwish\n\n'
-                         f'*Жеребьёвка:* {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}\n'
-                         f'*Раскрытие Сант:* {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}\n\n'
+                         f'*Жеребьёвка:* {format_day(game.draw_date)}\n'
+                         f'*Раскрытие Сант:* {format_day(game.reveal_date)}\n\n'
                          'В этот день ты узнаешь, кому будешь дарить!',
                          parse_mode='Markdown')
 
     elif call.data == 'update_wish':
-        msg = bot.send_message(call.message.chat.id,
+        msg = send_message(call.message.chat.id,
                                '🎁 *Обнови список пожеланий:*\n\n'
                                '• Любимые цвета, хобби\n'
                                '• Размер одежды (если нужно)\n'
@@ -516,14 +735,16 @@ def handle_callbacks(call):
         bot.register_next_step_handler(msg, save_wishlist_command)
 
     elif call.data == 'cancel_wish':
-        bot.send_message(call.message.chat.id, "❌ Обновление отменено.")
+        send_message(call.message.chat.id, "❌ Обновление отменено.")
 
     elif call.data.startswith('admin_'):
         handle_admin_callback(call)
 
+    db.checkpoint(release=True)
     bot.answer_callback_query(call.id)
 
 
+@with_unit_of_work
 def get_name(message):
     name = message.text
     user_id = message.from_user.id
@@ -536,56 +757,41 @@ def get_name(message):
         markup.add(types.InlineKeyboardButton('Нет, пропустить', callback_data='skip_wish'))
         markup.add(types.InlineKeyboardButton('Позже, из команд', callback_data='later_wish'))
 
-        bot.send_message(message.chat.id,
+        send_message(message.chat.id,
                          f'✅ *Отлично, {name}! Ты зарегистрирован в игре!*\n\n'
                          f'Хочешь добавить список пожеланий для своего Тайного Санты?\n'
                          f'Это поможет выбрать тебе идеальный подарок! 🎁\n\n'
                          f'*Можешь добавить позже командой /addwish*',
                          reply_markup=markup, parse_mode='Markdown')
     else:
-        bot.send_message(message.chat.id,
+        send_message(message.chat.id,
                          f'Спасибо, {name}! Но произошла ошибка при регистрации.')
 
 
+@with_unit_of_work
 def save_wishlist(message):
     user_id = message.from_user.id
     wishlist = message.text
+    game = settings.current()
 
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    if db.db_type == 'postgresql':
-        cursor.execute('UPDATE players SET wish_list = %s WHERE user_id = %s', (wishlist, user_id))
-    else:
-        cursor.execute('UPDATE players SET wish_list = ? WHERE user_id = ?', (wishlist, user_id))
-        
-    conn.commit()
-    conn.close()
+    db.update_wishlist(user_id, wishlist)
 
-    bot.send_message(message.chat.id,
+    send_message(message.chat.id,
                      '✅ *Список пожеланий сохранен!*\n\n'
                      'Твой Санта будет благодарен за подсказки! 🎁\n\n'
-                     f'Теперь жди жеребьёвки {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}!',
+                     f'Теперь жди жеребьёвки {format_day(game.draw_date)}!',
                      parse_mode='Markdown')
 
 
 # ================ ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ================
+@with_unit_of_work
 def save_wishlist_command(message):
     user_id = message.from_user.id
     wishlist = message.text
 
-    conn = db.get_connection()
-    cursor = conn.cursor()
-    
-    if db.db_type == 'postgresql':
-        cursor.execute('UPDATE players SET wish_list = %s WHERE user_id = %s', (wishlist, user_id))
-    else:
-        cursor.execute('UPDATE players SET wish_list = ? WHERE user_id = ?', (wishlist, user_id))
-        
-    conn.commit()
-    conn.close()
+    db.update_wishlist(user_id, wishlist)
 
-    bot.send_message(message.chat.id,
+    send_message(message.chat.id,
                      '✅ *Список пожеланий сохранен!*\n\n'
                      'Твой Санта будет благодарен за подсказки! 🎁\n\n'
                      'Посмотреть свой список можно командой /mywish',
@@ -595,6 +801,7 @@ def save_wishlist_command(message):
 def handle_admin_callback(call):
     try:
         print(f"[DEBUG] Обработка admin callback: {call.data}")
+        game = settings.current()
         
         if call.data == 'admin_draw':
             # Показываем подтверждение
@@ -603,7 +810,7 @@ def handle_admin_callback(call):
                 types.InlineKeyboardButton('✅ Да, провести жеребьёвку', callback_data='admin_confirm_draw'),
                 types.InlineKeyboardButton('❌ Нет, отмена', callback_data='admin_cancel')
             )
-            bot.send_message(call.message.chat.id,
+            send_message(call.message.chat.id,
                      "⚠️ *Внимание!*\n\nВы собираетесь провести жеребьёвку. "
                      "После этого всем игрокам будут назначены их подопечные.\n\n"
                      "Это действие нельзя отменить!\n\n"
@@ -612,48 +819,63 @@ def handle_admin_callback(call):
 
         elif call.data == 'admin_confirm_draw':
             # Проводим жеребьёвку (БЕЗ параметра bot)
-            if db.perform_draw(config.DRAW_YEAR):
-                bot.send_message(call.message.chat.id, "✅ Жеребьёвка проведена успешно!")
+            try:
+                drawn = db.perform_draw(game.year)
+            except DrawConstraintError as e:
+                send_message(call.message.chat.id, format_constraint_error(e), parse_mode='HTML')
+                return
+            if drawn and not drawn.performed:
+                # Повторное нажатие или жеребьёвка по расписанию успела раньше
+                send_message(call.message.chat.id,
+                                 f"ℹ️ Жеребьёвка {drawn.year} года уже проведена ({drawn.pairs_count} пар).")
+            elif drawn:
+                # Пары фиксируем до рассылки и отдаём подключение: не держим
+                # транзакцию и блокировку жеребьёвки на время отправки сообщений
+                db.checkpoint(release=True)
+                send_message(call.message.chat.id, "✅ Жеребьёвка проведена успешно!")
                 
                 # Отправляем уведомления через отдельную функцию
                 try:
                     from utils import notify_all_players
-                    notified_count = notify_all_players(bot, db, config.DRAW_YEAR)
-                    bot.send_message(call.message.chat.id, 
+                    notified_count = notify_all_players(bot, db, game.year)
+                    send_message(call.message.chat.id, 
                                    f"📨 Уведомления отправлены! ({notified_count} игроков)")
                 except Exception as e:
                     print(f"⚠️ Ошибка отправки уведомлений: {e}")
-                    bot.send_message(call.message.chat.id, 
+                    send_message(call.message.chat.id, 
                                    "✅ Жеребьёвка проведена, но возникла ошибка при отправке уведомлений.")
             else:
-                bot.send_message(call.message.chat.id, "❌ Ошибка при проведении жеребьёвки!")
+                send_message(call.message.chat.id, "❌ Ошибка при проведении жеребьёвки!")
 
         elif call.data == 'admin_stats':
-            stats = db.get_player_stats()
-            players = db.get_all_active_players()
+            # Счётчики — одна строка, список игроков — один потоковый запрос
+            stats = db.get_player_stats(game.year)
             message = "<b>📊 Статистика игры:</b>\n\n"
             message += f"• <b>Всего игроков:</b> {stats['total_players']}\n"
+            message += f"• <b>Активных:</b> {stats['active_players']}\n"
+            message += f"• <b>С пожеланиями:</b> {stats['players_with_wishlist']}\n"
             message += f"• <b>Создано пар:</b> {stats['total_pairs']}\n"
+            message += f"• <b>Уведомлено Сант:</b> {stats['total_notified']}\n"
             message += f"• <b>Раскрыто пар:</b> {stats['total_revealed']}\n\n"
 
-            if players:
-                message += "<b>Список игроков:</b>\n"
-                for i, (user_id, full_name, username) in enumerate(players, 1):
-                    safe_name = full_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
-                    username_display = f"@{username}" if username else "без username"
-                    player_info = db.get_player(user_id)
-                    # Используем безопасную функцию для получения wishlist
-                    wish_list = get_player_field(player_info, 'wish_list', '')
-                    has_wishlist = "✅" if wish_list and wish_list.strip() else "❌"
-                    message += f"{i}. {safe_name} ({username_display}) {has_wishlist}\n"
-            else:
+            players_count = 0
+            for i, player in enumerate(db.iter_active_players(), 1):
+                if i == 1:
+                    message += "<b>Список игроков:</b>\n"
+                players_count = i
+                safe_name = player.full_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+                username_display = f"@{player.username}" if player.username else "без username"
+                # wish_list приходит в той же выборке, без запроса на каждого игрока
+                has_wishlist = "✅" if player.wish_list and player.wish_list.strip() else "❌"
+                message += f"{i}. {safe_name} ({username_display}) {has_wishlist}\n"
+            if not players_count:
                 message += "Нет зарегистрированных игроков"
-            bot.send_message(call.message.chat.id, message, parse_mode='HTML')
+            send_message(call.message.chat.id, message, parse_mode='HTML')
 
         elif call.data == 'admin_notify':
             from utils import notify_players_after_draw
-            notify_players_after_draw(bot, db)
-            bot.send_message(call.message.chat.id, "✅ Уведомления отправлены всем игрокам!")
+            notified_count = notify_players_after_draw(bot, db)
+            send_message(call.message.chat.id, f"✅ Уведомления отправлены! ({notified_count} игроков)")
 
         elif call.data == 'admin_reveal_all':
             confirmed_markup = types.InlineKeyboardMarkup()
@@ -661,85 +883,68 @@ def handle_admin_callback(call):
                 types.InlineKeyboardButton('✅ Да, раскрыть всех', callback_data='admin_confirm_reveal_all'),
                 types.InlineKeyboardButton('❌ Нет, отмена', callback_data='admin_cancel')
             )
-            bot.send_message(call.message.chat.id,
+            send_message(call.message.chat.id,
                              "⚠️ <b>Внимание!</b>\n\nВы собираетесь раскрыть ВСЕХ Тайных Сант принудительно.\nПосле этого игроки узнают, кто им дарил подарки.\n\nПодтвердите действие:",
                              parse_mode='HTML', reply_markup=confirmed_markup)
 
         elif call.data == 'admin_confirm_reveal_all':
-            revealed_count = db.reveal_all_pairs(REVEAL_YEAR, by_admin=True)
-            if revealed_count > 0:
-                players = db.get_all_active_players()
+            revealed = db.reveal_all_pairs(game.year, by_admin=True)
+            db.checkpoint(release=True)  # раскрытие фиксируем до рассылки
+            if revealed:
                 notified_count = 0
-                for user_id, full_name, username in players:
+                for pair in revealed:
+                    user_id, santa_name, full_name = pair.receiver_user_id, pair.santa_name, pair.receiver_name
                     try:
-                        santa_name = db.get_receiver_pair(user_id, REVEAL_YEAR)
                         if santa_name:
                             message = f"🎉 <b>Срочное объявление!</b>\n\nОрганизатор раскрыл всех Тайных Сант!\n\nТвоим Сантой был: <b>{santa_name}</b>\n\nСпасибо за участие в игре! 🎁"
-                            bot.send_message(user_id, message, parse_mode='HTML')
+                            send_message(user_id, message, parse_mode='HTML')
                             notified_count += 1
                     except Exception as e:
                         print(f"Ошибка при уведомлении {full_name}: {e}")
-                bot.send_message(call.message.chat.id,
-                                 f"✅ Раскрыто {revealed_count} пар!\nУведомлено {notified_count} игроков.")
+                send_message(call.message.chat.id,
+                                 f"✅ Раскрыто {len(revealed)} пар!\nУведомлено {notified_count} игроков.")
             else:
-                bot.send_message(call.message.chat.id, "❌ Нет пар для раскрытия или они уже раскрыты.")
+                send_message(call.message.chat.id, "❌ Нет пар для раскрытия или они уже раскрыты.")
 
         elif call.data == 'admin_reveal_one':
-            msg = bot.send_message(call.message.chat.id,
+            msg = send_message(call.message.chat.id,
                                    "🔍 <b>Раскрыть Санту для конкретного игрока</b>\n\nВведите ID пользователя, которому хотите раскрыть Санту:",
                                    parse_mode='HTML')
             bot.register_next_step_handler(msg, process_reveal_one)
 
         elif call.data == 'admin_view_db':
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            if db.db_type == 'postgresql':
-                cursor.execute("""
-                    SELECT table_name 
-                    FROM information_schema.tables 
-                    WHERE table_schema = 'public'
-                """)
-            else:
-                cursor.execute("SELECT name FROM sqlite_master WHERE type='table';")
-                
-            tables = cursor.fetchall()
+            # Оценки и размеры из каталога БД — без COUNT(*) в потоке обработчика
             message = "<b>📊 База данных:</b>\n\n"
-            
-            for table_row in tables:
-                if db.db_type == 'postgresql':
-                    table_name = table_row['table_name']
-                else:
-                    table_name = table_row[0]
-                    
-                cursor.execute(f"SELECT COUNT(*) FROM {table_name};")
-                count_result = cursor.fetchone()
-                count = count_result[0] if isinstance(count_result, tuple) else count_result['count']
-                
-                message += f"• <b>{table_name}:</b> {count} записей\n"
-                
-                if count > 0 and table_name == 'players':
-                    cursor.execute("SELECT full_name, username, wish_list FROM players LIMIT 5;")
-                    players_data = cursor.fetchall()
-                    message += "  <i>Последние игроки:</i>\n"
-                    
-                    for row in players_data:
-                        if isinstance(row, dict):
-                            name = row['full_name']
-                            username = row['username']
-                            wish_list = row['wish_list']
-                        else:
-                            name = row[0]
-                            username = row[1]
-                            wish_list = row[2]
-                            
-                        safe_name = name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if name else 'Без имени'
-                        username_display = f"@{username}" if username else "нет"
-                        has_wishlist = "🎁" if wish_list and wish_list.strip() else "❌"
-                        message += f"  - {safe_name} ({username_display}) {has_wishlist}\n"
-                        
-            conn.close()
-            bot.send_message(call.message.chat.id, message, parse_mode='HTML')
+            message += format_table_sizes(db.get_table_sizes())
+
+            recent_players = db.get_recent_players(5)
+            if recent_players:
+                message += "\n<i>Последние игроки:</i>\n"
+                for player in recent_players:
+                    name = player.full_name
+                    safe_name = name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if name else 'Без имени'
+                    username_display = f"@{player.username}" if player.username else "нет"
+                    has_wishlist = "🎁" if player.wish_list and player.wish_list.strip() else "❌"
+                    message += f"  - {safe_name} ({username_display}) {has_wishlist}\n"
+
+            recount_markup = types.InlineKeyboardMarkup()
+            recount_markup.add(types.InlineKeyboardButton('🔄 Точный пересчёт', callback_data='admin_recount_db'))
+            send_message(call.message.chat.id, message, parse_mode='HTML', reply_markup=recount_markup)
+
+        elif call.data == 'admin_recount_db':
+            chat_id = call.message.chat.id
+
+            def on_recount_done(tables):
+                if tables is None:
+                    send_message(chat_id, "❌ Не удалось пересчитать таблицы")
+                    return
+                send_message(chat_id, "<b>📊 Точный пересчёт завершён:</b>\n\n" + format_table_sizes(tables),
+                                 parse_mode='HTML')
+
+            if db.start_table_recount(on_done=on_recount_done):
+                send_message(chat_id, "🔄 Точный пересчёт запущен в фоне, пришлю результат отдельным сообщением")
+            else:
+                send_message(chat_id, "⏳ Пересчёт уже идёт, дождитесь результата")
 
         elif call.data == 'admin_add_test':
             test_players = [
@@ -758,7 +963,7 @@ def handle_admin_callback(call):
                         telegram_name=player["telegram_name"]
                 ):
                     added_count += 1
-            bot.send_message(
+            send_message(
                 call.message.chat.id,
                 f"✅ Добавлено {added_count} тестовых игроков!\n\nТеперь используйте '🔮 Провести жеребьёвку'"
             )
@@ -769,82 +974,26 @@ def handle_admin_callback(call):
                 types.InlineKeyboardButton('✅ Да, очистить', callback_data='admin_confirm_clear_pairs'),
                 types.InlineKeyboardButton('❌ Нет, отмена', callback_data='admin_cancel')
             )
-            bot.send_message(call.message.chat.id,
+            send_message(call.message.chat.id,
                              "⚠️ <b>Внимание!</b>\n\nВы собираетесь очистить ВСЕ пары Санта-получатель.\nЭто действие нельзя отменить!\n\nПодтвердите:",
                              parse_mode='HTML', reply_markup=confirmed_markup)
 
         elif call.data == 'admin_confirm_clear_pairs':
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            if db.db_type == 'postgresql':
-                cursor.execute("DELETE FROM santa_pairs WHERE year = %s", (config.DRAW_YEAR,))
-                cursor.execute("DELETE FROM revealed_pairs WHERE year = %s", (config.DRAW_YEAR,))
-            else:
-                cursor.execute("DELETE FROM santa_pairs WHERE year = ?", (config.DRAW_YEAR,))
-                cursor.execute("DELETE FROM revealed_pairs WHERE year = ?", (config.DRAW_YEAR,))
-            conn.commit()
-            conn.close()
-            bot.send_message(call.message.chat.id, "🗑️ Пары очищены. Можно провести жеребьёвку заново.")
+            db.clear_pairs(game.year)
+            send_message(call.message.chat.id, "🗑️ Пары очищены. Можно провести жеребьёвку заново.")
 
         elif call.data == 'admin_view_pairs':
-            conn = db.get_connection()
-            cursor = conn.cursor()
-            
-            if db.db_type == 'postgresql':
-                cursor.execute('''
-                    SELECT 
-                        santa.full_name as santa,
-                        receiver.full_name as receiver,
-                        santa.user_id as santa_id,
-                        receiver.user_id as receiver_id,
-                        receiver.wish_list as wish_list,
-                        CASE WHEN rp.id IS NOT NULL THEN '✅' ELSE '❌' END as revealed
-                    FROM santa_pairs sp
-                    JOIN players santa ON sp.santa_user_id = santa.user_id
-                    JOIN players receiver ON sp.receiver_user_id = receiver.user_id
-                    LEFT JOIN revealed_pairs rp ON sp.receiver_user_id = rp.receiver_user_id AND sp.year = rp.year
-                    WHERE sp.year = %s
-                ''', (config.DRAW_YEAR,))
-            else:
-                cursor.execute('''
-                    SELECT 
-                        santa.full_name as santa,
-                        receiver.full_name as receiver,
-                        santa.user_id as santa_id,
-                        receiver.user_id as receiver_id,
-                        receiver.wish_list as wish_list,
-                        CASE WHEN rp.id IS NOT NULL THEN '✅' ELSE '❌' END as revealed
-                    FROM santa_pairs sp
-                    JOIN players santa ON sp.santa_user_id = santa.user_id
-                    JOIN players receiver ON sp.receiver_user_id = receiver.user_id
-                    LEFT JOIN revealed_pairs rp ON sp.receiver_user_id = rp.receiver_user_id AND sp.year = rp.year
-                    WHERE sp.year = ?
-                ''', (config.DRAW_YEAR,))
-                
-            pairs = cursor.fetchall()
-            conn.close()
+            pairs = db.get_pairs_overview(game.year)
             
             if not pairs:
-                bot.send_message(call.message.chat.id, "⚠️ Пары еще не созданы")
+                send_message(call.message.chat.id, "⚠️ Пары еще не созданы")
                 return
                 
             message = "<b>🎅 Созданные пары:</b>\n\n"
             for pair in pairs:
-                if isinstance(pair, dict):
-                    santa_name = pair['santa']
-                    receiver_name = pair['receiver']
-                    santa_id = pair['santa_id']
-                    receiver_id = pair['receiver_id']
-                    wish_list = pair['wish_list']
-                    revealed = pair['revealed']
-                else:
-                    santa_name = pair[0]
-                    receiver_name = pair[1]
-                    santa_id = pair[2]
-                    receiver_id = pair[3]
-                    wish_list = pair[4]
-                    revealed = pair[5]
-                    
+                santa_name, receiver_name = pair.santa_name, pair.receiver_name
+                santa_id, receiver_id, wish_list = pair.santa_user_id, pair.receiver_user_id, pair.wish_list
+                revealed = '✅' if pair.revealed else '❌'
                 safe_santa = santa_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if santa_name else 'Без имени'
                 safe_receiver = receiver_name.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;') if receiver_name else 'Без имени'
                 has_wishlist = "🎁" if wish_list and wish_list.strip() else "❌"
@@ -852,39 +1001,69 @@ def handle_admin_callback(call):
                 message += f"  (ID: {santa_id} → {receiver_id})\n\n"
                 
             message += f"\n<b>Всего пар:</b> {len(pairs)}"
-            bot.send_message(call.message.chat.id, message, parse_mode='HTML')
+            send_message(call.message.chat.id, message, parse_mode='HTML')
+
+        elif call.data == 'admin_settings':
+            settings_markup = types.InlineKeyboardMarkup(row_width=1)
+            settings_markup.add(*[
+                types.InlineKeyboardButton(f'✏️ {label}', callback_data=f'admin_set_{key}')
+                for key, (label, _) in settings.FIELDS.items()
+            ])
+            send_message(call.message.chat.id, format_game_settings(game),
+                             parse_mode='HTML', reply_markup=settings_markup)
+
+        elif call.data.startswith('admin_search_'):
+            query = user_states.get(call.from_user.id, {}).get('search')
+            if query is None or call.from_user.id not in config.ADMINS:
+                send_message(call.message.chat.id, "ℹ️ Поиск устарел. Повторите команду /search.")
+                return
+            send_search_page(call.message.chat.id, query, int(call.data[len('admin_search_'):]))
+
+        elif call.data.startswith('admin_set_'):
+            key = call.data[len('admin_set_'):]
+            if key not in settings.FIELDS or call.from_user.id not in config.ADMINS:
+                send_message(call.message.chat.id, "❌ Неизвестная настройка.")
+                return
+            label, kind = settings.FIELDS[key]
+            hint = settings.INPUT_HINTS[kind]
+            msg = send_message(call.message.chat.id,
+                                   f"✏️ <b>{label}</b>\n\nВведите новое значение {hint}:",
+                                   parse_mode='HTML')
+            bot.register_next_step_handler(msg, process_setting_value, key)
 
         elif call.data == 'admin_cancel':
-            bot.send_message(call.message.chat.id, "❌ Действие отменено.")
+            send_message(call.message.chat.id, "❌ Действие отменено.")
 
     except Exception as e:
         error_message = f"❌ Ошибка при обработке команды:\n{str(e)}"
         print(f"[DEBUG] ERROR in handle_admin_callback: {e}")
-        bot.send_message(call.message.chat.id, error_message)
+        send_message(call.message.chat.id, error_message)
 
 
+@with_unit_of_work
 def process_reveal_one(message):
     try:
         user_id = int(message.text)
+        game = settings.current()
         player = db.get_player(user_id)
         if not player:
-            bot.send_message(message.chat.id, f"❌ Игрок с ID {user_id} не найден.")
+            send_message(message.chat.id, f"❌ Игрок с ID {user_id} не найден.")
             return
         
         full_name = get_player_field(player, 'full_name', 'Неизвестно')
         
-        if db.is_pair_revealed(user_id, REVEAL_YEAR):
-            santa_name = db.get_receiver_pair(user_id, REVEAL_YEAR)
-            bot.send_message(message.chat.id,
+        if db.is_pair_revealed(user_id, game.year):
+            santa_name = db.get_receiver_pair(user_id, game.year)
+            send_message(message.chat.id,
                              f"ℹ️ Пара для <b>{full_name}</b> уже раскрыта.\nСанта: <b>{santa_name}</b>",
                              parse_mode='HTML')
             return
             
-        santa_name = db.reveal_pair(user_id, REVEAL_YEAR, by_admin=True)
+        santa_name = db.reveal_pair(user_id, game.year, by_admin=True)
         if santa_name:
             try:
                 receiver_msg = f"🎉 <b>Срочное объявление от организатора!</b>\n\nТайна раскрыта досрочно!\n\nТвоим Тайным Сантой был: <b>{santa_name}</b>\n\nНадеемся, тебе понравился подарок! 🎁"
-                bot.send_message(user_id, receiver_msg, parse_mode='HTML')
+                send_message(user_id, receiver_msg, parse_mode='HTML')
             except Exception as e:
                 print(f"Ошибка при уведомлении получателя: {e}")
                 
@@ -894,21 +1073,39 @@ def process_reveal_one(message):
                     santa_id = get_player_field(santa_player, 'user_id')
                     if santa_id:
                         santa_msg = f"🎅 <b>Внимание!</b>\n\nОрганизатор раскрыл твою тайну досрочно!\n\nТвой подопечный <b>{full_name}</b> теперь знает, что его Сантой был ты!\n\nСпасибо за участие! 🎁"
-                        bot.send_message(santa_id, santa_msg, parse_mode='HTML')
+                        send_message(santa_id, santa_msg, parse_mode='HTML')
             except Exception as e:
                 print(f"Ошибка при уведомлении Санты: {e}")
                 
-            bot.send_message(message.chat.id,
+            send_message(message.chat.id,
                              f"✅ Санта для <b>{full_name}</b> раскрыт!\nСанта: <b>{santa_name}</b>\n\nОба игрока уведомлены.",
                              parse_mode='HTML')
         else:
-            bot.send_message(message.chat.id,
+            send_message(message.chat.id,
                              f"❌ Не удалось раскрыть Санту для <b>{full_name}</b>.\nВозможно, пара не найдена.",
                              parse_mode='HTML')
     except ValueError:
-        bot.send_message(message.chat.id, "❌ Неверный формат ID. Введите числовой ID.")
+        send_message(message.chat.id, "❌ Неверный формат ID. Введите числовой ID.")
+    except Exception as e:
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+
+@with_unit_of_work
+def process_setting_value(message, key):
+    if message.from_user.id not in config.ADMINS:
+        send_message(message.chat.id, "❌ У вас нет прав администратора.")
+        return
+    try:
+        old_year = settings.current().year
+        # Новая версия настроек: остальные процессы подхватят её при следующей проверке
+        game = settings.update(**{key: settings.parse_value(key, message.text)})
+        text = "✅ Настройка сохранена.\n\n" + format_game_settings(game)
+        if game.year != old_year:
+            text += f"\n\n⚠️ Год игры изменился: {old_year} → {game.year}"
+        send_message(message.chat.id, text, parse_mode='HTML')
+    except ValueError as e:
+        send_message(message.chat.id, f"❌ {e}")
     except Exception as e:
-        bot.send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
+        send_message(message.chat.id, f"❌ Ошибка: {str(e)}")
 
 # ================ ЗАПУСК ПРИЛОЖЕНИЯ ================
 if __name__ == '__main__':
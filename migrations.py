@@ -0,0 +1,666 @@
+"""
+Версионные миграции схемы базы данных.
+
+Каждая миграция — набор идемпотентных DDL-запросов для SQLite и PostgreSQL.
+В SQLite нет ADD COLUMN IF NOT EXISTS: такие ALTER TABLE пропускает сам
+раннер, если столбец уже есть (PRAGMA table_info).
+Применённые версии записываются в таблицу schema_version, поэтому при
+актуальной схеме запуск сводится к одному SELECT MAX(version).
+"""
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# ALTER TABLE ... ADD COLUMN в SQLite: (таблица, столбец)
+SQLITE_ADD_COLUMN = re.compile(r'^\s*ALTER\s+TABLE\s+(\w+)\s+ADD\s+COLUMN\s+(\w+)', re.IGNORECASE)
+
+# Ключ advisory-блокировки, чтобы реплики не применяли миграции одновременно
+MIGRATION_LOCK_KEY = 20251215
+
+MIGRATIONS = [
+    {
+        'version': 1,
+        'description': 'Базовая схема: players, santa_pairs, revealed_pairs',
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS players (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER UNIQUE NOT NULL,
+                username TEXT,
+                full_name TEXT NOT NULL,
+                telegram_name TEXT,
+                wish_list TEXT,
+                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_active BOOLEAN DEFAULT 1
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS santa_pairs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                santa_user_id INTEGER NOT NULL,
+                receiver_user_id INTEGER NOT NULL,
+                year INTEGER DEFAULT 2025,
+                is_notified BOOLEAN DEFAULT 0,
+                assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(santa_user_id, year)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS revealed_pairs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                santa_user_id INTEGER NOT NULL,
+                receiver_user_id INTEGER NOT NULL,
+                year INTEGER DEFAULT 2025,
+                revealed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                revealed_by_admin BOOLEAN DEFAULT 0
+            )
+            ''',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS players (
+                id SERIAL PRIMARY KEY,
+                user_id BIGINT UNIQUE NOT NULL,
+                username TEXT,
+                full_name TEXT NOT NULL,
+                telegram_name TEXT,
+                wish_list TEXT,
+                registration_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                is_active BOOLEAN DEFAULT TRUE
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS santa_pairs (
+                id SERIAL PRIMARY KEY,
+                santa_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                receiver_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                year INTEGER DEFAULT 2025,
+                is_notified BOOLEAN DEFAULT FALSE,
+                assignment_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(santa_user_id, year)
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS revealed_pairs (
+                id SERIAL PRIMARY KEY,
+                santa_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                receiver_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                year INTEGER DEFAULT 2025,
+                revealed_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                revealed_by_admin BOOLEAN DEFAULT FALSE
+            )
+            ''',
+        ],
+    },
+    {
+        'version': 2,
+        'description': 'Индексы под запросы бота',
+        'sqlite': [
+            # Перед уникальным индексом убираем возможные дубли раскрытий
+            '''
+            DELETE FROM revealed_pairs
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM revealed_pairs GROUP BY receiver_user_id, year
+            )
+            ''',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_revealed_pairs_receiver_year ON revealed_pairs (receiver_user_id, year)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_santa_pairs_receiver_year ON santa_pairs (receiver_user_id, year)',
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_unnotified ON santa_pairs (year) WHERE is_notified = 0',
+            'CREATE INDEX IF NOT EXISTS idx_players_full_name ON players (full_name)',
+            'CREATE INDEX IF NOT EXISTS idx_players_active_full_name ON players (full_name) WHERE is_active = 1',
+        ],
+        'postgresql': [
+            '''
+            DELETE FROM revealed_pairs
+            WHERE id NOT IN (
+                SELECT MIN(id) FROM revealed_pairs GROUP BY receiver_user_id, year
+            )
+            ''',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_revealed_pairs_receiver_year ON revealed_pairs (receiver_user_id, year)',
+            'CREATE UNIQUE INDEX IF NOT EXISTS idx_santa_pairs_receiver_year ON santa_pairs (receiver_user_id, year)',
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_unnotified ON santa_pairs (year) WHERE is_notified = FALSE',
+            'CREATE INDEX IF NOT EXISTS idx_players_full_name ON players (full_name)',
+            'CREATE INDEX IF NOT EXISTS idx_players_active_full_name ON players (full_name) WHERE is_active = TRUE',
+        ],
+    },
+    {
+        'version': 3,
+        'description': 'Статус раскрытия переносится в santa_pairs (revealed_at, revealed_by_admin)',
+        'sqlite': [
+            'ALTER TABLE santa_pairs ADD COLUMN revealed_at TIMESTAMP',
+            'ALTER TABLE santa_pairs ADD COLUMN revealed_by_admin BOOLEAN DEFAULT 0',
+            '''
+            UPDATE santa_pairs
+            SET revealed_at = (
+                    SELECT rp.revealed_date FROM revealed_pairs rp
+                    WHERE rp.receiver_user_id = santa_pairs.receiver_user_id AND rp.year = santa_pairs.year
+                ),
+                revealed_by_admin = (
+                    SELECT rp.revealed_by_admin FROM revealed_pairs rp
+                    WHERE rp.receiver_user_id = santa_pairs.receiver_user_id AND rp.year = santa_pairs.year
+                )
+            WHERE EXISTS (
+                SELECT 1 FROM revealed_pairs rp
+                WHERE rp.receiver_user_id = santa_pairs.receiver_user_id AND rp.year = santa_pairs.year
+            )
+            ''',
+            'DROP TABLE IF EXISTS revealed_pairs',
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_unrevealed ON santa_pairs (year) WHERE revealed_at IS NULL',
+        ],
+        'postgresql': [
+            'ALTER TABLE santa_pairs ADD COLUMN IF NOT EXISTS revealed_at TIMESTAMP',
+            'ALTER TABLE santa_pairs ADD COLUMN IF NOT EXISTS revealed_by_admin BOOLEAN DEFAULT FALSE',
+            '''
+            UPDATE santa_pairs sp
+            SET revealed_at = rp.revealed_date,
+                revealed_by_admin = rp.revealed_by_admin
+            FROM revealed_pairs rp
+            WHERE rp.receiver_user_id = sp.receiver_user_id AND rp.year = sp.year
+            ''',
+            'DROP TABLE IF EXISTS revealed_pairs',
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_unrevealed ON santa_pairs (year) WHERE revealed_at IS NULL',
+        ],
+    },
+    {
+        'version': 4,
+        'description': 'Карточки назначения assignment_cards (текст для Санты готовится при жеребьёвке)',
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS assignment_cards (
+                santa_user_id INTEGER NOT NULL,
+                year INTEGER NOT NULL,
+                receiver_user_id INTEGER NOT NULL,
+                santa_name TEXT,
+                receiver_name TEXT,
+                wish_list TEXT,
+                message_text TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (santa_user_id, year)
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_assignment_cards_receiver_year ON assignment_cards (receiver_user_id, year)',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS assignment_cards (
+                santa_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                year INTEGER NOT NULL,
+                receiver_user_id BIGINT NOT NULL REFERENCES players(user_id),
+                santa_name TEXT,
+                receiver_name TEXT,
+                wish_list TEXT,
+                message_text TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (santa_user_id, year)
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_assignment_cards_receiver_year ON assignment_cards (receiver_user_id, year)',
+        ],
+    },
+    {
+        'version': 5,
+        'description': 'Счётчики статистики roster_stats и year_stats, обновляемые триггерами',
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS roster_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                players INTEGER NOT NULL DEFAULT 0,
+                active_players INTEGER NOT NULL DEFAULT 0,
+                players_with_wishlist INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS year_stats (
+                year INTEGER PRIMARY KEY,
+                pairs INTEGER NOT NULL DEFAULT 0,
+                revealed INTEGER NOT NULL DEFAULT 0,
+                notified INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            # Начальные значения считаются один раз, дальше их ведут триггеры
+            'DELETE FROM roster_stats',
+            '''
+            INSERT INTO roster_stats (id, players, active_players, players_with_wishlist)
+            SELECT 1, COUNT(*),
+                   COALESCE(SUM(is_active = 1), 0),
+                   COALESCE(SUM(TRIM(COALESCE(wish_list, '')) <> ''), 0)
+            FROM players
+            ''',
+            'DELETE FROM year_stats',
+            '''
+            INSERT INTO year_stats (year, pairs, revealed, notified)
+            SELECT year, COUNT(*), SUM(revealed_at IS NOT NULL), SUM(COALESCE(is_notified, 0) <> 0)
+            FROM santa_pairs
+            GROUP BY year
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_stats_insert AFTER INSERT ON players
+            BEGIN
+                UPDATE roster_stats SET
+                    players = players + 1,
+                    active_players = active_players + (NEW.is_active = 1),
+                    players_with_wishlist = players_with_wishlist + (TRIM(COALESCE(NEW.wish_list, '')) <> '')
+                WHERE id = 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_stats_update
+            AFTER UPDATE OF is_active, wish_list ON players
+            BEGIN
+                UPDATE roster_stats SET
+                    active_players = active_players + (NEW.is_active = 1) - (OLD.is_active = 1),
+                    players_with_wishlist = players_with_wishlist
+                        + (TRIM(COALESCE(NEW.wish_list, '')) <> '')
+                        - (TRIM(COALESCE(OLD.wish_list, '')) <> '')
+                WHERE id = 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_stats_delete AFTER DELETE ON players
+            BEGIN
+                UPDATE roster_stats SET
+                    players = players - 1,
+                    active_players = active_players - (OLD.is_active = 1),
+                    players_with_wishlist = players_with_wishlist - (TRIM(COALESCE(OLD.wish_list, '')) <> '')
+                WHERE id = 1;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_santa_pairs_stats_insert AFTER INSERT ON santa_pairs
+            BEGIN
+                INSERT OR IGNORE INTO year_stats (year) VALUES (NEW.year);
+                UPDATE year_stats SET
+                    pairs = pairs + 1,
+                    revealed = revealed + (NEW.revealed_at IS NOT NULL),
+                    notified = notified + (COALESCE(NEW.is_notified, 0) <> 0)
+                WHERE year = NEW.year;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_santa_pairs_stats_update
+            AFTER UPDATE OF year, revealed_at, is_notified ON santa_pairs
+            BEGIN
+                UPDATE year_stats SET
+                    pairs = pairs - 1,
+                    revealed = revealed - (OLD.revealed_at IS NOT NULL),
+                    notified = notified - (COALESCE(OLD.is_notified, 0) <> 0)
+                WHERE year = OLD.year;
+                INSERT OR IGNORE INTO year_stats (year) VALUES (NEW.year);
+                UPDATE year_stats SET
+                    pairs = pairs + 1,
+                    revealed = revealed + (NEW.revealed_at IS NOT NULL),
+                    notified = notified + (COALESCE(NEW.is_notified, 0) <> 0)
+                WHERE year = NEW.year;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_santa_pairs_stats_delete AFTER DELETE ON santa_pairs
+            BEGIN
+                UPDATE year_stats SET
+                    pairs = pairs - 1,
+                    revealed = revealed - (OLD.revealed_at IS NOT NULL),
+                    notified = notified - (COALESCE(OLD.is_notified, 0) <> 0)
+                WHERE year = OLD.year;
+            END
+            ''',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS roster_stats (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                players INTEGER NOT NULL DEFAULT 0,
+                active_players INTEGER NOT NULL DEFAULT 0,
+                players_with_wishlist INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS year_stats (
+                year INTEGER PRIMARY KEY,
+                pairs INTEGER NOT NULL DEFAULT 0,
+                revealed INTEGER NOT NULL DEFAULT 0,
+                notified INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            'DELETE FROM roster_stats',
+            '''
+            INSERT INTO roster_stats (id, players, active_players, players_with_wishlist)
+            SELECT 1, COUNT(*),
+                   COUNT(*) FILTER (WHERE is_active),
+                   COUNT(*) FILTER (WHERE TRIM(COALESCE(wish_list, '')) <> '')
+            FROM players
+            ''',
+            'DELETE FROM year_stats',
+            '''
+            INSERT INTO year_stats (year, pairs, revealed, notified)
+            SELECT year, COUNT(*),
+                   COUNT(*) FILTER (WHERE revealed_at IS NOT NULL),
+                   COUNT(*) FILTER (WHERE is_notified)
+            FROM santa_pairs
+            GROUP BY year
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION players_stats() RETURNS trigger AS $$
+            DECLARE
+                d_players INTEGER := 0;
+                d_active INTEGER := 0;
+                d_wishlist INTEGER := 0;
+            BEGIN
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    d_players := d_players + 1;
+                    d_active := d_active + COALESCE(NEW.is_active, FALSE)::int;
+                    d_wishlist := d_wishlist + (TRIM(COALESCE(NEW.wish_list, '')) <> '')::int;
+                END IF;
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    d_players := d_players - 1;
+                    d_active := d_active - COALESCE(OLD.is_active, FALSE)::int;
+                    d_wishlist := d_wishlist - (TRIM(COALESCE(OLD.wish_list, '')) <> '')::int;
+                END IF;
+                IF d_players <> 0 OR d_active <> 0 OR d_wishlist <> 0 THEN
+                    UPDATE roster_stats SET
+                        players = players + d_players,
+                        active_players = active_players + d_active,
+                        players_with_wishlist = players_with_wishlist + d_wishlist
+                    WHERE id = 1;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            '''
+            CREATE OR REPLACE FUNCTION santa_pairs_stats() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                    UPDATE year_stats SET
+                        pairs = pairs - 1,
+                        revealed = revealed - (OLD.revealed_at IS NOT NULL)::int,
+                        notified = notified - COALESCE(OLD.is_notified, FALSE)::int
+                    WHERE year = OLD.year;
+                END IF;
+                IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                    INSERT INTO year_stats (year, pairs, revealed, notified)
+                    VALUES (NEW.year, 1, (NEW.revealed_at IS NOT NULL)::int, COALESCE(NEW.is_notified, FALSE)::int)
+                    ON CONFLICT (year) DO UPDATE SET
+                        pairs = year_stats.pairs + 1,
+                        revealed = year_stats.revealed + EXCLUDED.revealed,
+                        notified = year_stats.notified + EXCLUDED.notified;
+                END IF;
+                RETURN NULL;
+            END
+            $$ LANGUAGE plpgsql
+            ''',
+            'DROP TRIGGER IF EXISTS trg_players_stats ON players',
+            '''
+            CREATE TRIGGER trg_players_stats
+            AFTER INSERT OR DELETE OR UPDATE OF is_active, wish_list ON players
+            FOR EACH ROW EXECUTE FUNCTION players_stats()
+            ''',
+            'DROP TRIGGER IF EXISTS trg_santa_pairs_stats ON santa_pairs',
+            '''
+            CREATE TRIGGER trg_santa_pairs_stats
+            AFTER INSERT OR DELETE OR UPDATE OF year, revealed_at, is_notified ON santa_pairs
+            FOR EACH ROW EXECUTE FUNCTION santa_pairs_stats()
+            ''',
+        ],
+    },
+    {
+        'version': 6,
+        'description': 'Настройки игры game_settings и их версия для горячей перезагрузки',
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS game_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            # Одна строка: номер растёт при каждом изменении настроек
+            '''
+            CREATE TABLE IF NOT EXISTS game_settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            'INSERT INTO game_settings_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS game_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            '''
+            CREATE TABLE IF NOT EXISTS game_settings_version (
+                id INTEGER PRIMARY KEY CHECK (id = 1),
+                version INTEGER NOT NULL DEFAULT 0
+            )
+            ''',
+            'INSERT INTO game_settings_version (id, version) VALUES (1, 0) ON CONFLICT (id) DO NOTHING',
+        ],
+    },
+    {
+        'version': 7,
+        'description': 'Полнотекстовый поиск игроков: FTS5 в SQLite, tsvector + GIN в PostgreSQL',
+        'sqlite': [
+            # Внешнее содержимое: текст хранится только в players, индекс ведут триггеры
+            '''
+            CREATE VIRTUAL TABLE IF NOT EXISTS players_fts USING fts5(
+                full_name, username, wish_list,
+                content='players', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2'
+            )
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_fts_insert AFTER INSERT ON players
+            BEGIN
+                INSERT INTO players_fts (rowid, full_name, username, wish_list)
+                VALUES (NEW.id, NEW.full_name, NEW.username, NEW.wish_list);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_fts_delete AFTER DELETE ON players
+            BEGIN
+                INSERT INTO players_fts (players_fts, rowid, full_name, username, wish_list)
+                VALUES ('delete', OLD.id, OLD.full_name, OLD.username, OLD.wish_list);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_players_fts_update
+            AFTER UPDATE OF full_name, username, wish_list ON players
+            BEGIN
+                INSERT INTO players_fts (players_fts, rowid, full_name, username, wish_list)
+                VALUES ('delete', OLD.id, OLD.full_name, OLD.username, OLD.wish_list);
+                INSERT INTO players_fts (rowid, full_name, username, wish_list)
+                VALUES (NEW.id, NEW.full_name, NEW.username, NEW.wish_list);
+            END
+            ''',
+            # Индекс по уже зарегистрированным игрокам
+            "INSERT INTO players_fts (players_fts) VALUES ('rebuild')",
+        ],
+        'postgresql': [
+            # Конфигурация 'simple' без стемминга — поиск ведёт себя так же, как unicode61 в SQLite
+            '''
+            ALTER TABLE players ADD COLUMN IF NOT EXISTS search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', COALESCE(full_name, '')), 'A') ||
+                setweight(to_tsvector('simple', COALESCE(username, '')), 'A') ||
+                setweight(to_tsvector('simple', COALESCE(wish_list, '')), 'D')
+            ) STORED
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_players_search_vector ON players USING GIN (search_vector)',
+        ],
+    },
+    {
+        'version': 8,
+        'description': 'Правила жеребьёвки: команды игроков и взаимные исключения draw_exclusions',
+        'sqlite': [
+            'ALTER TABLE players ADD COLUMN team TEXT',
+            # Пара хранится один раз: user_id_a < user_id_b, запрет действует в обе стороны
+            '''
+            CREATE TABLE IF NOT EXISTS draw_exclusions (
+                user_id_a INTEGER NOT NULL,
+                user_id_b INTEGER NOT NULL,
+                reason TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id_a, user_id_b),
+                CHECK (user_id_a < user_id_b)
+            )
+            ''',
+            # Пары прошлых лет читаются диапазоном по году
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_year ON santa_pairs (year)',
+        ],
+        'postgresql': [
+            'ALTER TABLE players ADD COLUMN IF NOT EXISTS team TEXT',
+            '''
+            CREATE TABLE IF NOT EXISTS draw_exclusions (
+                user_id_a BIGINT NOT NULL REFERENCES players(user_id) ON DELETE CASCADE,
+                user_id_b BIGINT NOT NULL REFERENCES players(user_id) ON DELETE CASCADE,
+                reason TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (user_id_a, user_id_b),
+                CHECK (user_id_a < user_id_b)
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_year ON santa_pairs (year)',
+        ],
+    },
+    {
+        'version': 9,
+        'description': 'Индекс santa_pairs (year, santa_user_id) для правок жеребьёвки после её проведения',
+        # Пары года по порядку Сант со случайного места — без сортировки всего года;
+        # индекс по одному году становится лишним
+        'sqlite': [
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_year_santa ON santa_pairs (year, santa_user_id)',
+            'DROP INDEX IF EXISTS idx_santa_pairs_year',
+        ],
+        'postgresql': [
+            'CREATE INDEX IF NOT EXISTS idx_santa_pairs_year_santa ON santa_pairs (year, santa_user_id)',
+            'DROP INDEX IF EXISTS idx_santa_pairs_year',
+        ],
+    },
+    {
+        'version': 10,
+        'description': 'Журнал жеребьёвок draw_runs: ключ идемпотентности и результат',
+        # Строка пишется в одной транзакции с парами: есть строка — есть и пары
+        'sqlite': [
+            '''
+            CREATE TABLE IF NOT EXISTS draw_runs (
+                token TEXT PRIMARY KEY,
+                year INTEGER NOT NULL,
+                strategy TEXT NOT NULL,
+                seed INTEGER,
+                pairs_count INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_draw_runs_year ON draw_runs (year)',
+        ],
+        'postgresql': [
+            '''
+            CREATE TABLE IF NOT EXISTS draw_runs (
+                token TEXT PRIMARY KEY,
+                year INTEGER NOT NULL,
+                strategy TEXT NOT NULL,
+                seed BIGINT,
+                pairs_count INTEGER NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+            ''',
+            'CREATE INDEX IF NOT EXISTS idx_draw_runs_year ON draw_runs (year)',
+        ],
+    },
+]
+
+LATEST_VERSION = MIGRATIONS[-1]['version']
+
+
+def get_schema_version(db):
+    """Текущая версия схемы (0, если таблицы schema_version ещё нет)."""
+    # Напрямую, без _execute_query: отсутствие таблицы на новой БД — не ошибка
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT MAX(version) AS version FROM schema_version')
+        result = cursor.fetchone()
+    except Exception:
+        conn.rollback()
+        return 0
+    finally:
+        cursor.close()
+        conn.close()
+    if not result or result['version'] is None:
+        return 0
+    return result['version']
+
+
+def apply_migrations(db):
+    """Применяет все недостающие миграции. Возвращает итоговую версию схемы."""
+    current = get_schema_version(db)
+    if current >= LATEST_VERSION:
+        print(f"✅ Схема БД актуальна (версия {current})")
+        return current
+
+    db._execute_query('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    for migration in MIGRATIONS:
+        if migration['version'] <= current:
+            continue
+        current = _apply_migration(db, migration)
+
+    print(f"✅ Схема БД обновлена до версии {current}")
+    return current
+
+
+def _apply_migration(db, migration):
+    """Применяет одну миграцию в отдельной транзакции."""
+    version = migration['version']
+
+    with db.unit_of_work():
+        if db.db_type == 'postgresql':
+            # Блокировка снимается автоматически в конце транзакции
+            db._execute_query('SELECT pg_advisory_xact_lock(?)', (MIGRATION_LOCK_KEY,), fetchone=True)
+        else:
+            db._execute_query('BEGIN IMMEDIATE')
+
+        # Другой процесс мог применить миграцию, пока мы ждали блокировку
+        applied = db._execute_query(
+            'SELECT version FROM schema_version WHERE version = ?', (version,), fetchone=True
+        )
+        if applied:
+            return version
+
+        print(f"🔄 Миграция {version}: {migration['description']}")
+        for statement in migration[db.db_type]:
+            if not _column_exists(db, statement):
+                db._execute_query(statement)
+        db._execute_query(
+            'INSERT INTO schema_version (version, description) VALUES (?, ?)',
+            (version, migration['description'])
+        )
+
+    logger.info(f"✅ Миграция {version} применена")
+    return version
+
+
+def _column_exists(db, statement):
+    """
+    Столбец из ALTER TABLE ... ADD COLUMN уже есть (только SQLite: схему
+    правили вручную или потеряна запись в schema_version).
+    """
+    match = db.db_type == 'sqlite' and SQLITE_ADD_COLUMN.match(statement)
+    if not match:
+        return False
+    table, column = match.groups()
+    rows = db._execute_query(f'PRAGMA table_info({table})', fetchall=True)
+    if any(row['name'] == column for row in rows):
+        print(f"ℹ️ Столбец {table}.{column} уже есть — пропускаю")
+        return True
+    return False
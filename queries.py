@@ -0,0 +1,495 @@
+"""
+Реестр именованных SQL-запросов бота.
+
+Запросы пишутся один раз в нейтральном виде: параметры — '?',
+логические константы — {true}/{false}, текущее время — {now}.
+При старте реестр компилируется под диалект БД, поэтому во время
+выполнения запроса никаких преобразований строк не происходит.
+Если диалекты расходятся по-настоящему, запрос задаётся словарём
+{'sqlite': ..., 'postgresql': ...}.
+"""
+
+DIALECT_TOKENS = {
+    'sqlite': {'{true}': '1', '{false}': '0', '{now}': 'CURRENT_TIMESTAMP'},
+    'postgresql': {'{true}': 'TRUE', '{false}': 'FALSE', '{now}': 'CURRENT_TIMESTAMP'},
+}
+
+# Нарушает ли пара sp (santa_user_id → receiver_user_id) правила жеребьёвки.
+# Параметры: separate_teams (1/0), затем годы [?, ?) для пар прошлых лет
+DRAW_RULE_VIOLATED = '''
+    EXISTS (SELECT 1 FROM draw_exclusions e
+            WHERE (e.user_id_a = sp.santa_user_id AND e.user_id_b = sp.receiver_user_id)
+               OR (e.user_id_a = sp.receiver_user_id AND e.user_id_b = sp.santa_user_id))
+    OR (? = 1 AND EXISTS (SELECT 1 FROM players s
+                          JOIN players r ON r.user_id = sp.receiver_user_id
+                          WHERE s.user_id = sp.santa_user_id AND s.team = r.team))
+    OR EXISTS (SELECT 1 FROM santa_pairs old
+               WHERE old.santa_user_id = sp.santa_user_id
+                 AND old.receiver_user_id = sp.receiver_user_id
+                 AND old.year >= ? AND old.year < ?)
+'''
+
+QUERIES = {
+    # === ИГРОКИ ===
+    'upsert_player': '''
+        INSERT INTO players
+        (user_id, username, full_name, telegram_name, wish_list, is_active)
+        VALUES (?, ?, ?, ?, ?, {true})
+        ON CONFLICT (user_id) DO UPDATE SET
+            username = excluded.username,
+            full_name = excluded.full_name,
+            telegram_name = excluded.telegram_name,
+            wish_list = excluded.wish_list,
+            is_active = {true}
+    ''',
+    'get_player': 'SELECT * FROM players WHERE user_id = ?',
+    'get_player_by_name': 'SELECT * FROM players WHERE full_name = ?',
+    'get_all_active_players': '''
+        SELECT user_id, full_name, username, wish_list
+        FROM players
+        WHERE is_active = {true}
+        ORDER BY full_name
+    ''',
+    'get_all_players_with_wishlists': '''
+        SELECT user_id, full_name, username, wish_list
+        FROM players
+        WHERE is_active = {true} AND wish_list IS NOT NULL AND wish_list != ''
+        ORDER BY full_name
+    ''',
+    # /status одним запросом: все соединения — по первичным/уникальным ключам
+    'get_player_dashboard': '''
+        SELECT
+            p.id, p.user_id, p.username, p.full_name, p.telegram_name,
+            p.wish_list, p.registration_date, p.is_active,
+            own.receiver_user_id,
+            receiver.full_name AS receiver_name,
+            receiver.wish_list AS receiver_wish_list,
+            santa.full_name AS santa_name,
+            theirs.revealed_at IS NOT NULL AS santa_revealed
+        FROM players p
+        LEFT JOIN santa_pairs own ON own.santa_user_id = p.user_id AND own.year = ?
+        LEFT JOIN players receiver ON receiver.user_id = own.receiver_user_id
+        LEFT JOIN santa_pairs theirs ON theirs.receiver_user_id = p.user_id AND theirs.year = ?
+        LEFT JOIN players santa ON santa.user_id = theirs.santa_user_id
+        WHERE p.user_id = ?
+    ''',
+    'update_wishlist': 'UPDATE players SET wish_list = ? WHERE user_id = ?',
+    'deactivate_player': 'UPDATE players SET is_active = {false} WHERE user_id = ?',
+    'delete_player_pairs': 'DELETE FROM santa_pairs WHERE santa_user_id = ? OR receiver_user_id = ?',
+    'delete_player': 'DELETE FROM players WHERE user_id = ?',
+
+    # === ЖЕРЕБЬЁВКА И ПАРЫ ===
+    'count_pairs': 'SELECT COUNT(*) AS count FROM santa_pairs WHERE year = ?',
+    # Для PostgreSQL — шаблон execute_values, для SQLite — executemany
+    'insert_pairs': {
+        'sqlite': 'INSERT INTO santa_pairs (santa_user_id, receiver_user_id, year) VALUES (?, ?, ?)',
+        'postgresql': 'INSERT INTO santa_pairs (santa_user_id, receiver_user_id, year) VALUES %s',
+    },
+    # Жеребьёвка в БД: активные игроки по случайному ключу, каждый дарит
+    # следующему, последний — первому (один общий круг). ? — год
+    'draw_in_database': '''
+        INSERT INTO santa_pairs (santa_user_id, receiver_user_id, year)
+        SELECT user_id,
+               COALESCE(LEAD(user_id) OVER ring, FIRST_VALUE(user_id) OVER ring),
+               ?
+        FROM (SELECT user_id, random() AS draw_key FROM players WHERE is_active = {true}) shuffled
+        WINDOW ring AS (ORDER BY draw_key, user_id)
+    ''',
+    # Журнал жеребьёвок (миграция 10): результат по ключу идемпотентности
+    'get_draw_run': 'SELECT * FROM draw_runs WHERE token = ?',
+    'get_year_draw_run': 'SELECT * FROM draw_runs WHERE year = ? ORDER BY created_at DESC LIMIT 1',
+    'insert_draw_run': '''
+        INSERT INTO draw_runs (token, year, strategy, seed, pairs_count) VALUES (?, ?, ?, ?, ?)
+    ''',
+    'clear_draw_runs': 'DELETE FROM draw_runs WHERE year = ?',
+    # Пустая запись: в уже открытой транзакции SQLite берёт блокировку записи (см. _lock_draw)
+    'lock_draw_runs': 'DELETE FROM draw_runs WHERE year IS NULL',
+    'count_active_players': 'SELECT active_players AS count FROM roster_stats WHERE id = 1',
+    'get_santa_pair': '''
+        SELECT p.full_name
+        FROM santa_pairs sp
+        JOIN players p ON sp.receiver_user_id = p.user_id
+        WHERE sp.santa_user_id = ? AND sp.year = ?
+    ''',
+    'get_receiver_pair': '''
+        SELECT p.full_name
+        FROM santa_pairs sp
+        JOIN players p ON sp.santa_user_id = p.user_id
+        WHERE sp.receiver_user_id = ? AND sp.year = ?
+    ''',
+    'get_receiver_wishlist': '''
+        SELECT p.wish_list
+        FROM santa_pairs sp
+        JOIN players p ON sp.receiver_user_id = p.user_id
+        WHERE sp.santa_user_id = ? AND sp.year = ?
+    ''',
+    'get_pairs_overview': '''
+        SELECT
+            santa.full_name AS santa_name,
+            receiver.full_name AS receiver_name,
+            sp.santa_user_id,
+            sp.receiver_user_id,
+            receiver.wish_list,
+            sp.revealed_at IS NOT NULL AS revealed
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE sp.year = ?
+    ''',
+    # Всё для PairIndex одним запросом
+    'get_pair_index': '''
+        SELECT
+            sp.santa_user_id,
+            sp.receiver_user_id,
+            santa.full_name AS santa_name,
+            receiver.full_name AS receiver_name,
+            sp.revealed_at IS NOT NULL AS revealed
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE sp.year = ?
+    ''',
+    'clear_pairs': 'DELETE FROM santa_pairs WHERE year = ?',
+    'mark_as_notified': '''
+        UPDATE santa_pairs
+        SET is_notified = {true}
+        WHERE santa_user_id = ? AND year = ?
+    ''',
+    # Пачка Сант одним UPDATE: список id — JSON-массив в SQLite, массив в PostgreSQL
+    'mark_many_as_notified': {
+        'sqlite': '''
+            UPDATE santa_pairs
+            SET is_notified = 1
+            WHERE year = ? AND santa_user_id IN (SELECT value FROM json_each(?))
+        ''',
+        'postgresql': '''
+            UPDATE santa_pairs
+            SET is_notified = TRUE
+            WHERE year = ? AND santa_user_id = ANY(?)
+        ''',
+    },
+    # Всё для рассылки одним соединением по user_id: имена, пожелания и готовый
+    # текст карточки (NULL, если карточки нет — пары жеребьёвки до миграции 4)
+    'get_unnotified_pairs': '''
+        SELECT
+            sp.santa_user_id, sp.receiver_user_id, sp.year,
+            santa.full_name AS santa_name,
+            receiver.full_name AS receiver_name,
+            receiver.wish_list,
+            c.message_text
+        FROM santa_pairs sp
+        JOIN players santa ON santa.user_id = sp.santa_user_id
+        JOIN players receiver ON receiver.user_id = sp.receiver_user_id
+        LEFT JOIN assignment_cards c ON c.santa_user_id = sp.santa_user_id AND c.year = sp.year
+        WHERE sp.year = ? AND sp.is_notified = {false}
+        ORDER BY sp.santa_user_id
+    ''',
+    # Страница рассылки: тот же запрос по ключу santa_user_id > ? (индекс year, santa_user_id)
+    'get_unnotified_cards_page': '''
+        SELECT
+            sp.santa_user_id, sp.receiver_user_id, sp.year,
+            santa.full_name AS santa_name,
+            receiver.full_name AS receiver_name,
+            receiver.wish_list,
+            c.message_text
+        FROM santa_pairs sp
+        JOIN players santa ON santa.user_id = sp.santa_user_id
+        JOIN players receiver ON receiver.user_id = sp.receiver_user_id
+        LEFT JOIN assignment_cards c ON c.santa_user_id = sp.santa_user_id AND c.year = sp.year
+        WHERE sp.year = ? AND sp.santa_user_id > ? AND sp.is_notified = {false}
+        ORDER BY sp.santa_user_id
+        LIMIT ?
+    ''',
+
+    # === ПРАВИЛА ЖЕРЕБЬЁВКИ ===
+    'get_draw_exclusions': 'SELECT user_id_a, user_id_b FROM draw_exclusions',
+    'list_draw_exclusions': '''
+        SELECT e.user_id_a, a.full_name AS name_a, e.user_id_b, b.full_name AS name_b, e.reason
+        FROM draw_exclusions e
+        LEFT JOIN players a ON a.user_id = e.user_id_a
+        LEFT JOIN players b ON b.user_id = e.user_id_b
+        ORDER BY a.full_name, b.full_name
+    ''',
+    'add_draw_exclusion': '''
+        INSERT INTO draw_exclusions (user_id_a, user_id_b, reason) VALUES (?, ?, ?)
+        ON CONFLICT (user_id_a, user_id_b) DO UPDATE SET reason = excluded.reason
+    ''',
+    'delete_draw_exclusion': 'DELETE FROM draw_exclusions WHERE user_id_a = ? AND user_id_b = ?',
+    'delete_player_exclusions': 'DELETE FROM draw_exclusions WHERE user_id_a = ? OR user_id_b = ?',
+    'get_player_teams': '''
+        SELECT user_id, team FROM players
+        WHERE is_active = {true} AND team IS NOT NULL AND team <> ''
+    ''',
+    'set_player_team': 'UPDATE players SET team = ? WHERE user_id = ?',
+    # Пары прошлых лет: год в [?, ?)
+    'get_previous_pairs': '''
+        SELECT santa_user_id, receiver_user_id FROM santa_pairs
+        WHERE year >= ? AND year < ?
+    ''',
+    # Пары года, нарушающие правила: год, DRAW_RULE_VIOLATED, лимит
+    'find_draw_violations': '''
+        SELECT sp.santa_user_id, sp.receiver_user_id FROM santa_pairs sp
+        WHERE sp.year = ? AND (''' + DRAW_RULE_VIOLATED + ''')
+        ORDER BY sp.santa_user_id
+        LIMIT ?
+    ''',
+    # Нарушает ли правила пара Санта ? → получатель ?: 1 или 0
+    'check_draw_pair': '''
+        SELECT COUNT(*) AS count
+        FROM (SELECT CAST(? AS BIGINT) AS santa_user_id, CAST(? AS BIGINT) AS receiver_user_id) sp
+        WHERE ''' + DRAW_RULE_VIOLATED + '''
+    ''',
+    # Границы user_id — по уникальному индексу players, без чтения пар года
+    # Число пар года из счётчика year_stats (триггеры) — без подсчёта строк
+    'year_pair_count': 'SELECT COALESCE((SELECT pairs FROM year_stats WHERE year = ?), 0) AS count',
+    # Окно пар года подряд по santa_user_id со случайной позиции — кандидаты для обмена.
+    # OFFSET проходит по индексу (year, santa_user_id), не читая сами строки
+    'sample_draw_pairs': '''
+        SELECT santa_user_id, receiver_user_id FROM santa_pairs
+        WHERE year = ?
+        ORDER BY santa_user_id
+        LIMIT ? OFFSET ?
+    ''',
+    'delete_draw_pairs': 'DELETE FROM santa_pairs WHERE year = ? AND santa_user_id IN (?, ?)',
+    # Пара, где игрок Санта, и пара, где он получатель (до двух строк по индексам)
+    'get_draw_links': '''
+        SELECT santa_user_id, receiver_user_id FROM santa_pairs
+        WHERE year = ? AND (santa_user_id = ? OR receiver_user_id = ?)
+    ''',
+
+    # === КАРТОЧКИ НАЗНАЧЕНИЯ ===
+    'get_card': 'SELECT * FROM assignment_cards WHERE santa_user_id = ? AND year = ?',
+    # Исходные данные для карточки: пара + актуальные имена и пожелания
+    'get_card_source': '''
+        SELECT sp.santa_user_id, sp.year, sp.receiver_user_id,
+               santa.full_name AS santa_name, receiver.full_name AS receiver_name, receiver.wish_list
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE sp.santa_user_id = ? AND sp.year = ?
+    ''',
+    # Карточки года, где игрок Санта (имя в приветствии) или получатель (имя и пожелания)
+    'get_card_sources_for_player': '''
+        SELECT sp.santa_user_id, sp.year, sp.receiver_user_id,
+               santa.full_name AS santa_name, receiver.full_name AS receiver_name, receiver.wish_list
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE (sp.santa_user_id = ? AND sp.year = ?) OR (sp.receiver_user_id = ? AND sp.year = ?)
+    ''',
+    # Все карточки года — перерисовка после изменения дат или бюджета
+    'get_card_sources_for_year': '''
+        SELECT sp.santa_user_id, sp.year, sp.receiver_user_id,
+               santa.full_name AS santa_name, receiver.full_name AS receiver_name, receiver.wish_list
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE sp.year = ?
+    ''',
+    # Для PostgreSQL — шаблон execute_values, для SQLite — executemany
+    'upsert_cards': {
+        'sqlite': '''
+            INSERT INTO assignment_cards
+            (santa_user_id, year, receiver_user_id, santa_name, receiver_name, wish_list, message_text)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (santa_user_id, year) DO UPDATE SET
+                receiver_user_id = excluded.receiver_user_id,
+                santa_name = excluded.santa_name,
+                receiver_name = excluded.receiver_name,
+                wish_list = excluded.wish_list,
+                message_text = excluded.message_text,
+                updated_at = CURRENT_TIMESTAMP
+        ''',
+        'postgresql': '''
+            INSERT INTO assignment_cards
+            (santa_user_id, year, receiver_user_id, santa_name, receiver_name, wish_list, message_text)
+            VALUES %s
+            ON CONFLICT (santa_user_id, year) DO UPDATE SET
+                receiver_user_id = excluded.receiver_user_id,
+                santa_name = excluded.santa_name,
+                receiver_name = excluded.receiver_name,
+                wish_list = excluded.wish_list,
+                message_text = excluded.message_text,
+                updated_at = CURRENT_TIMESTAMP
+        ''',
+    },
+    'delete_player_cards': 'DELETE FROM assignment_cards WHERE santa_user_id = ? OR receiver_user_id = ?',
+    'clear_cards': 'DELETE FROM assignment_cards WHERE year = ?',
+    'delete_year_card': 'DELETE FROM assignment_cards WHERE santa_user_id = ? AND year = ?',
+
+    # === РАСКРЫТИЕ ===
+    'reveal_pair': '''
+        UPDATE santa_pairs
+        SET revealed_at = {now}, revealed_by_admin = ?
+        WHERE receiver_user_id = ? AND year = ? AND revealed_at IS NULL
+        RETURNING (SELECT full_name FROM players WHERE user_id = santa_pairs.santa_user_id) AS santa_name
+    ''',
+    'reveal_all_pairs': '''
+        UPDATE santa_pairs
+        SET revealed_at = {now}, revealed_by_admin = ?
+        WHERE year = ? AND revealed_at IS NULL
+        RETURNING santa_user_id, receiver_user_id,
+            (SELECT full_name FROM players WHERE user_id = santa_pairs.santa_user_id) AS santa_name,
+            (SELECT full_name FROM players WHERE user_id = santa_pairs.receiver_user_id) AS receiver_name
+    ''',
+    'get_all_pairs_to_reveal': '''
+        SELECT sp.santa_user_id, sp.receiver_user_id,
+               santa.full_name AS santa_name, receiver.full_name AS receiver_name
+        FROM santa_pairs sp
+        JOIN players santa ON sp.santa_user_id = santa.user_id
+        JOIN players receiver ON sp.receiver_user_id = receiver.user_id
+        WHERE sp.year = ? AND sp.revealed_at IS NULL
+        ORDER BY santa.full_name
+    ''',
+    'is_pair_revealed': '''
+        SELECT id FROM santa_pairs
+        WHERE receiver_user_id = ? AND year = ? AND revealed_at IS NOT NULL
+    ''',
+
+    # === СТАТИСТИКА И СЛУЖЕБНОЕ ===
+    # Счётчики ведут триггеры миграции 5 — одна строка вместо COUNT(*) по таблицам
+    'get_game_stats': '''
+        SELECT
+            r.players, r.active_players, r.players_with_wishlist,
+            COALESCE(y.pairs, 0) AS pairs,
+            COALESCE(y.revealed, 0) AS revealed,
+            COALESCE(y.notified, 0) AS notified
+        FROM roster_stats r
+        LEFT JOIN year_stats y ON y.year = ?
+        WHERE r.id = 1
+    ''',
+    # Таблицы схемы с оценкой числа строк и размерами — без чтения самих таблиц
+    'table_sizes': {
+        'sqlite': '''
+            SELECT name, NULL AS estimated_rows, NULL AS table_bytes, NULL AS index_bytes
+            FROM sqlite_master
+            WHERE type = 'table' AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'players_fts%'
+            ORDER BY name
+        ''',
+        'postgresql': '''
+            SELECT
+                c.relname AS name,
+                GREATEST(c.reltuples, 0)::BIGINT AS estimated_rows,
+                pg_table_size(c.oid) AS table_bytes,
+                pg_indexes_size(c.oid) AS index_bytes
+            FROM pg_class c
+            JOIN pg_namespace n ON n.oid = c.relnamespace
+            WHERE n.nspname = current_schema() AND c.relkind = 'r'
+            ORDER BY c.relname
+        ''',
+    },
+    'table_counters': '''
+        SELECT
+            (SELECT players FROM roster_stats WHERE id = 1) AS players,
+            (SELECT COALESCE(SUM(pairs), 0) FROM year_stats) AS santa_pairs
+    ''',
+    'get_recent_players': 'SELECT * FROM players ORDER BY id DESC LIMIT ?',
+    # Полнотекстовый поиск (миграция 7): ? — выражение поиска, лимит, смещение.
+    # Имя и username весят больше пожеланий; ⟦ ⟧ отмечают совпадения во фрагменте
+    'search_players': {
+        'sqlite': '''
+            SELECT p.user_id, p.username, p.full_name, p.is_active,
+                   snippet(players_fts, 2, '⟦', '⟧', '…', 12) AS snippet,
+                   bm25(players_fts, 10.0, 10.0, 1.0) AS rank
+            FROM players_fts
+            JOIN players p ON p.id = players_fts.rowid
+            WHERE players_fts MATCH ?
+            ORDER BY rank, p.id
+            LIMIT ? OFFSET ?
+        ''',
+        'postgresql': '''
+            SELECT p.user_id, p.username, p.full_name, p.is_active,
+                   ts_headline('simple', COALESCE(p.wish_list, ''), hit.q,
+                               'StartSel=⟦, StopSel=⟧, MaxWords=12, MinWords=4') AS snippet,
+                   hit.rank
+            FROM (
+                SELECT id, q, ts_rank(search_vector, q) AS rank
+                FROM players, to_tsquery('simple', ?) AS q
+                WHERE search_vector @@ q
+                ORDER BY rank DESC, id
+                LIMIT ? OFFSET ?
+            ) hit
+            JOIN players p ON p.id = hit.id
+            ORDER BY hit.rank DESC, p.id
+        ''',
+    },
+
+    # === НАСТРОЙКИ ИГРЫ ===
+    'get_game_settings': 'SELECT key, value FROM game_settings',
+    'get_settings_version': 'SELECT version FROM game_settings_version WHERE id = 1',
+    'upsert_game_setting': '''
+        INSERT INTO game_settings (key, value, updated_at) VALUES (?, ?, {now})
+        ON CONFLICT (key) DO UPDATE SET value = excluded.value, updated_at = excluded.updated_at
+    ''',
+    'bump_settings_version': '''
+        UPDATE game_settings_version SET version = version + 1
+        WHERE id = 1
+        RETURNING version
+    ''',
+    'server_version': {
+        'sqlite': 'SELECT sqlite_version() AS version',
+        'postgresql': 'SELECT version() AS version',
+    },
+}
+
+
+class Query:
+    """Запрос, скомпилированный под конкретный диалект."""
+
+    __slots__ = ('name', 'sql', 'readonly', 'param_count',
+                 'prepared_name', 'prepared_sql', 'execute_sql')
+
+    def __init__(self, name, sql, readonly, param_count, prepared_sql=None):
+        self.name = name
+        self.sql = sql
+        self.readonly = readonly
+        self.param_count = param_count
+        # PREPARE/EXECUTE для PostgreSQL (None, если запрос без параметров)
+        self.prepared_name = f"santa_{name}"
+        self.prepared_sql = prepared_sql
+        self.execute_sql = None
+        if prepared_sql:
+            placeholders = ', '.join(['%s'] * param_count)
+            self.execute_sql = f"EXECUTE {self.prepared_name} ({placeholders})"
+
+
+def compile_query(name, spec, dialect):
+    """Подставляет токены диалекта и плейсхолдеры параметров."""
+    raw = spec[dialect] if isinstance(spec, dict) else spec
+    sql = ' '.join(raw.split())
+
+    for token, value in DIALECT_TOKENS[dialect].items():
+        sql = sql.replace(token, value)
+
+    param_count = sql.count('?')
+    readonly = sql.upper().startswith('SELECT')
+    prepared_sql = None
+
+    if dialect == 'postgresql' and param_count:
+        # Для PREPARE параметры нумеруются: $1, $2, ...
+        parts = sql.split('?')
+        prepared_sql = parts[0] + ''.join(f'${i}{part}' for i, part in enumerate(parts[1:], 1))
+        # Для psycopg2 литеральный % нужно удвоить
+        sql = sql.replace('%', '%%').replace('?', '%s')
+
+    return Query(name, sql, readonly, param_count, prepared_sql)
+
+
+class QueryRegistry:
+    """Все запросы из QUERIES, скомпилированные один раз под диалект."""
+
+    def __init__(self, dialect, queries=None):
+        self.dialect = dialect
+        self._queries = {
+            name: compile_query(name, spec, dialect)
+            for name, spec in (queries or QUERIES).items()
+        }
+
+    def __getitem__(self, name):
+        return self._queries[name]
+
+    def __contains__(self, name):
+        return name in self._queries
+
+    def names(self):
+        return list(self._queries)
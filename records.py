@@ -0,0 +1,118 @@
+"""
+Компактные записи для строк из базы данных.
+
+Курсоры отдают обычные кортежи, а записи строятся прямо из них:
+у записи __slots__ вместо словаря атрибутов, поэтому на больших
+выборках (весь состав игроков, все пары года) память заметно меньше,
+чем у RealDictRow / sqlite3.Row. Поля, которых нет в выборке, равны None.
+"""
+
+
+class Record:
+    """Базовая запись: поля перечисляются в __slots__ наследника."""
+
+    __slots__ = ()
+
+    @classmethod
+    def reader(cls, columns):
+        """
+        Функция, собирающая запись из кортежа-строки.
+        Позиции колонок вычисляются один раз на выборку по cursor.description.
+        """
+        index = {name: i for i, name in enumerate(columns)}
+        fields = [(slot, index.get(slot)) for slot in cls.__slots__]
+        new = object.__new__
+
+        def read(row):
+            record = new(cls)
+            for slot, i in fields:
+                setattr(record, slot, None if i is None else row[i])
+            return record
+
+        return read
+
+    @classmethod
+    def copy_from(cls, source, **fields):
+        """Запись из атрибутов другой записи; fields переопределяют значения."""
+        record = object.__new__(cls)
+        for slot in cls.__slots__:
+            setattr(record, slot, fields[slot] if slot in fields else getattr(source, slot, None))
+        return record
+
+    def as_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    def __eq__(self, other):
+        if type(other) is not type(self):
+            return NotImplemented
+        return all(getattr(self, slot) == getattr(other, slot) for slot in self.__slots__)
+
+    def __repr__(self):
+        fields = ', '.join(f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__
+                           if getattr(self, slot) is not None)
+        return f"{type(self).__name__}({fields})"
+
+
+class Player(Record):
+    """Игрок (строка таблицы players)."""
+
+    __slots__ = ('id', 'user_id', 'username', 'full_name', 'telegram_name',
+                 'wish_list', 'registration_date', 'is_active')
+
+
+class Pair(Record):
+    """Пара Санта → получатель вместе с именами из players."""
+
+    __slots__ = ('santa_user_id', 'receiver_user_id', 'year',
+                 'santa_name', 'receiver_name', 'wish_list',
+                 'is_notified', 'revealed')
+
+
+class AssignmentCard(Record):
+    """Карточка назначения Санты (строка таблицы assignment_cards)."""
+
+    __slots__ = ('santa_user_id', 'year', 'receiver_user_id', 'santa_name',
+                 'receiver_name', 'wish_list', 'message_text', 'updated_at')
+
+
+class PlayerDashboard(Record):
+    """Всё для /status: игрок, его подопечный и его Санта."""
+
+    __slots__ = Player.__slots__ + ('receiver_user_id', 'receiver_name', 'receiver_wish_list',
+                                    'santa_name', 'santa_revealed')
+
+
+class TableSize(Record):
+    """Размер таблицы БД: оценка строк, байты и итог последнего точного пересчёта."""
+
+    __slots__ = ('name', 'estimated_rows', 'table_bytes', 'index_bytes',
+                 'exact_rows', 'counted_at')
+
+
+class SearchHit(Record):
+    """Результат поиска игроков: игрок, фрагмент с совпадением и релевантность."""
+
+    __slots__ = ('user_id', 'username', 'full_name', 'is_active', 'snippet', 'rank')
+
+
+class DrawResult(Record):
+    """
+    Итог жеребьёвки (строка draw_runs). performed — пары созданы этим
+    вызовом perform_draw, а не найдены готовыми. Истинен, если пары есть.
+    """
+
+    __slots__ = ('token', 'year', 'strategy', 'seed', 'pairs_count', 'created_at', 'performed')
+
+    def __bool__(self):
+        return bool(self.pairs_count)
+
+
+class DrawChange(Record):
+    """
+    Изменение проведённой жеребьёвки (remove_from_draw): affected — Санты,
+    которым нужно заново отправить назначение. Если допустимой замены не
+    нашлось, unassigned_santa остался без подопечного, а orphan_receiver —
+    без Санты (это может быть тот же игрок).
+    """
+
+    __slots__ = ('affected', 'unassigned_santa', 'orphan_receiver')
@@ -0,0 +1,273 @@
+"""
+Настройки игры: даты жеребьёвки, дедлайна и раскрытия, бюджет подарка,
+правила жеребьёвки.
+
+Значения по умолчанию берутся из config.py, а изменённые администратором
+хранятся в таблице game_settings. Все модули читают настройки через
+settings.current() — снимок в памяти процесса. Не чаще раза в
+SETTINGS_POLL_INTERVAL секунд снимок сверяет номер версии
+(game_settings_version, одна строка по ключу) и перечитывает таблицу,
+только если версия изменилась. Так изменение из админки доходит до всех
+процессов бота без перезапуска, а обычный запрос к настройкам не
+обращается к базе вовсе.
+"""
+import os
+import threading
+import time
+from datetime import date, datetime
+
+import config
+
+# Ключ в game_settings → (подпись в админке, тип значения)
+FIELDS = {
+    'draw_date': ('Дата жеребьёвки', 'date'),
+    'gift_deadline': ('Дедлайн для подарков', 'date'),
+    'reveal_date': ('Раскрытие Сант', 'date'),
+    'gift_budget': ('Бюджет подарка', 'text'),
+    'no_repeat_years': ('Не повторять пары прошлых лет (лет)', 'number'),
+    'separate_teams': ('Не дарить внутри команды', 'flag'),
+}
+
+# Подсказка для ввода значения в админке по типу
+INPUT_HINTS = {
+    'date': 'в формате ДД.ММ.ГГГГ',
+    'text': 'текстом',
+    'number': 'целым числом (0 — без ограничения)',
+    'flag': 'словом «да» или «нет»',
+}
+
+FLAG_WORDS = {'да': True, 'нет': False, 'yes': True, 'no': False, '1': True, '0': False,
+              'вкл': True, 'выкл': False}
+
+# Настройки, которые напечатаны в карточках назначения
+CARD_FIELDS = ('gift_deadline', 'reveal_date', 'gift_budget')
+
+
+def default_values():
+    """Значения из config.py — для ключей, которых нет в game_settings."""
+    return {
+        'draw_date': date(config.DRAW_YEAR, config.DRAW_MONTH, config.DRAW_DAY),
+        'gift_deadline': date(config.DRAW_YEAR, config.GIFT_DEADLINE_MONTH, config.GIFT_DEADLINE_DAY),
+        'reveal_date': date(config.REVEAL_YEAR, config.REVEAL_MONTH, config.REVEAL_DAY),
+        'gift_budget': config.GIFT_BUDGET,
+        'no_repeat_years': config.DRAW_NO_REPEAT_YEARS,
+        'separate_teams': config.DRAW_SEPARATE_TEAMS,
+    }
+
+
+def format_day(day):
+    """Дата так, как её пишет бот: 15.12.2025."""
+    return f"{day.day}.{day.month}.{day.year}"
+
+
+def format_value(key, value):
+    """Значение настройки для показа в админке."""
+    kind = FIELDS[key][1]
+    if kind == 'date':
+        return format_day(value)
+    if kind == 'flag':
+        return 'да' if value else 'нет'
+    return str(value)
+
+
+def parse_value(key, text):
+    """
+    Значение настройки из ввода администратора: даты — ДД.ММ.ГГГГ,
+    числа — целые от 0, флаги — да/нет, бюджет — непустой текст.
+    ValueError с понятным сообщением при ошибке.
+    """
+    if key not in FIELDS:
+        raise ValueError(f"Неизвестная настройка: {key}")
+    text = (text or '').strip()
+    kind = FIELDS[key][1]
+    if kind == 'date':
+        try:
+            return datetime.strptime(text, '%d.%m.%Y').date()
+        except ValueError:
+            raise ValueError("Дата должна быть в формате ДД.ММ.ГГГГ, например 15.12.2025") from None
+    if kind == 'number':
+        if not text.isdigit():
+            raise ValueError("Нужно целое число от 0")
+        return int(text)
+    if kind == 'flag':
+        if text.lower() not in FLAG_WORDS:
+            raise ValueError("Ответьте «да» или «нет»")
+        return FLAG_WORDS[text.lower()]
+    if not text:
+        raise ValueError("Значение не может быть пустым")
+    return text
+
+
+def _load_value(key, raw):
+    """Значение из game_settings (даты — ISO: 2025-12-15, флаги — 1/0)."""
+    kind = FIELDS[key][1]
+    if kind == 'date':
+        return date.fromisoformat(raw)
+    if kind == 'number':
+        return int(raw)
+    if kind == 'flag':
+        return raw == '1'
+    return raw
+
+
+def _dump_value(key, value):
+    kind = FIELDS[key][1]
+    if kind == 'date':
+        return value.isoformat()
+    if kind == 'flag':
+        return '1' if value else '0'
+    return str(value)
+
+
+class GameSettings:
+    """Снимок настроек игры. Не изменяется: новые значения — новый снимок."""
+
+    __slots__ = ('draw_date', 'gift_deadline', 'reveal_date', 'gift_budget',
+                 'no_repeat_years', 'separate_teams', 'version')
+
+    def __init__(self, values, version=0):
+        for key in FIELDS:
+            setattr(self, key, values[key])
+        self.version = version
+
+    @property
+    def year(self):
+        """Год игры — год жеребьёвки; по нему хранятся пары и карточки."""
+        return self.draw_date.year
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in FIELDS}
+
+    def replace(self, **values):
+        """Новый снимок с изменёнными значениями (проверяет порядок дат)."""
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные настройки: {', '.join(sorted(unknown))}")
+        merged = self.as_dict()
+        merged.update(values)
+        if not merged['draw_date'] <= merged['gift_deadline'] <= merged['reveal_date']:
+            raise ValueError("Даты должны идти по порядку: жеребьёвка ≤ дедлайн для подарков ≤ раскрытие")
+        return GameSettings(merged, self.version)
+
+    def __repr__(self):
+        fields = ', '.join(f"{key}={getattr(self, key)!r}" for key in FIELDS)
+        return f"GameSettings({fields}, version={self.version})"
+
+
+class SettingsStore:
+    """
+    Кэш настроек процесса с проверкой версии в БД.
+    Без подключённой БД (configure не вызывался) отдаёт значения из config.py.
+    """
+
+    def __init__(self, poll_interval=None, clock=time.monotonic):
+        if poll_interval is None:
+            poll_interval = float(os.getenv('SETTINGS_POLL_INTERVAL', '30'))
+        self.poll_interval = poll_interval
+        self._clock = clock
+        self._db = None
+        self._settings = GameSettings(default_values())
+        self._checked_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def configured(self):
+        return self._db is not None
+
+    def configure(self, db):
+        """Подключить хранилище к БД и прочитать сохранённые настройки."""
+        self._db = db
+        try:
+            self.reload()
+        except Exception as e:
+            # Работаем на значениях по умолчанию, при следующем обращении попробуем снова
+            self._checked_at = None
+            print(f"⚠️ Настройки игры не загружены, используются значения из config.py: {e}")
+
+    def current(self):
+        """Текущий снимок; раз в poll_interval секунд сверяет версию в БД."""
+        settings = self._settings
+        if self._db is None:
+            return settings
+        if self._checked_at is not None and self._clock() - self._checked_at < self.poll_interval:
+            return settings
+
+        # Версию сверяет один поток, остальные пока работают с прежним снимком
+        if not self._lock.acquire(blocking=False):
+            return settings
+        try:
+            self._checked_at = self._clock()
+            if self._db.get_settings_version() != settings.version:
+                self._load()
+        except Exception as e:
+            print(f"⚠️ Не удалось проверить версию настроек: {e}")
+        finally:
+            self._lock.release()
+        return self._settings
+
+    def reload(self):
+        """Перечитать настройки из БД прямо сейчас."""
+        with self._lock:
+            self._checked_at = self._clock()
+            self._load()
+        return self._settings
+
+    def update(self, **values):
+        """
+        Сохранить новые значения (уже разобранные: date или str) и увеличить
+        версию. Если изменилось то, что напечатано в карточках назначения,
+        карточки года перерисовываются в той же транзакции.
+        Возвращает новый снимок.
+        """
+        if self._db is None:
+            raise RuntimeError("Хранилище настроек не подключено к базе данных")
+
+        with self._lock:
+            old = self._settings
+            new = old.replace(**values)
+            try:
+                with self._db.unit_of_work():
+                    version = self._db.save_game_settings(
+                        {key: _dump_value(key, value) for key, value in values.items()}
+                    )
+                    # Карточки рендерятся по current() — он уже должен отдавать новые значения
+                    self._settings = GameSettings(new.as_dict(), version)
+                    if new.year != old.year or any(key in CARD_FIELDS for key in values):
+                        self._db.refresh_year_cards(new.year)
+            except BaseException:
+                self._settings = old
+                raise
+            self._checked_at = self._clock()
+        print(f"⚙️ Настройки игры обновлены (версия {version}): {', '.join(values)}")
+        return self._settings
+
+    def _load(self):
+        version, stored = self._db.get_game_settings()
+        values = default_values()
+        for key, raw in stored.items():
+            if key not in FIELDS:
+                continue
+            try:
+                values[key] = _load_value(key, raw)
+            except ValueError:
+                print(f"⚠️ Некорректное значение настройки {key}: {raw!r}, используется значение по умолчанию")
+        self._settings = GameSettings(values, version)
+        print(f"⚙️ Настройки игры загружены (версия {version})")
+
+
+store = SettingsStore()
+
+
+def configure(db):
+    """Подключить настройки процесса к базе данных (один раз при старте)."""
+    store.configure(db)
+
+
+def current():
+    """Текущие настройки игры (GameSettings)."""
+    return store.current()
+
+
+def update(**values):
+    """Изменить настройки игры; см. SettingsStore.update."""
+    return store.update(**values)
@@ -0,0 +1,65 @@
+"""
+Общие фикстуры тестов: чистая база SQLite во временной папке.
+Переменные PostgreSQL убираются, поэтому тесты всегда идут на SQLite.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import settings  # noqa: E402
+from database import Database  # noqa: E402
+
+POSTGRES_VARIABLES = ('DATABASE_URL', 'RAILWAY_DATABASE_URL', 'POSTGRESQL_URL',
+                      'PG_CONNECTION_STRING', 'NEON_DATABASE_URL', 'DB_HOST', 'RAILWAY_ENVIRONMENT')
+
+
+@pytest.fixture
+def make_db(tmp_path, monkeypatch):
+    """
+    Фабрика Database на новом secret_santa.db с применёнными миграциями
+    и своими настройками; env — переменные окружения (DB_SQLITE_PROFILE и т.п.).
+    """
+    for name in POSTGRES_VARIABLES:
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(settings, 'store', settings.SettingsStore())
+    databases = []
+
+    def make(**env):
+        for name, value in env.items():
+            monkeypatch.setenv(name, value)
+        database = Database()
+        database.init_db()
+        settings.configure(database)
+        databases.append(database)
+        return database
+
+    yield make
+    for database in databases:
+        database.close()
+
+
+@pytest.fixture
+def db(make_db):
+    return make_db()
+
+
+def add_players(db, count, start=1, team=None):
+    """Быстро добавить count активных игроков с user_id start..start+count-1."""
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.executemany(
+            'INSERT INTO players (user_id, username, full_name, wish_list, is_active, team) '
+            'VALUES (?, ?, ?, ?, 1, ?)',
+            [(user_id, f'user{user_id}', f'Игрок {user_id}', 'книга', team(user_id) if team else None)
+             for user_id in range(start, start + count)]
+        )
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return list(range(start, start + count))
@@ -0,0 +1,21 @@
+"""Карточки назначения: обновление при изменении игрока."""
+from tests.conftest import add_players
+
+
+def card_text(db, santa_id, year):
+    return db._query('get_card', (santa_id, year), fetchone=True)['message_text']
+
+
+def test_player_update_rerenders_only_current_year_cards(db):
+    add_players(db, 4)
+    assert db.perform_draw(2024)
+    assert db.perform_draw(2025)
+    pairs = {year: {row['receiver_user_id']: row['santa_user_id']
+                    for row in db._query('get_previous_pairs', (year, year + 1), fetchall=True)}
+             for year in (2024, 2025)}
+    old_card = card_text(db, pairs[2024][1], 2024)
+
+    db.update_wishlist(1, 'новые носки')
+
+    assert 'новые носки' in card_text(db, pairs[2025][1], 2025)
+    assert card_text(db, pairs[2024][1], 2024) == old_card
@@ -0,0 +1,88 @@
+"""Выход игрока из проведённой жеребьёвки: ремонт пар, удаление и деактивация."""
+import random
+
+import settings
+from tests.conftest import add_players
+
+
+def draw_pairs(db, year):
+    return {row['santa_user_id']: row['receiver_user_id']
+            for row in db._query('get_previous_pairs', (year, year + 1), fetchall=True)}
+
+
+def test_deactivate_returns_affected_santa(db):
+    year = settings.current().year
+    add_players(db, 6)
+    assert db.perform_draw(year)
+    santa = {receiver: santa for santa, receiver in draw_pairs(db, year).items()}[3]
+
+    # Обмен получателями или встраивание в чужую пару затрагивает ещё одного Санту
+    change = db.deactivate_player(3)
+    assert santa in change.affected and len(change.affected) <= 2
+    assert change.unassigned_santa is None and change.orphan_receiver is None
+
+    pairs = draw_pairs(db, year)
+    remaining = {1, 2, 4, 5, 6}
+    assert set(pairs) == remaining and set(pairs.values()) == remaining
+    assert not db.get_player(3).is_active
+
+
+def test_delete_without_valid_repair_still_removes_player(db):
+    year = settings.current().year
+    add_players(db, 3)
+    assert db.perform_draw(year)
+    pairs = draw_pairs(db, year)
+    santa, receiver = {r: s for s, r in pairs.items()}[2], pairs[2]
+    # Санте нельзя дарить подопечному выбывшего, а обмениваться не с кем
+    db.add_draw_exclusion(santa, receiver)
+
+    change = db.delete_player(2)
+    assert change.affected == []
+    assert (change.unassigned_santa, change.orphan_receiver) == (santa, receiver)
+
+    assert db.get_player(2) is None
+    assert draw_pairs(db, year) == {receiver: santa}
+    assert db.get_assignment_card(santa, year) is None
+
+
+def test_deactivate_without_valid_repair_still_deactivates(db):
+    year = settings.current().year
+    add_players(db, 3)
+    assert db.perform_draw(year)
+    pairs = draw_pairs(db, year)
+    santa, receiver = {r: s for s, r in pairs.items()}[2], pairs[2]
+    db.add_draw_exclusion(santa, receiver)
+
+    change = db.deactivate_player(2)
+    assert change.affected == []
+    assert (change.unassigned_santa, change.orphan_receiver) == (santa, receiver)
+
+    assert not db.get_player(2).is_active
+    assert draw_pairs(db, year) == {receiver: santa}
+
+
+def test_dropout_from_two_player_draw_reports_unassigned(db):
+    year = settings.current().year
+    add_players(db, 2)
+    assert db.perform_draw(year)
+
+    change = db.deactivate_player(2)
+
+    # Встроить игрока 1 некуда: он и без подопечного, и без Санты
+    assert change.affected == []
+    assert (change.unassigned_santa, change.orphan_receiver) == (1, 1)
+    assert draw_pairs(db, year) == {}
+
+
+def test_swap_candidates_are_uniform_over_sparse_ids(db):
+    year = settings.current().year
+    # Два кластера id с огромным пропуском между ними, как у id Telegram
+    low = add_players(db, 100, start=1)
+    add_players(db, 100, start=10 ** 12)
+    assert db.perform_draw(year)
+
+    firsts = [next(db._sample_draw_pairs(year, random.Random(seed)))['santa_user_id'] for seed in range(400)]
+
+    share_low = sum(santa in low for santa in firsts) / len(firsts)
+    assert 0.35 < share_low < 0.65
+    assert len(set(firsts)) > 150
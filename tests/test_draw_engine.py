@@ -0,0 +1,100 @@
+"""Движок жеребьёвки: допустимость, ограничения, равномерность."""
+import math
+import random
+
+import pytest
+
+import draw_engine
+from draw_engine import Constraints, DrawConstraintError, DrawError
+
+STRATEGIES = sorted(draw_engine.STRATEGIES)
+
+
+def constrained(n, seed, team_size=3):
+    """Команды по team_size человек и пары-исключения между соседними командами."""
+    rng = random.Random(seed)
+    constraints = Constraints()
+    for player in range(n):
+        constraints.set_team(player, player // team_size + 1)
+    for player in range(0, n - team_size, 2 * team_size):
+        constraints.forbid_mutual(player, player + team_size)
+    for _ in range(n // 4):
+        constraints.forbid(rng.randrange(n), rng.randrange(n))
+    return constraints
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_no_fixed_points(strategy):
+    for n in range(2, 60):
+        participants = list(range(100, 100 + n))
+        for seed in range(20):
+            assignment = draw_engine.draw(participants, strategy, seed)
+            assert all(santa != receiver for santa, receiver in assignment.items())
+            assert draw_engine.is_valid_assignment(participants, assignment)
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_valid_under_exclusions_and_teams(strategy):
+    for seed in range(300):
+        n = random.Random(seed).randint(8, 40)
+        participants = list(range(n))
+        constraints = constrained(n, seed)
+        assignment = draw_engine.draw(participants, strategy, seed, constraints)
+        assert draw_engine.is_valid_assignment(participants, assignment, constraints)
+
+
+def test_is_valid_assignment_rejects_broken_draws():
+    participants = [1, 2, 3, 4]
+    constraints = Constraints()
+    constraints.forbid_mutual(1, 2)
+    constraints.set_team(3, 'A')
+    constraints.set_team(4, 'A')
+
+    assert draw_engine.is_valid_assignment(participants, {1: 3, 3: 2, 2: 4, 4: 1}, constraints)
+    assert not draw_engine.is_valid_assignment(participants, {1: 2, 2: 3, 3: 4, 4: 1}, constraints)  # исключение
+    assert not draw_engine.is_valid_assignment(participants, {1: 4, 4: 3, 3: 2, 2: 1}, constraints)  # команда
+    assert not draw_engine.is_valid_assignment(participants, {1: 1, 2: 3, 3: 4, 4: 2})  # сам себе
+    assert not draw_engine.is_valid_assignment(participants, {1: 2, 2: 3, 3: 2, 4: 1})  # двое дарят одному
+    assert not draw_engine.is_valid_assignment(participants, {1: 2, 2: 3, 3: 1})  # кто-то без пары
+
+
+def test_cycle_strategy_builds_one_ring():
+    for n in (2, 3, 10, 1000):
+        for seed in range(10):
+            assert draw_engine.count_cycles(draw_engine.draw(list(range(n)), 'cycle', seed)) == 1
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_same_seed_same_draw(strategy):
+    participants = list(range(500))
+    constraints = constrained(500, 7)
+    assert (draw_engine.draw(participants, strategy, 7, constraints)
+            == draw_engine.draw(participants, strategy, 7, constraints))
+
+
+@pytest.mark.parametrize('strategy,n,outcomes', [
+    ('cycle', 4, 6), ('cycle', 5, 24),              # (n-1)! кругов
+    ('derangement', 4, 9), ('derangement', 5, 44),  # D(n) беспорядков
+])
+def test_uniformity(strategy, n, outcomes):
+    seen, chi_square = draw_engine.uniformity(strategy, n, samples=30_000, seed=2025)
+    df = outcomes - 1
+    assert seen == outcomes
+    # Среднее χ² равно df, отклонение ~ √(2·df): 5σ — заведомо не случайность
+    assert chi_square < df + 5 * math.sqrt(2 * df)
+
+
+@pytest.mark.parametrize('strategy', STRATEGIES)
+def test_infeasible_constraints_raise(strategy):
+    constraints = Constraints()
+    for player in (1, 2, 3):
+        constraints.set_team(player, 'A')  # трое из четырёх — в одной команде
+    with pytest.raises(DrawConstraintError) as error:
+        draw_engine.draw([1, 2, 3, 4], strategy, 1, constraints)
+    assert error.value.players
+
+
+@pytest.mark.parametrize('participants', [[], [1], [1, 2, 2]])
+def test_too_few_or_repeated_participants(participants):
+    with pytest.raises(DrawError):
+        draw_engine.draw(participants, 'derangement', 1)
@@ -0,0 +1,46 @@
+"""Жеребьёвка под блокировкой: параллельные вызовы получают один результат."""
+import threading
+
+import pytest
+
+from tests.conftest import add_players
+
+
+def draw_in_threads(db, year, nested, threads=2):
+    """perform_draw из нескольких потоков одновременно; nested — внутри единицы работы обработчика."""
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def run(slot):
+        try:
+            if nested:
+                # Как обработчик под with_unit_of_work: сначала чтение, потом жеребьёвка
+                with db.unit_of_work():
+                    db.get_player(1)
+                    barrier.wait()
+                    results[slot] = db.perform_draw(year, seed=slot)
+            else:
+                barrier.wait()
+                results[slot] = db.perform_draw(year, seed=slot)
+        finally:
+            db.release_thread_connections()
+
+    workers = [threading.Thread(target=run, args=(slot,)) for slot in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=30)
+    return results
+
+
+@pytest.mark.parametrize('profile', ['default', 'performance'])
+@pytest.mark.parametrize('nested', [False, True], ids=['top-level', 'nested-unit'])
+def test_concurrent_draws_run_once(make_db, profile, nested):
+    db = make_db(DB_SQLITE_PROFILE=profile)
+    add_players(db, 200)
+    for year in range(2025, 2035):
+        results = draw_in_threads(db, year, nested)
+        assert all(results), results
+        assert sum(bool(result.performed) for result in results) == 1
+        assert len({result.token for result in results}) == 1
+        assert db._query('count_pairs', (year,), fetchone=True)['count'] == 200
@@ -0,0 +1,32 @@
+"""Миграции: ADD COLUMN в SQLite при уже существующем столбце."""
+import migrations
+from migrations import LATEST_VERSION, apply_migrations
+from tests.conftest import add_players
+
+
+def columns(db, table):
+    return [row['name'] for row in db._execute_query(f'PRAGMA table_info({table})', fetchall=True)]
+
+
+def test_reapply_after_lost_schema_versions(db):
+    add_players(db, 4)
+    assert db.perform_draw(2025)
+    # Схема на месте, а записи о версиях с восьмой потеряны
+    db._execute_query('DELETE FROM schema_version WHERE version >= 8')
+
+    assert apply_migrations(db) == LATEST_VERSION
+
+    assert columns(db, 'players').count('team') == 1
+    assert db._query('count_pairs', (2025,), fetchone=True)['count'] == 4
+
+
+def test_column_added_by_hand_before_migration(make_db, monkeypatch):
+    # База на версии 2, в которую revealed_at добавили вручную
+    monkeypatch.setattr(migrations, 'MIGRATIONS', migrations.MIGRATIONS[:2])
+    monkeypatch.setattr(migrations, 'LATEST_VERSION', 2)
+    db = make_db()
+    db._execute_query('ALTER TABLE santa_pairs ADD COLUMN revealed_at TIMESTAMP')
+    monkeypatch.undo()
+
+    assert apply_migrations(db) == LATEST_VERSION
+    assert columns(db, 'santa_pairs').count('revealed_at') == 1
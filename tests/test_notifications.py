@@ -0,0 +1,108 @@
+"""Рассылка после жеребьёвки: страницы, отметки и свободное подключение во время отправок."""
+import threading
+
+import pytest
+
+import settings
+import utils
+from tests.conftest import add_players
+
+
+class FakeBot:
+    def __init__(self, fail_for=()):
+        self.sent = []
+        self.fail_for = set(fail_for)
+
+    def send_message(self, chat_id, text, **kwargs):
+        if chat_id in self.fail_for:
+            raise RuntimeError("Telegram недоступен")
+        self.sent.append(chat_id)
+
+
+def unnotified(db, year):
+    return db.get_unnotified_cards(year, 0, 1000)
+
+
+def test_notify_returns_count_and_marks_everyone(db, monkeypatch):
+    monkeypatch.setattr(utils, 'NOTIFY_MARK_BATCH', 4)
+    monkeypatch.setattr(utils.time, 'sleep', lambda seconds: None)
+    year = settings.current().year
+    add_players(db, 10)
+    assert db.perform_draw(year)
+    bot = FakeBot(fail_for={3})
+
+    assert utils.notify_players_after_draw(bot, db) == 9
+
+    assert sorted(bot.sent) == [user_id for user_id in range(1, 11) if user_id != 3]
+    assert [card.santa_user_id for card in unnotified(db, year)] == [3]
+    assert utils.notify_players_after_draw(FakeBot(), db) == 1
+    assert utils.notify_players_after_draw(FakeBot(), db) == 0
+
+
+@pytest.mark.parametrize('profile', ['default', 'performance'])
+def test_other_threads_write_while_notify_sleeps(make_db, monkeypatch, profile):
+    db = make_db(DB_SQLITE_PROFILE=profile, DB_POOL_TIMEOUT='2')
+    monkeypatch.setattr(utils, 'NOTIFY_MARK_BATCH', 2)
+    year = settings.current().year
+    add_players(db, 5)
+    assert db.perform_draw(year)
+    written = []
+
+    def other_writer(user_id):
+        with db.unit_of_work():
+            db._run('UPDATE players SET wish_list = ? WHERE user_id = ?', ('носки', user_id))
+        written.append(user_id)
+
+    def sleep(seconds):
+        # Пауза между отправками: регистрация или /wish другого игрока не должна ждать рассылку
+        thread = threading.Thread(target=other_writer, args=(len(written) + 1,))
+        thread.start()
+        thread.join(timeout=5)
+
+    monkeypatch.setattr(utils.time, 'sleep', sleep)
+    # Как admin_confirm_draw: рассылка внутри единицы работы обработчика
+    with db.unit_of_work():
+        db.get_player(1)
+        assert utils.notify_players_after_draw(FakeBot(), db) == 5
+
+    assert written == [1, 2, 3, 4, 5]
+    assert unnotified(db, year) == []
+
+
+def test_notify_draw_changes_returns_sent_count(db):
+    year = settings.current().year
+    add_players(db, 6)
+    assert db.perform_draw(year)
+    affected = db.deactivate_player(3).affected
+    bot = FakeBot()
+
+    assert utils.notify_draw_changes(bot, db, affected, year) == len(affected) > 0
+    assert bot.sent == affected
+
+
+def test_other_threads_write_while_draw_changes_are_sent(make_db):
+    db = make_db(DB_SQLITE_PROFILE='performance', DB_POOL_TIMEOUT='2')
+    year = settings.current().year
+    add_players(db, 6)
+    assert db.perform_draw(year)
+    written = []
+
+    def other_writer():
+        with db.unit_of_work():
+            db._run('UPDATE players SET wish_list = ? WHERE user_id = ?', ('носки', 1))
+        written.append(True)
+
+    class SlowBot(FakeBot):
+        def send_message(self, chat_id, text, **kwargs):
+            thread = threading.Thread(target=other_writer)
+            thread.start()
+            thread.join(timeout=5)
+            super().send_message(chat_id, text, **kwargs)
+
+    # Ремонт пар и рассылка в одной единице работы: рассылка сама фиксирует
+    # изменения и отдаёт писателя перед каждой отправкой
+    with db.unit_of_work():
+        affected = db.deactivate_player(3).affected
+        assert utils.notify_draw_changes(SlowBot(), db, affected, year) == len(affected)
+
+    assert written == [True] * len(affected)
@@ -0,0 +1,30 @@
+"""Горячие запросы идут по индексам (EXPLAIN QUERY PLAN на SQLite)."""
+import pytest
+
+from tests.conftest import add_players
+
+
+@pytest.fixture
+def plans(db):
+    add_players(db, 50)
+    assert db.perform_draw(2025)
+    return db.check_query_plans()
+
+
+def test_every_hot_query_uses_an_index(db, plans):
+    assert set(plans) == set(db.HOT_QUERY_PLANS)
+    full_scans = {name: plan for name, (uses_index, plan) in plans.items() if not uses_index}
+    assert full_scans == {}
+
+
+@pytest.mark.parametrize('name, index', [
+    ('get_player', 'sqlite_autoindex_players_1'),
+    ('get_player_by_name', 'idx_players_full_name'),
+    ('get_all_active_players', 'idx_players_active_full_name'),
+    ('get_player_dashboard', 'sqlite_autoindex_players_1'),
+    ('get_pair_index', 'idx_santa_pairs_year_santa'),
+])
+def test_query_uses_expected_index(plans, name, index):
+    uses_index, plan = plans[name]
+    assert uses_index
+    assert f'USING INDEX {index}' in plan or f'USING COVERING INDEX {index}' in plan
@@ -0,0 +1,73 @@
+"""Единица работы: ошибка запроса во вложенном блоке откатывает только этот блок."""
+import threading
+
+import pytest
+
+from tests.conftest import add_players
+
+
+def names(db):
+    return {player.user_id: player.full_name for player in db.iter_active_players()}
+
+
+def test_failed_statement_in_nested_unit_keeps_outer_changes(db):
+    add_players(db, 3)
+
+    with db.unit_of_work():
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Первый', 1))
+        with pytest.raises(Exception):
+            with db.unit_of_work():
+                db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Откатится', 2))
+                # Нарушение уникальности user_id
+                db._run("INSERT INTO players (user_id, username, full_name) VALUES (3, 'x', 'x')")
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Третий', 3))
+
+    assert names(db) == {1: 'Первый', 2: 'Игрок 2', 3: 'Третий'}
+
+
+def test_failed_batch_insert_in_nested_unit_keeps_outer_changes(db):
+    add_players(db, 2)
+
+    with db.unit_of_work():
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Первый', 1))
+        with pytest.raises(Exception):
+            with db.unit_of_work():
+                db._insert_many('insert_pairs', [(1, 2, 2025), (2, 2, 2025)])
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Второй', 2))
+
+    assert names(db) == {1: 'Первый', 2: 'Второй'}
+    assert db._query('count_pairs', (2025,), fetchone=True)['count'] == 0
+
+
+def test_failed_statement_rolls_back_whole_top_level_unit(db):
+    add_players(db, 2)
+
+    with pytest.raises(Exception):
+        with db.unit_of_work():
+            db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Первый', 1))
+            db._run("INSERT INTO players (user_id, username, full_name) VALUES (2, 'x', 'x')")
+
+    assert names(db) == {1: 'Игрок 1', 2: 'Игрок 2'}
+
+
+def test_checkpoint_with_release_lets_other_threads_write(make_db):
+    db = make_db(DB_SQLITE_PROFILE='performance', DB_POOL_TIMEOUT='2')
+    add_players(db, 2)
+    written = []
+
+    def other_writer():
+        with db.unit_of_work():
+            db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Из потока', 2))
+        written.append(True)
+
+    with db.unit_of_work():
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Первый', 1))
+        # Как send_message в обработчике: фиксируем и отдаём писателя до сетевого вызова
+        db.checkpoint(release=True)
+        thread = threading.Thread(target=other_writer)
+        thread.start()
+        thread.join(timeout=5)
+        assert written == [True]
+        db._run('UPDATE players SET full_name = ? WHERE user_id = ?', ('Снова первый', 1))
+
+    assert names(db) == {1: 'Снова первый', 2: 'Из потока'}
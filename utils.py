@@ -2,53 +2,47 @@ from datetime import date, datetime
 import time
 import threading
 from database import Database
-import config
+from cards import render_assignment_card, render_reminder
+from draw_engine import DrawConstraintError
+import settings
+from settings import format_day
 
-# Добавьте константы для раскрытия
-REVEAL_YEAR = 2025
-REVEAL_MONTH = 12
-REVEAL_DAY = 31
+# Страница рассылки: сколько пар читать одним запросом и отмечать одним UPDATE
+NOTIFY_MARK_BATCH = 100
 
 def safe_get_player_field(player, field_name, default_value=''):
-    """Безопасное получение поля игрока из dict или tuple"""
+    """Безопасное получение поля игрока (records.Player)"""
     if not player:
         return default_value
-    
-    if isinstance(player, dict):
-        return player.get(field_name, default_value)
-    else:
-        # Маппинг полей на индексы для tuple (старая SQLite версия)
-        field_map = {
-            'id': 0,
-            'user_id': 1,
-            'username': 2,
-            'full_name': 3,
-            'telegram_name': 4,
-            'wish_list': 5,
-            'registration_date': 6,
-            'is_active': 7
-        }
-        idx = field_map.get(field_name)
-        if idx is not None and len(player) > idx:
-            value = player[idx]
-            return value if value is not None else default_value
-        return default_value
+    value = getattr(player, field_name, None)
+    return value if value is not None else default_value
 
 
-def check_draw_date(bot_instance):
-    db = Database()
+def check_draw_date(bot_instance, db=None):
+    if db is None:
+        db = Database()
+    if not settings.store.configured:
+        settings.configure(db)
 
     while True:
+        # Даты перечитываются каждый день: их можно изменить из админки без перезапуска
+        game = settings.current()
         today = date.today()
-        draw_date = date(config.DRAW_YEAR, config.DRAW_MONTH, config.DRAW_DAY)
-        reveal_date = date(REVEAL_YEAR, REVEAL_MONTH, REVEAL_DAY)
+        draw_date = game.draw_date
+        reveal_date = game.reveal_date
 
         if today == draw_date:
             print("🎄 Наступила дата жеребьёвки!")
 
             # ИСПРАВЛЕНО: убран параметр bot
-            if db.perform_draw(config.DRAW_YEAR):
-                notify_players_after_draw(bot_instance, db)
+            try:
+                # Если админ или другая реплика уже провели жеребьёвку, рассылку не повторяем
+                drawn = db.perform_draw(game.year)
+                if drawn and drawn.performed:
+                    notify_players_after_draw(bot_instance, db)
+            except DrawConstraintError as e:
+                # Правила невыполнимы — жеребьёвку проведёт админ, ослабив их
+                print(f"❌ Автоматическая жеребьёвка не проведена: {e}")
 
             time.sleep(86400)
 
@@ -73,64 +67,105 @@ def check_draw_date(bot_instance):
 
 
 def notify_players_after_draw(bot_instance, db):
-    """Уведомление игроков после жеребьёвки"""
+    """
+    Уведомление игроков после жеребьёвки. Возвращает число уведомленных.
+
+    Пары читаются страницами по NOTIFY_MARK_BATCH (по ключу santa_user_id,
+    вместе с именами, пожеланиями и готовым текстом карточки). Перед
+    отправками страницы транзакция фиксируется и подключение уходит в пул,
+    а отправленные отмечаются после неё: пока бот ждёт Telegram и паузы
+    между сообщениями, подключение (и писатель SQLite) свободно.
+    """
+    notified_count = 0
     try:
         print("📨 Уведомление игроков после жеребьёвки...")
-        pairs = db.get_unnotified_pairs(config.DRAW_YEAR)
+        pairs_count = 0
+        sent_ids = []
+        
+        year = settings.current().year
+        after = 0
+        try:
+            while True:
+                cards = db.get_unnotified_cards(year, after, NOTIFY_MARK_BATCH)
+                if not cards:
+                    break
+                db.checkpoint(release=True)
+                for card in cards:
+                    pairs_count += 1
+                    santa_id = card.santa_user_id
+                    try:
+                        message = card.message_text or render_assignment_card(
+                            card.santa_name, card.receiver_name, card.wish_list
+                        )
+                        
+                        bot_instance.send_message(santa_id, message, parse_mode='Markdown')
+                        sent_ids.append(santa_id)
+                        notified_count += 1
+                        
+                        print(f"📤 Уведомлен {card.santa_name} → {card.receiver_name}")
+                        time.sleep(0.5)  # Пауза между отправками
+                        
+                    except Exception as e:
+                        print(f"❌ Ошибка при уведомлении пользователя {santa_id}: {e}")
+                _mark_notified(db, sent_ids, year)
+                # Неотправленные остаются позади ключа и не зацикливают рассылку
+                after = cards[-1].santa_user_id
+        finally:
+            # Отправленные сообщения отмечаем и при ошибке посреди рассылки
+            _mark_notified(db, sent_ids, year)
         
-        if not pairs:
+        if not pairs_count:
             print("ℹ️ Нет неуведомленных пар")
-            return
+            return 0
         
-        notified_count = 0
+        print(f"✅ Уведомлено {notified_count} игроков")
+        return notified_count
         
-        for santa_id, receiver_name in pairs:
-            try:
-                player = db.get_player(santa_id)
-                # ИСПРАВЛЕНО: используем безопасный метод вместо player[3]
-                santa_name = safe_get_player_field(player, 'full_name', "Тайный Санта")
-                username = safe_get_player_field(player, 'username', '')
-                
-                # Получаем информацию о получателе
-                receiver_player = db.get_player_by_name(receiver_name)
-                wish_list = safe_get_player_field(receiver_player, 'wish_list', "")
-                
-                # Формируем сообщение
-                message = f"""
-🎅 *Дорогой {santa_name}!*
-
-Жеребьёвка проведена!
-
-*Твой подопечный:* {receiver_name}
-
-🎁 *Информация о подопечном:*
-{f"📝 *Пожелания:* {wish_list}" if wish_list else "📝 *Пожелания не указаны*"}
-
-📅 *Напоминание о датах:*
-• Дедлайн для подарков: до {config.GIFT_DEADLINE_DAY}.{config.GIFT_DEADLINE_MONTH}.{config.DRAW_YEAR}
-• Раскрытие Сант: {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}
-
-💰 *Бюджет подарка:* {config.GIFT_BUDGET}
+    except Exception as e:
+        print(f"❌ Общая ошибка в notify_players_after_draw: {e}")
+        return notified_count
 
-*Совет:* Прояви креативность! Узнай предпочтения получателя через друзей.
 
-Удачи в подготовке сюрприза! 🎁
-"""
-                
-                bot_instance.send_message(santa_id, message, parse_mode='Markdown')
-                db.mark_as_notified(santa_id, config.DRAW_YEAR)
+def notify_draw_changes(bot_instance, db, santa_ids, year):
+    """
+    Отправить новое назначение только Сантам, чьи пары изменились
+    (игрок выбыл или добавлен после жеребьёвки). Возвращает число отправленных.
+    """
+    sent_ids = []
+    notified_count = 0
+    try:
+        for santa_id in santa_ids:
+            card = db.get_assignment_card(santa_id, year)
+            if card is None:
+                continue
+            # Карточка могла сохраниться при чтении — фиксируем до отправки
+            db.checkpoint(release=True)
+            try:
+                message = card.message_text or render_assignment_card(
+                    card.santa_name, card.receiver_name, card.wish_list
+                )
+                bot_instance.send_message(santa_id, "🔄 *В жеребьёвке изменения!*\n"
+                                                    "Твой подопечный изменился, вот новое назначение:\n"
+                                          + message, parse_mode='Markdown')
+                sent_ids.append(santa_id)
                 notified_count += 1
-                
-                print(f"📤 Уведомлен {santa_name} → {receiver_name}")
-                time.sleep(0.5)  # Пауза между отправками
-                
+                print(f"📤 Новое назначение: {card.santa_name} → {card.receiver_name}")
             except Exception as e:
                 print(f"❌ Ошибка при уведомлении пользователя {santa_id}: {e}")
-        
-        print(f"✅ Уведомлено {notified_count} игроков")
-        
-    except Exception as e:
-        print(f"❌ Общая ошибка в notify_players_after_draw: {e}")
+    finally:
+        # _mark_notified очищает sent_ids, поэтому считаем отдельно
+        _mark_notified(db, sent_ids, year)
+    return notified_count
+
+
+def _mark_notified(db, sent_ids, year):
+    """Отметить пачку отправленных уведомлений одним UPDATE и зафиксировать."""
+    if not sent_ids:
+        return
+    db.mark_many_as_notified(sent_ids, year)
+    # Фиксируем и отдаём подключение: дальше снова отправки в Telegram
+    db.checkpoint(release=True)
+    sent_ids.clear()
 
 
 def reveal_all_santas(bot_instance, db):
@@ -138,29 +173,27 @@ def reveal_all_santas(bot_instance, db):
     try:
         print("🔄 Начинаю автоматическое раскрытие всех Сант...")
 
-        # Раскрываем все пары
-        revealed_count = db.reveal_all_pairs(REVEAL_YEAR, by_admin=False)
+        game = settings.current()
+        # Раскрываем все пары и сразу получаем, кого уведомлять
+        revealed = db.reveal_all_pairs(game.year, by_admin=False)
 
-        if revealed_count == 0:
+        if not revealed:
             print("ℹ️ Нет пар для раскрытия или они уже раскрыты")
             return
 
-        print(f"✅ Раскрыто {revealed_count} пар")
+        print(f"✅ Раскрыто {len(revealed)} пар")
 
-        # Уведомляем всех игроков
-        players = db.get_all_active_players()
+        # Уведомляем получателей раскрытых пар
         notified_count = 0
 
-        for user_id, full_name, username in players:
+        for pair in revealed:
+            user_id, santa_name, full_name = pair.receiver_user_id, pair.santa_name, pair.receiver_name
             try:
-                # Получаем имя Санты для этого игрока
-                santa_name = db.get_receiver_pair(user_id, REVEAL_YEAR)
-
                 if santa_name:
                     message = f"""
 🎉 *Внимание! Тайна раскрыта!*
 
-Сегодня {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR} - день раскрытия Тайных Сант!
+Сегодня {format_day(game.reveal_date)} - день раскрытия Тайных Сант!
 
 Твоим Тайным Сантой был: *{santa_name}*
 
@@ -187,38 +220,15 @@ def notify_all_players(bot_instance, db, year=2025):
 def notify_single_player(bot_instance, user_id, db, year=2025):
     """Отправить уведомление конкретному игроку."""
     try:
-        # Проверяем, есть ли пара
-        receiver_name = db.get_santa_pair(user_id, year)
+        # Вся информация о паре — в карточке назначения
+        card = db.get_assignment_card(user_id, year)
         
-        if not receiver_name:
+        if card is None:
             print(f"ℹ️ Для игрока {user_id} нет получателя")
             return False
         
-        # Получаем информацию об игроке
-        player = db.get_player(user_id)
-        santa_name = safe_get_player_field(player, 'full_name', "Тайный Санта")
-        
-        # Получаем информацию о получателе
-        receiver_player = db.get_player_by_name(receiver_name)
-        wishlist = safe_get_player_field(receiver_player, 'wish_list', '')
-        
-        # Формируем сообщение
-        message = f"""
-🎅 *Дорогой {santa_name}!*
-
-Напоминаю, твой подопечный в игре "Тайный Санта":
-
-*Имя:* {receiver_name}
-{f"*Пожелания:* {wishlist}" if wishlist else "*Пожелания:* не указаны"}
-
-📅 *Дедлайн для подарка:* до {config.GIFT_DEADLINE_DAY}.{config.GIFT_DEADLINE_MONTH}.{config.DRAW_YEAR}
-🎁 *Бюджет:* {config.GIFT_BUDGET}
-
-Подготовь креативный подарок! 🎄
-"""
-        
-        bot_instance.send_message(user_id, message, parse_mode='Markdown')
-        print(f"📤 Персональное уведомление отправлено {santa_name} → {receiver_name}")
+        bot_instance.send_message(user_id, render_reminder(card), parse_mode='Markdown')
+        print(f"📤 Персональное уведомление отправлено {card.santa_name} → {card.receiver_name}")
         
         return True
         
@@ -227,10 +237,11 @@ def notify_single_player(bot_instance, user_id, db, year=2025):
         return False
 
 
-def start_background_check(bot_instance):
-    """Запуск фоновой проверки даты"""
-    thread = threading.Thread(target=check_draw_date, args=(bot_instance,), daemon=True)
+def start_background_check(bot_instance, db=None):
+    """Запуск фоновой проверки даты (лучше передавать уже созданный db)"""
+    thread = threading.Thread(target=check_draw_date, args=(bot_instance, db), daemon=True)
     thread.start()
     print("✅ Фоновая проверка даты запущена")
-    print(f"📅 Дата жеребьёвки: {config.DRAW_DAY}.{config.DRAW_MONTH}.{config.DRAW_YEAR}")
-    print(f"📅 Дата раскрытия Сант: {REVEAL_DAY}.{REVEAL_MONTH}.{REVEAL_YEAR}")
+    game = settings.current()
+    print(f"📅 Дата жеребьёвки: {format_day(game.draw_date)}")
+    print(f"📅 Дата раскрытия Сант: {format_day(game.reveal_date)}")